@@ -26,6 +26,7 @@ CREATE TABLE IF NOT EXISTS generated_documents (
     template_id TEXT NOT NULL,
     template_name TEXT NOT NULL,
     context_json TEXT NOT NULL,
+    file_id TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -35,6 +36,7 @@ CREATE TABLE IF NOT EXISTS user_templates (
     template_name TEXT NOT NULL,
     filename TEXT NOT NULL,
     fields_json TEXT NOT NULL,
+    content_hash TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -53,16 +55,95 @@ CREATE TABLE IF NOT EXISTS user_requisites (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Content-addressed template files; referenced by user_templates.content_hash
+CREATE TABLE IF NOT EXISTS template_blobs (
+    content_hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Requisites extracted from company cards, by file content
+CREATE TABLE IF NOT EXISTS requisite_cache (
+    content_hash TEXT PRIMARY KEY,
+    requisites_json TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Telegram file_unique_id -> content hash, so known files skip the download
+CREATE TABLE IF NOT EXISTS requisite_cache_files (
+    file_unique_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL
+);
+
+-- Responses of deterministic LLM prompts (target queries, genitive case)
+CREATE TABLE IF NOT EXISTS llm_cache (
+    cache_key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    response TEXT NOT NULL,
+    latency REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Genitive forms of business types learned from the LLM
+CREATE TABLE IF NOT EXISTS genitive_overrides (
+    phrase TEXT PRIMARY KEY,
+    genitive TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- LLM calls aggregated per flush interval by user, method, model and outcome
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    method TEXT NOT NULL,
+    model TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    calls INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    latency_sum REAL NOT NULL,
+    latency_hist TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage(created_at);
+CREATE INDEX IF NOT EXISTS idx_requisite_cache_used ON requisite_cache(last_used_at);
 CREATE INDEX IF NOT EXISTS idx_conversation_user ON conversation_history(user_id);
 CREATE INDEX IF NOT EXISTS idx_documents_user ON generated_documents(user_id);
 """
 
+# Indexes on migrated columns; run after MIGRATIONS so the columns exist
+POST_MIGRATION_SQL = """
+CREATE INDEX IF NOT EXISTS idx_user_templates_hash ON user_templates(content_hash);
+"""
+
+# Columns added after the initial schema: (table, column, declaration).
+# CREATE TABLE IF NOT EXISTS does not touch existing tables, so these are
+# applied to older databases on startup.
+MIGRATIONS: list[tuple[str, str, str]] = [
+    ("generated_documents", "file_id", "TEXT"),
+    ("user_templates", "content_hash", "TEXT"),
+]
+
 
 async def init_db():
     async with aiosqlite.connect(settings.db_path) as db:
         await db.executescript(SCHEMA_SQL)
+        await _apply_migrations(db)
+        await db.executescript(POST_MIGRATION_SQL)
         await db.commit()
 
 
+async def _apply_migrations(db: aiosqlite.Connection) -> None:
+    for table, column, declaration in MIGRATIONS:
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in await cursor.fetchall()}
+        if column not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
 async def get_connection() -> aiosqlite.Connection:
     return await aiosqlite.connect(settings.db_path)
@@ -9,13 +9,20 @@ async def save_document(
     template_id: str,
     template_name: str,
     context: dict,
+    file_id: str | None = None,
 ) -> int:
     cursor = await db.execute(
         """
-        INSERT INTO generated_documents (user_id, template_id, template_name, context_json)
-        VALUES (?, ?, ?, ?)
+        INSERT INTO generated_documents (user_id, template_id, template_name, context_json, file_id)
+        VALUES (?, ?, ?, ?, ?)
         """,
-        (user_id, template_id, template_name, json.dumps(context, ensure_ascii=False)),
+        (
+            user_id,
+            template_id,
+            template_name,
+            json.dumps(context, ensure_ascii=False),
+            file_id,
+        ),
     )
     await db.commit()
     return cursor.lastrowid
@@ -40,3 +47,37 @@ async def get_user_documents(
         {"id": row[0], "template_name": row[1], "created_at": row[2]}
         for row in rows
     ]
+
+
+async def get_document_by_id(
+    db: aiosqlite.Connection, document_id: int, user_id: int
+) -> dict | None:
+    cursor = await db.execute(
+        """
+        SELECT id, template_id, template_name, context_json, file_id
+        FROM generated_documents
+        WHERE id = ? AND user_id = ?
+        """,
+        (document_id, user_id),
+    )
+    row = await cursor.fetchone()
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "template_id": row[1],
+        "template_name": row[2],
+        "context": json.loads(row[3]),
+        "file_id": row[4],
+    }
+
+
+async def update_document_file_id(
+    db: aiosqlite.Connection, document_id: int, file_id: str
+) -> None:
+    """Remember the Telegram file_id of a (re)sent document."""
+    await db.execute(
+        "UPDATE generated_documents SET file_id = ? WHERE id = ?",
+        (file_id, document_id),
+    )
+    await db.commit()
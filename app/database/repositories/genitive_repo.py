@@ -0,0 +1,22 @@
+import aiosqlite
+
+
+async def get_genitive_overrides(db: aiosqlite.Connection) -> dict[str, str]:
+    cursor = await db.execute("SELECT phrase, genitive FROM genitive_overrides")
+    rows = await cursor.fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+async def save_genitive_override(
+    db: aiosqlite.Connection, phrase: str, genitive: str
+) -> None:
+    await db.execute(
+        """
+        INSERT INTO genitive_overrides (phrase, genitive) VALUES (?, ?)
+        ON CONFLICT(phrase) DO UPDATE SET
+          genitive = excluded.genitive,
+          created_at = CURRENT_TIMESTAMP
+        """,
+        (phrase, genitive),
+    )
+    await db.commit()
@@ -0,0 +1,83 @@
+import aiosqlite
+
+
+async def get_llm_cache(
+    db: aiosqlite.Connection, cache_key: str, ttl_seconds: int
+) -> tuple[str, float] | None:
+    """Cached (response, latency seconds) if present and fresh."""
+    cursor = await db.execute(
+        """
+        SELECT response, latency FROM llm_cache
+        WHERE cache_key = ? AND created_at >= datetime('now', ?)
+        """,
+        (cache_key, f"-{ttl_seconds} seconds"),
+    )
+    row = await cursor.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+async def get_llm_cache_many(
+    db: aiosqlite.Connection, cache_keys: list[str], ttl_seconds: int
+) -> dict[str, tuple[str, float]]:
+    """Fresh cached (response, latency) for each of cache_keys that has one."""
+    if not cache_keys:
+        return {}
+    placeholders = ", ".join("?" * len(cache_keys))
+    cursor = await db.execute(
+        f"""
+        SELECT cache_key, response, latency FROM llm_cache
+        WHERE cache_key IN ({placeholders}) AND created_at >= datetime('now', ?)
+        """,
+        (*cache_keys, f"-{ttl_seconds} seconds"),
+    )
+    return {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+
+
+async def save_llm_cache(
+    db: aiosqlite.Connection,
+    cache_key: str,
+    kind: str,
+    response: str,
+    latency: float,
+) -> None:
+    await db.execute(
+        """
+        INSERT INTO llm_cache (cache_key, kind, response, latency)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET
+          response = excluded.response,
+          latency = excluded.latency,
+          created_at = CURRENT_TIMESTAMP
+        """,
+        (cache_key, kind, response, latency),
+    )
+    await db.commit()
+
+
+async def save_llm_cache_many(
+    db: aiosqlite.Connection,
+    kind: str,
+    rows: list[tuple[str, str, float]],
+) -> None:
+    """Upsert (cache_key, response, latency) rows in one transaction."""
+    await db.executemany(
+        """
+        INSERT INTO llm_cache (cache_key, kind, response, latency)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET
+          response = excluded.response,
+          latency = excluded.latency,
+          created_at = CURRENT_TIMESTAMP
+        """,
+        [(key, kind, response, latency) for key, response, latency in rows],
+    )
+    await db.commit()
+
+
+async def delete_expired_llm_cache(db: aiosqlite.Connection, ttl_seconds: int) -> int:
+    cursor = await db.execute(
+        "DELETE FROM llm_cache WHERE created_at < datetime('now', ?)",
+        (f"-{ttl_seconds} seconds",),
+    )
+    await db.commit()
+    return cursor.rowcount
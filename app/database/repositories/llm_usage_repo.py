@@ -0,0 +1,46 @@
+import aiosqlite
+
+
+async def save_usage_rows(db: aiosqlite.Connection, rows: list[tuple]) -> None:
+    """Insert aggregated usage rows: (user_id, method, model, outcome, calls,
+    prompt_tokens, completion_tokens, cost, latency_sum, latency_hist)."""
+    await db.executemany(
+        """
+        INSERT INTO llm_usage (
+            user_id, method, model, outcome, calls, prompt_tokens,
+            completion_tokens, cost, latency_sum, latency_hist
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    await db.commit()
+
+
+USAGE_COLUMNS = (
+    "user_id", "method", "model", "outcome", "calls", "prompt_tokens",
+    "completion_tokens", "cost", "latency_sum", "latency_hist",
+)
+
+
+async def get_usage_since(db: aiosqlite.Connection, seconds: int) -> list[dict]:
+    cursor = await db.execute(
+        """
+        SELECT user_id, method, model, outcome, calls, prompt_tokens,
+               completion_tokens, cost, latency_sum, latency_hist
+        FROM llm_usage
+        WHERE created_at >= datetime('now', ?)
+        """,
+        (f"-{seconds} seconds",),
+    )
+    rows = await cursor.fetchall()
+    return [dict(zip(USAGE_COLUMNS, row)) for row in rows]
+
+
+async def delete_usage_before(db: aiosqlite.Connection, seconds: int) -> int:
+    cursor = await db.execute(
+        "DELETE FROM llm_usage WHERE created_at < datetime('now', ?)",
+        (f"-{seconds} seconds",),
+    )
+    await db.commit()
+    return cursor.rowcount
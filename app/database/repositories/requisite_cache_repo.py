@@ -0,0 +1,108 @@
+import json
+
+import aiosqlite
+
+
+async def get_cached_by_file_id(
+    db: aiosqlite.Connection, file_unique_id: str, ttl_seconds: int
+) -> dict | None:
+    """Cached requisites for a Telegram file, if still fresh."""
+    cursor = await db.execute(
+        """
+        SELECT c.content_hash, c.requisites_json FROM requisite_cache_files f
+        JOIN requisite_cache c ON c.content_hash = f.content_hash
+        WHERE f.file_unique_id = ? AND c.created_at >= datetime('now', ?)
+        """,
+        (file_unique_id, f"-{ttl_seconds} seconds"),
+    )
+    row = await cursor.fetchone()
+    if not row:
+        return None
+    await _touch(db, row[0])
+    return json.loads(row[1])
+
+
+async def get_cached_by_hash(
+    db: aiosqlite.Connection, content_hash: str, ttl_seconds: int
+) -> dict | None:
+    """Cached requisites for file content, if still fresh."""
+    cursor = await db.execute(
+        """
+        SELECT requisites_json FROM requisite_cache
+        WHERE content_hash = ? AND created_at >= datetime('now', ?)
+        """,
+        (content_hash, f"-{ttl_seconds} seconds"),
+    )
+    row = await cursor.fetchone()
+    if not row:
+        return None
+    await _touch(db, content_hash)
+    return json.loads(row[0])
+
+
+async def link_file_id(
+    db: aiosqlite.Connection, file_unique_id: str, content_hash: str
+) -> None:
+    await db.execute(
+        """
+        INSERT INTO requisite_cache_files (file_unique_id, content_hash)
+        VALUES (?, ?)
+        ON CONFLICT(file_unique_id) DO UPDATE SET content_hash = excluded.content_hash
+        """,
+        (file_unique_id, content_hash),
+    )
+    await db.commit()
+
+
+async def save_cached(
+    db: aiosqlite.Connection,
+    content_hash: str,
+    file_unique_id: str,
+    requisites: dict,
+) -> None:
+    await db.execute(
+        """
+        INSERT INTO requisite_cache (content_hash, requisites_json)
+        VALUES (?, ?)
+        ON CONFLICT(content_hash) DO UPDATE SET
+          requisites_json = excluded.requisites_json,
+          created_at = CURRENT_TIMESTAMP,
+          last_used_at = CURRENT_TIMESTAMP
+        """,
+        (content_hash, json.dumps(requisites, ensure_ascii=False)),
+    )
+    await link_file_id(db, file_unique_id, content_hash)
+
+
+async def prune_cache(
+    db: aiosqlite.Connection, ttl_seconds: int, max_entries: int
+) -> int:
+    """Drop expired entries and the least recently used beyond max_entries."""
+    cursor = await db.execute(
+        """
+        DELETE FROM requisite_cache
+        WHERE created_at < datetime('now', ?)
+           OR content_hash NOT IN (
+               SELECT content_hash FROM requisite_cache
+               ORDER BY last_used_at DESC LIMIT ?
+           )
+        """,
+        (f"-{ttl_seconds} seconds", max_entries),
+    )
+    removed = cursor.rowcount
+    await db.execute(
+        """
+        DELETE FROM requisite_cache_files
+        WHERE content_hash NOT IN (SELECT content_hash FROM requisite_cache)
+        """
+    )
+    await db.commit()
+    return removed
+
+
+async def _touch(db: aiosqlite.Connection, content_hash: str) -> None:
+    await db.execute(
+        "UPDATE requisite_cache SET last_used_at = CURRENT_TIMESTAMP WHERE content_hash = ?",
+        (content_hash,),
+    )
+    await db.commit()
@@ -0,0 +1,62 @@
+import aiosqlite
+
+
+async def register_blob(
+    db: aiosqlite.Connection, content_hash: str, size: int
+) -> None:
+    """Record a stored blob, or refresh last_used_at if it already exists."""
+    await db.execute(
+        """
+        INSERT INTO template_blobs (content_hash, size)
+        VALUES (?, ?)
+        ON CONFLICT(content_hash) DO UPDATE SET last_used_at = CURRENT_TIMESTAMP
+        """,
+        (content_hash, size),
+    )
+    await db.commit()
+
+
+async def touch_blob(db: aiosqlite.Connection, content_hash: str) -> None:
+    await db.execute(
+        "UPDATE template_blobs SET last_used_at = CURRENT_TIMESTAMP WHERE content_hash = ?",
+        (content_hash,),
+    )
+    await db.commit()
+
+
+async def get_orphan_blobs(
+    db: aiosqlite.Connection, grace_seconds: int, limit: int = 500
+) -> list[str]:
+    """Blobs no user template references and not used within the grace period."""
+    cursor = await db.execute(
+        """
+        SELECT b.content_hash FROM template_blobs b
+        WHERE b.last_used_at < datetime('now', ?)
+          AND NOT EXISTS (
+              SELECT 1 FROM user_templates t WHERE t.content_hash = b.content_hash
+          )
+        LIMIT ?
+        """,
+        (f"-{grace_seconds} seconds", limit),
+    )
+    rows = await cursor.fetchall()
+    return [row[0] for row in rows]
+
+
+async def delete_orphan_blob(
+    db: aiosqlite.Connection, content_hash: str, grace_seconds: int
+) -> bool:
+    """Delete a blob row if it is still unreferenced. Returns True if deleted."""
+    cursor = await db.execute(
+        """
+        DELETE FROM template_blobs
+        WHERE content_hash = ?
+          AND last_used_at < datetime('now', ?)
+          AND NOT EXISTS (
+              SELECT 1 FROM user_templates t WHERE t.content_hash = ?
+          )
+        """,
+        (content_hash, f"-{grace_seconds} seconds", content_hash),
+    )
+    await db.commit()
+    return cursor.rowcount > 0
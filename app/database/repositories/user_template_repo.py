@@ -9,13 +9,20 @@ async def save_user_template(
     template_name: str,
     filename: str,
     fields: list[dict],
+    content_hash: str | None = None,
 ) -> int:
     cursor = await db.execute(
         """
-        INSERT INTO user_templates (user_id, template_name, filename, fields_json)
-        VALUES (?, ?, ?, ?)
+        INSERT INTO user_templates (user_id, template_name, filename, fields_json, content_hash)
+        VALUES (?, ?, ?, ?, ?)
         """,
-        (user_id, template_name, filename, json.dumps(fields, ensure_ascii=False)),
+        (
+            user_id,
+            template_name,
+            filename,
+            json.dumps(fields, ensure_ascii=False),
+            content_hash,
+        ),
     )
     await db.commit()
     return cursor.lastrowid
@@ -51,7 +58,7 @@ async def get_user_template_by_id(
 ) -> dict | None:
     cursor = await db.execute(
         """
-        SELECT id, template_name, filename, fields_json
+        SELECT id, template_name, filename, fields_json, content_hash
         FROM user_templates
         WHERE id = ? AND user_id = ?
         """,
@@ -65,6 +72,7 @@ async def get_user_template_by_id(
         "template_name": row[1],
         "filename": row[2],
         "fields": json.loads(row[3]),
+        "content_hash": row[4],
     }
 
 
@@ -8,6 +8,7 @@ from app.database.repositories.whitelist_repo import (
     get_whitelist,
     remove_from_whitelist,
 )
+from app.services.openai_service import OpenAIService
 from config.settings import settings
 
 router = Router()
@@ -92,6 +93,91 @@ async def cmd_whitelist(message: Message, db: aiosqlite.Connection):
     await message.answer("Белый список:\n\n" + "\n".join(lines))
 
 
+@router.message(Command("cachestats"))
+async def cmd_cachestats(message: Message, openai_service: OpenAIService):
+    """Show LLM response cache hit rate, latency saved and coalesced
+    duplicate requests since startup."""
+    if not _is_admin(message.from_user.id):
+        return
+
+    stats = openai_service.cache.stats() if openai_service.cache else {}
+    flights = openai_service.single_flight.stats()
+    if not stats and not flights:
+        await message.answer("Кэш AI-ответов ещё не использовался.")
+        return
+
+    lines = []
+    for kind, s in stats.items():
+        lines.append(
+            f"• {kind}: попаданий {s['memory_hits']} (память) + {s['db_hits']} (БД), "
+            f"промахов {s['misses']}, обновлений {s['bypassed']}\n"
+            f"  hit rate {s['hit_rate']:.0%}, сэкономлено {s['saved_seconds']:.1f} с"
+        )
+    text = "Кэш AI-ответов:\n\n" + "\n".join(lines) if lines else ""
+
+    lines = [
+        f"• {kind}: запросов {s['calls']}, объединено дублей {s['duplicates']}"
+        for kind, s in flights.items()
+    ]
+    if lines:
+        text += ("\n\n" if text else "") + "Одновременные запросы:\n\n" + "\n".join(lines)
+    await message.answer(text)
+
+
+@router.message(Command("llmstats"))
+async def cmd_llmstats(message: Message, openai_service: OpenAIService):
+    """Show LLM client health: breaker, concurrency limit, retries and hedges."""
+    if not _is_admin(message.from_user.id):
+        return
+
+    stats = openai_service.llm.stats()
+    lines = [
+        f"Breaker: {stats['breaker']}, лимит {stats['limit']}, "
+        f"в работе {stats['in_flight']}"
+    ]
+    for method, s in stats["methods"].items():
+        p90 = f"{s['p90_latency']:.1f} с" if s["p90_latency"] is not None else "—"
+        lines.append(
+            f"• {method}: вызовов {s['calls']}, повторов {s['retries']}, "
+            f"отказов {s['rejected']}\n"
+            f"  хеджей {s['hedges']} (выиграли {s['hedge_wins']}), p90 {p90}"
+        )
+    await message.answer("AI-клиент:\n\n" + "\n".join(lines))
+
+
+@router.message(Command("llmusage"))
+async def cmd_llmusage(message: Message, openai_service: OpenAIService):
+    """Show LLM cost, tokens and latency by method and top users for the last hour and day."""
+    if not _is_admin(message.from_user.id):
+        return
+
+    usage = openai_service.llm.usage
+    if usage is None:
+        await message.answer("Учёт AI-запросов отключён.")
+        return
+
+    sections = []
+    for title, seconds in (("Последний час", 3600), ("Последние сутки", 86400)):
+        report = await usage.report(seconds)
+        totals = report["totals"]
+        lines = [
+            f"{title}: {totals['calls']} вызовов, ошибок {totals['errors']}, "
+            f"{totals['tokens']} токенов, ${totals['cost']:.4f}"
+        ]
+        for method, m in report["methods"].items():
+            latency = (
+                f"p50 {m['p50']:.1f} / p95 {m['p95']:.1f} / p99 {m['p99']:.1f} с"
+                if m["p50"] is not None else "нет успешных"
+            )
+            lines.append(f"• {method}: {m['calls']} выз., ${m['cost']:.4f}, {latency}")
+        if report["users"]:
+            lines.append("Топ пользователей:")
+            for user_id, u in report["users"]:
+                lines.append(f"  {user_id or '—'}: ${u['cost']:.4f}, {u['tokens']} токенов")
+        sections.append("\n".join(lines))
+    await message.answer("\n\n".join(sections))
+
+
 @router.message(Command("myid"))
 async def cmd_myid(message: Message):
     """Show the user's Telegram ID (useful for whitelist setup)."""
@@ -1,29 +1,164 @@
+import asyncio
 import logging
+import time
+from contextlib import aclosing
 
+import aiosqlite
 from aiogram import Router
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
 
+from app.handlers.common import cmd_cancel
+from app.handlers.document import cmd_history, cmd_mytemplates, cmd_newdoc
+from app.handlers.requisites import cmd_my_requisites
+from app.lexicon.ru import LEXICON_RU
+from app.services.flow_tasks import FlowTasks
+from app.services.intent_router import classify_intent
+from app.services.llm_client import LLMUnavailableError
 from app.services.openai_service import OpenAIService
+from app.services.template_registry import TemplateRegistry
+from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Telegram's limit for a single text message
+MESSAGE_LIMIT = 4096
+PLACEHOLDER = "…"
+
+# Intents answered with a fixed lexicon text
+INTENT_REPLIES = {
+    "help": "help",
+    "greeting": "greeting",
+    "thanks": "thanks",
+    "faq_template": "faq_template",
+}
+
 
 @router.message()
-async def handle_chat_message(message: Message, openai_service: OpenAIService):
-    """Catch-all handler: any text not matched by commands or FSM goes to AI chat."""
+async def handle_chat_message(
+    message: Message,
+    state: FSMContext,
+    db: aiosqlite.Connection,
+    openai_service: OpenAIService,
+    template_registry: TemplateRegistry,
+    flow_tasks: FlowTasks,
+):
+    """Catch-all handler: any text not matched by commands or FSM goes to AI chat,
+    unless it is recognized locally as a menu action or a FAQ."""
     if not message.text:
         return
 
+    intent = classify_intent(message.text)
+    if intent is not None:
+        logger.info("Chat message handled locally as %s", intent)
+        if intent in INTENT_REPLIES:
+            await message.answer(LEXICON_RU[INTENT_REPLIES[intent]])
+        elif intent == "newdoc":
+            await cmd_newdoc(message, state, template_registry, db)
+        elif intent == "mytemplates":
+            await cmd_mytemplates(message, db)
+        elif intent == "myrequisites":
+            await cmd_my_requisites(message, state, db)
+        elif intent == "history":
+            await cmd_history(message, db)
+        elif intent == "cancel":
+            await cmd_cancel(message, state, flow_tasks)
+        return
+
+    reply = _StreamingReply(message, settings.chat_stream_edit_interval)
     try:
-        response = await openai_service.chat(
+        await reply.start()
+        stream = openai_service.chat(
             user_id=message.from_user.id,
             user_message=message.text,
+            stream=True,
         )
-        await message.answer(response)
+        # Closed right away if showing the reply fails, releasing the LLM slot
+        async with aclosing(stream):
+            async for delta in stream:
+                await reply.append(delta)
+        await reply.finish()
+    except LLMUnavailableError:
+        await reply.fail(LEXICON_RU["ai_unavailable"])
     except Exception:
         logger.exception("OpenAI chat error")
-        await message.answer(
-            "Произошла ошибка при обращении к AI. Попробуйте позже."
-        )
+        await reply.fail("Произошла ошибка при обращении к AI. Попробуйте позже.")
+
+
+class _StreamingReply:
+    """Shows a streamed reply by editing a placeholder message.
+
+    Edits are throttled to one per interval (Telegram rate-limits edits), and
+    text past MESSAGE_LIMIT continues in a new message.
+    """
+
+    def __init__(self, message: Message, interval: float):
+        self.message = message
+        self.interval = interval
+        self.current: Message | None = None
+        self.text = ""
+        self.shown = ""
+        self.last_edit = 0.0
+
+    async def start(self) -> None:
+        self.current = await self.message.answer(PLACEHOLDER)
+
+    async def append(self, delta: str) -> None:
+        self.text += delta
+        while len(self.text) > MESSAGE_LIMIT:
+            cut = _split_point(self.text, MESSAGE_LIMIT)
+            head, self.text = self.text[:cut], self.text[cut:].lstrip()
+            await self._edit(head, final=True)
+            self.current = await self.message.answer(self.text or PLACEHOLDER)
+            self.shown = self.text or PLACEHOLDER
+            self.last_edit = time.monotonic()
+        if time.monotonic() - self.last_edit >= self.interval:
+            await self._edit(self.text)
+
+    async def finish(self) -> None:
+        await self._edit(self.text.strip() or "🤷 Пустой ответ.", final=True)
+
+    async def fail(self, error_text: str) -> None:
+        if self.current is None:
+            await self.message.answer(error_text)
+        elif not self.text:
+            await self._edit(error_text, final=True)
+        else:
+            await self._edit(self.text, final=True)
+            await self.message.answer(error_text)
+
+    async def _edit(self, text: str, final: bool = False) -> None:
+        """Show text in the current message. Intermediate edits are dropped when
+        Telegram throttles; final ones wait and retry once, then fall back to
+        sending the text as a new message."""
+        if not text or text == self.shown:
+            return
+        try:
+            await self.current.edit_text(text)
+            self.shown = text
+        except TelegramRetryAfter as e:
+            if not final:
+                logger.debug("Edit throttled by Telegram for %ss", e.retry_after)
+            else:
+                await asyncio.sleep(e.retry_after)
+                try:
+                    await self.current.edit_text(text)
+                except TelegramAPIError as retry_error:
+                    logger.debug("Final edit failed again (%s), sending a new message", retry_error)
+                    self.current = await self.message.answer(text)
+                self.shown = text
+        except TelegramBadRequest as e:
+            logger.debug("Edit rejected: %s", e)
+        self.last_edit = time.monotonic()
+
+
+def _split_point(text: str, limit: int) -> int:
+    """Index to split text at: the last paragraph, line or word break before limit."""
+    for sep in ("\n\n", "\n", " "):
+        pos = text.rfind(sep, limit // 2, limit)
+        if pos > 0:
+            return pos
+    return limit
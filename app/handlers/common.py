@@ -7,12 +7,16 @@ from aiogram.types import Message
 from app.database.repositories.user_requisites_repo import get_user_requisites
 from app.keyboards.reply import BTN_CANCEL, BTN_HELP, main_menu_keyboard
 from app.lexicon.ru import LEXICON_RU
+from app.services.flow_tasks import FlowTasks
 
 router = Router()
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, state: FSMContext, db: aiosqlite.Connection):
+async def cmd_start(
+    message: Message, state: FSMContext, db: aiosqlite.Connection, flow_tasks: FlowTasks
+):
+    flow_tasks.cancel(message.from_user.id)
     await state.clear()
     await message.answer(
         LEXICON_RU["start"],
@@ -33,7 +37,8 @@ async def cmd_help(message: Message):
 
 @router.message(Command("cancel"))
 @router.message(F.text == BTN_CANCEL)
-async def cmd_cancel(message: Message, state: FSMContext):
+async def cmd_cancel(message: Message, state: FSMContext, flow_tasks: FlowTasks):
+    flow_tasks.cancel(message.from_user.id)
     current_state = await state.get_state()
     if current_state is not None:
         await state.clear()
@@ -1,11 +1,9 @@
 import logging
-import os
-import uuid
-from collections import OrderedDict
 from datetime import datetime
 
 import aiosqlite
 from aiogram import Bot, F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, FSInputFile, Message
@@ -13,7 +11,13 @@ from aiogram.types import CallbackQuery, FSInputFile, Message
 from app.services.openai_service import OpenAIService
 from config.settings import settings
 
-from app.database.repositories.document_repo import get_user_documents, save_document
+from app.database.repositories.document_repo import (
+    get_document_by_id,
+    get_user_documents,
+    save_document,
+    update_document_file_id,
+)
+from app.database.repositories.template_blob_repo import touch_blob
 from app.database.repositories.user_requisites_repo import get_user_requisites
 from app.database.repositories.user_template_repo import (
     delete_user_template,
@@ -26,6 +30,7 @@ from app.keyboards.inline import (
     build_confirm_keyboard,
     build_edit_fields_keyboard,
     build_field_nav_keyboard,
+    build_history_keyboard,
     build_keep_value_keyboard,
     build_template_keyboard,
 )
@@ -38,6 +43,14 @@ from app.keyboards.reply import (
 )
 from app.lexicon.ru import LEXICON_RU
 from app.services.document_service import DocumentService
+from app.services.extraction_service import ExtractionTimeoutError
+from app.services.field_schema import FieldSchema, TemplateSchema
+from app.services.flow_tasks import FlowTasks
+from app.services.generation_scheduler import GenerationScheduler, SchedulerBusyError
+from app.services.genitive import GenitiveService
+from app.services.llm_client import LLMUnavailableError
+from app.services.requisite_reader import EmptyCardError, RequisiteReader
+from app.services.uploads import FileTooLargeError
 from app.services.template_registry import TemplateRegistry
 from app.states.document import DocumentCreation
 
@@ -45,6 +58,15 @@ logger = logging.getLogger(__name__)
 
 router = Router()
 
+# FlowTasks name of the genitive-case conversion started with target queries
+GENITIVE_TASK = "genitive"
+
+# A message with this many non-empty lines (or a forwarded one) is parsed as
+# data for all fields rather than as the answer to the current one
+BULK_MIN_LINES = 3
+# Offer bulk fill when at least this many fields are left after auto-fill
+BULK_HINT_MIN_FIELDS = 5
+
 
 # ---------------------------------------------------------------------------
 # /newdoc — start document creation
@@ -98,7 +120,65 @@ async def cmd_history(message: Message, db: aiosqlite.Connection):
         f"{i}. {doc['template_name']} — {doc['created_at']}"
         for i, doc in enumerate(docs, 1)
     ]
-    await message.answer(LEXICON_RU["history_header"] + "\n".join(lines))
+    await message.answer(
+        LEXICON_RU["history_header"] + "\n".join(lines) + LEXICON_RU["history_resend_hint"],
+        reply_markup=build_history_keyboard(docs),
+    )
+
+
+@router.callback_query(F.data.startswith("resend:"))
+async def resend_document(
+    callback: CallbackQuery,
+    document_service: DocumentService,
+    generation_scheduler: GenerationScheduler,
+    template_registry: TemplateRegistry,
+    db: aiosqlite.Connection,
+):
+    """Send a past document again: by cached file_id, or re-render if it expired."""
+    document_id = int(callback.data.split(":", 1)[1])
+    doc = await get_document_by_id(db, document_id, callback.from_user.id)
+    if not doc:
+        await callback.answer(LEXICON_RU["resend_not_found"])
+        return
+    await callback.answer()
+
+    if doc["file_id"]:
+        try:
+            await callback.message.answer_document(doc["file_id"])
+            return
+        except TelegramBadRequest:
+            logger.warning(
+                "file_id of document #%d is no longer valid, re-rendering", document_id
+            )
+
+    template_filename = await _resolve_template_filename(
+        db, template_registry, doc["template_id"], callback.from_user.id
+    )
+    if not template_filename:
+        await callback.message.answer(LEXICON_RU["generation_error"])
+        return
+
+    docx_path = None
+    try:
+        docx_path = await _generate_scheduled(
+            generation_scheduler,
+            document_service,
+            template_filename=template_filename,
+            context=doc["context"],
+            user_id=callback.from_user.id,
+        )
+        sent = await callback.message.answer_document(
+            FSInputFile(docx_path, filename=f"{doc['template_name']}.docx")
+        )
+        await update_document_file_id(db, document_id, sent.document.file_id)
+    except SchedulerBusyError:
+        await callback.message.answer(LEXICON_RU["generation_busy"])
+    except Exception:
+        logger.exception("Document re-render failed")
+        await callback.message.answer(LEXICON_RU["generation_error"])
+    finally:
+        if docx_path:
+            document_service.cleanup_files(docx_path)
 
 
 # ---------------------------------------------------------------------------
@@ -144,8 +224,12 @@ async def cmd_deltemplate(message: Message, db: aiosqlite.Connection):
         await message.answer("Укажите числовой ID шаблона.")
         return
 
+    ut = await get_user_template_by_id(db, template_id, message.from_user.id)
     deleted = await delete_user_template(db, template_id, message.from_user.id)
     if deleted:
+        if ut and ut["content_hash"]:
+            # Restart the blob's grace period for flows still using it
+            await touch_blob(db, ut["content_hash"])
         await message.answer(f"✅ Шаблон #{template_id} удалён.")
     else:
         await message.answer("⚠️ Шаблон не найден или не принадлежит вам.")
@@ -176,11 +260,13 @@ async def template_chosen(
             return
 
         fields = ut["fields"]
+        schema = template_registry.load_schema(fields)
         await state.update_data(
             template_id=f"user:{ut['id']}",
             template_display_name=ut["template_name"],
             template_filename=ut["filename"],
             fields=fields,
+            schema_id=schema.schema_id,
             current_field_index=0,
             collected_data={},
             skipped_fields=[],
@@ -188,16 +274,17 @@ async def template_chosen(
     else:
         # Global template
         meta = template_registry.get_template_meta(raw_id)
-        if not meta:
+        schema = template_registry.get_schema(raw_id)
+        if not meta or schema is None:
             await callback.answer("Шаблон не найден")
             return
 
-        fields = meta["fields"]
         await state.update_data(
             template_id=raw_id,
             template_display_name=meta["display_name"],
             template_filename=meta["filename"],
-            fields=fields,
+            fields=meta["fields"],
+            schema_id=schema.schema_id,
             current_field_index=0,
             collected_data={},
             skipped_fields=[],
@@ -212,48 +299,50 @@ async def template_chosen(
     if saved_req:
         from app.services.requisite_parser import map_requisites_to_fields
 
-        executor_mapped = map_requisites_to_fields(saved_req, fields, "executor")
+        executor_mapped = map_requisites_to_fields(saved_req, schema, "executor")
         if executor_mapped:
             collected.update(executor_mapped)
             auto_filled_count = len(executor_mapped)
 
     # Pre-fill auto-generated fields (contract_number, dates, city, etc.)
-    for field in fields:
-        auto = field.get("auto")
+    for field in schema:
+        auto = field.auto
         if not auto:
             continue
         if auto == "contract_number":
             doc_count = await _count_user_documents(db, callback.from_user.id)
             num = doc_count + 1
-            collected[field["key"]] = f"{num:02d}/{datetime.now().strftime('%m-%Y')}"
+            collected[field.key] = f"{num:02d}/{datetime.now().strftime('%m-%Y')}"
         elif auto == "today":
-            collected[field["key"]] = datetime.now().strftime("%d.%m.%Y")
+            collected[field.key] = datetime.now().strftime("%d.%m.%Y")
         elif auto == "today_ru":
-            collected[field["key"]] = _format_date_ru(datetime.now())
+            collected[field.key] = _format_date_ru(datetime.now())
         elif auto == "executor_city" and saved_req:
             city = _extract_city(saved_req.get("legal_address", ""))
             if city:
-                collected[field["key"]] = city
-        elif auto == "static" and field.get("auto_value"):
-            collected[field["key"]] = field["auto_value"]
+                collected[field.key] = city
+        elif auto == "static" and field.auto_value:
+            collected[field.key] = field.auto_value
 
     if collected:
         await state.update_data(collected_data=collected)
 
     # Find first unfilled field
-    first_idx = _next_unfilled_index(fields, collected, 0)
+    first_idx = _next_unfilled_index(schema, collected, 0)
 
     if auto_filled_count:
         await callback.message.answer(
             LEXICON_RU["executor_auto_filled"].format(count=auto_filled_count)
         )
+    if len(_bulk_candidates(schema, collected)) >= BULK_HINT_MIN_FIELDS:
+        await callback.message.answer(LEXICON_RU["bulk_fill_hint"])
 
     if first_idx is not None:
         await state.update_data(current_field_index=first_idx)
-        await _send_field_prompt(callback.message, state, fields, first_idx)
+        await _send_field_prompt(callback.message, state, schema, first_idx)
     else:
         # All fields filled
-        await _show_confirmation(callback.message, state)
+        await _show_confirmation(callback.message, state, schema)
 
     await state.set_state(DocumentCreation.collecting_requisites)
     await callback.answer()
@@ -277,27 +366,34 @@ async def noop_callback(callback: CallbackQuery):
 @router.callback_query(
     DocumentCreation.collecting_requisites, F.data == "field:back"
 )
-async def field_back(callback: CallbackQuery, state: FSMContext):
+async def field_back(
+    callback: CallbackQuery,
+    state: FSMContext,
+    template_registry: TemplateRegistry,
+    flow_tasks: FlowTasks,
+):
     data = await state.get_data()
     idx = data["current_field_index"]
     if idx <= 0:
         await callback.answer("Это первое поле")
         return
 
+    flow_tasks.cancel(callback.from_user.id, GENITIVE_TASK)
+
     new_idx = idx - 1
     await state.update_data(current_field_index=new_idx)
-    fields = data["fields"]
+    schema = _load_schema(data, template_registry)
     collected = data["collected_data"]
     skipped = set(data.get("skipped_fields", []))
-    field = fields[new_idx]
-    if field["key"] in skipped:
+    field = schema[new_idx]
+    if field.key in skipped:
         prev_value = "(пропущено)"
     else:
-        prev_value = collected.get(field["key"])
+        prev_value = collected.get(field.key)
 
     await callback.message.edit_reply_markup(reply_markup=None)
     await _send_field_prompt_back(
-        callback.message, state, fields, new_idx, prev_value
+        callback.message, state, schema, new_idx, prev_value
     )
     await callback.answer()
 
@@ -308,7 +404,8 @@ async def field_back(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(
     DocumentCreation.editing_field, F.data == "field:cancel"
 )
-async def field_cancel(callback: CallbackQuery, state: FSMContext):
+async def field_cancel(callback: CallbackQuery, state: FSMContext, flow_tasks: FlowTasks):
+    flow_tasks.cancel(callback.from_user.id)
     await state.clear()
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer(
@@ -321,23 +418,25 @@ async def field_cancel(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(
     DocumentCreation.collecting_requisites, F.data == "field:keep"
 )
-async def field_keep(callback: CallbackQuery, state: FSMContext):
+async def field_keep(
+    callback: CallbackQuery, state: FSMContext, template_registry: TemplateRegistry
+):
     """Keep current value and move to next field."""
     data = await state.get_data()
-    fields = data["fields"]
+    schema = _load_schema(data, template_registry)
     idx = data["current_field_index"]
     collected = data.get("collected_data", {})
     skipped = set(data.get("skipped_fields", []))
 
     await callback.message.edit_reply_markup(reply_markup=None)
 
-    next_idx = _next_unfilled_index(fields, collected, idx + 1, skipped)
+    next_idx = _next_unfilled_index(schema, collected, idx + 1, skipped)
     if next_idx is not None:
         await state.update_data(current_field_index=next_idx)
-        await _send_field_prompt(callback.message, state, fields, next_idx)
+        await _send_field_prompt(callback.message, state, schema, next_idx)
     else:
         # All fields done — show confirmation
-        await _show_confirmation(callback.message, state)
+        await _show_confirmation(callback.message, state, schema)
 
     await callback.answer()
 
@@ -345,35 +444,37 @@ async def field_keep(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(
     DocumentCreation.collecting_requisites, F.data == "field:skip"
 )
-async def field_skip(callback: CallbackQuery, state: FSMContext):
+async def field_skip(
+    callback: CallbackQuery, state: FSMContext, template_registry: TemplateRegistry
+):
     """Skip an optional field and move to the next one."""
     data = await state.get_data()
-    fields = data["fields"]
+    schema = _load_schema(data, template_registry)
     idx = data["current_field_index"]
-    field = fields[idx]
+    field = schema[idx]
 
-    if field.get("required", True):
+    if field.required:
         await callback.answer("Это поле обязательно")
         return
 
     skipped = set(data.get("skipped_fields", []))
-    skipped.add(field["key"])
+    skipped.add(field.key)
     collected = data.get("collected_data", {})
-    collected.pop(field["key"], None)
+    collected.pop(field.key, None)
 
     await callback.message.edit_reply_markup(reply_markup=None)
 
-    next_idx = _next_unfilled_index(fields, collected, idx + 1, skipped)
+    next_idx = _next_unfilled_index(schema, collected, idx + 1, skipped)
     if next_idx is not None:
         await state.update_data(
             current_field_index=next_idx,
             skipped_fields=list(skipped),
             collected_data=collected,
         )
-        await _send_field_prompt(callback.message, state, fields, next_idx)
+        await _send_field_prompt(callback.message, state, schema, next_idx)
     else:
         await state.update_data(skipped_fields=list(skipped), collected_data=collected)
-        await _show_confirmation(callback.message, state)
+        await _show_confirmation(callback.message, state, schema)
 
     await callback.answer()
 
@@ -391,46 +492,34 @@ async def handle_requisite_file(
     message: Message,
     state: FSMContext,
     bot: Bot,
-    openai_service: OpenAIService,
+    db: aiosqlite.Connection,
+    template_registry: TemplateRegistry,
+    requisite_reader: RequisiteReader,
 ):
     """User uploaded a company card during field collection — parse and auto-fill."""
-    file_name = message.document.file_name
-    is_pdf = file_name.lower().endswith(".pdf")
-
-    await message.answer(LEXICON_RU["requisite_analyzing"])
-
-    # Download file
-    file = await bot.get_file(message.document.file_id)
-    ext = ".pdf" if is_pdf else ".docx"
-    unique_id = uuid.uuid4().hex[:8]
-    temp_path = os.path.join(settings.output_dir, f"req_{unique_id}{ext}")
-    await bot.download_file(file.file_path, temp_path)
-
     try:
-        from app.services.requisite_parser import (
-            detect_side,
-            extract_text_from_docx,
-            extract_text_from_pdf,
-            map_requisites_to_fields,
+        requisite_reader.check_size(message.document.file_size)
+    except FileTooLargeError:
+        await message.answer(
+            LEXICON_RU["requisite_too_large"].format(limit=settings.extraction_max_file_mb)
         )
+        return
 
-        # Extract text
-        text = extract_text_from_pdf(temp_path) if is_pdf else extract_text_from_docx(temp_path)
+    await message.answer(LEXICON_RU["requisite_analyzing"])
 
-        if len(text.strip()) < 20:
-            await message.answer(LEXICON_RU["requisite_empty_file"])
-            return
+    try:
+        from app.services.requisite_parser import detect_side, map_requisites_to_fields
 
-        # AI extraction
-        requisites = await openai_service.extract_requisites(text)
+        # Cached result, or download + local extraction (AI only for what is missing)
+        requisites = await requisite_reader.read(bot, message.document, db)
 
         # Map to template fields
         data = await state.get_data()
-        fields = data["fields"]
+        schema = _load_schema(data, template_registry)
         idx = data["current_field_index"]
-        side = detect_side(fields, idx)
+        side = detect_side(schema, idx)
 
-        mapped = map_requisites_to_fields(requisites, fields, side)
+        mapped = map_requisites_to_fields(requisites, schema, side)
 
         if not mapped:
             await message.answer(LEXICON_RU["requisite_no_match"])
@@ -448,21 +537,19 @@ async def handle_requisite_file(
 
         # Build summary of filled fields
         filled_lines = []
-        for field in fields:
-            val = mapped.get(field["key"])
+        for field in schema:
+            val = mapped.get(field.key)
             if val:
-                filled_lines.append(f"│ {field['label']}: {val}")
+                filled_lines.append(f"│ {field.label}: {val}")
         summary = "\n".join(filled_lines)
 
         # Find unfilled fields
-        first_empty_idx = _next_unfilled_index(fields, collected, 0, skipped)
+        first_empty_idx = _next_unfilled_index(schema, collected, 0, skipped)
 
         if first_empty_idx is not None:
             remaining = sum(
-                1 for f in fields
-                if f["key"] not in collected
-                and not collected.get(f["key"])
-                and f["key"] not in skipped
+                1 for key in schema.keys
+                if key not in collected and key not in skipped
             )
             await state.update_data(current_field_index=first_empty_idx)
             await message.answer(
@@ -470,22 +557,27 @@ async def handle_requisite_file(
                     summary=summary, remaining=remaining
                 )
             )
-            await _send_field_prompt(message, state, fields, first_empty_idx)
+            await _send_field_prompt(message, state, schema, first_empty_idx)
         else:
             # All fields filled
             await message.answer(
                 LEXICON_RU["requisite_all_filled"].format(summary=summary)
             )
-            await _show_confirmation(message, state)
+            await _show_confirmation(message, state, schema)
 
+    except FileTooLargeError:
+        await message.answer(
+            LEXICON_RU["requisite_too_large"].format(limit=settings.extraction_max_file_mb)
+        )
+    except EmptyCardError:
+        await message.answer(LEXICON_RU["requisite_empty_file"])
+    except ExtractionTimeoutError:
+        await message.answer(LEXICON_RU["requisite_timeout"])
+    except LLMUnavailableError:
+        await message.answer(LEXICON_RU["requisite_ai_unavailable"])
     except Exception:
         logger.exception("Requisite extraction failed")
         await message.answer(LEXICON_RU["requisite_error"])
-    finally:
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
 
 
 # ---------------------------------------------------------------------------
@@ -499,25 +591,46 @@ async def collect_requisite(
     state: FSMContext,
     template_registry: TemplateRegistry,
     openai_service: OpenAIService,
+    genitive_service: GenitiveService,
+    flow_tasks: FlowTasks,
 ):
     data = await state.get_data()
-    fields = data["fields"]
+    schema = _load_schema(data, template_registry)
     idx = data["current_field_index"]
-    current_field = fields[idx]
+    current_field = schema[idx]
 
     value = message.text.strip() if message.text else ""
 
     # Handle AI query generation: user entered business type
-    if current_field.get("auto") == "ai_queries" and not data.get("ai_queries_manual"):
+    if current_field.auto == "ai_queries" and not data.get("ai_queries_manual"):
+        # The genitive form is needed on accept; if it isn't known locally,
+        # ask the LLM while queries generate. A task for a type entered
+        # earlier must not survive to be picked up on accept.
+        flow_tasks.cancel(message.from_user.id, GENITIVE_TASK)
+        if genitive_service.local(value) is None:
+            flow_tasks.start(
+                message.from_user.id,
+                GENITIVE_TASK,
+                genitive_service.convert(value),
+            )
         waiting_msg = await message.answer("🤖 Генерирую запросы...")
         try:
-            queries = await openai_service.generate_target_queries(value)
+            # After «Сгенерировать заново» ask the model again instead of the cache
+            queries = await openai_service.generate_target_queries(
+                value, refresh=bool(data.get("ai_queries_refresh"))
+            )
         except Exception as e:
             logger.error("AI query generation failed: %s", e)
+            flow_tasks.cancel(message.from_user.id, GENITIVE_TASK)
             await waiting_msg.delete()
-            is_opt = not current_field.get("required", True)
+            is_opt = current_field.optional
+            reason = (
+                LEXICON_RU["ai_unavailable"]
+                if isinstance(e, LLMUnavailableError)
+                else "Не удалось сгенерировать запросы."
+            )
             await message.answer(
-                "Не удалось сгенерировать запросы. Попробуйте ещё раз или введите вручную.",
+                f"{reason} Попробуйте ещё раз или введите вручную.",
                 reply_markup=build_field_nav_keyboard(
                     show_back=idx > 0, show_skip=is_opt
                 ),
@@ -525,42 +638,47 @@ async def collect_requisite(
             return
 
         await waiting_msg.delete()
-        await state.update_data(ai_generated_queries=queries, ai_queries_business=value)
+        await state.update_data(
+            ai_generated_queries=queries, ai_queries_business=value, ai_queries_refresh=None
+        )
         await message.answer(
             f"🤖 Сгенерированные запросы для «{value}»:\n\n{queries}",
             reply_markup=build_ai_queries_keyboard(),
         )
         return
 
+    # Several lines of data or a forwarded message: fill all fields at once
+    if _is_bulk_input(message, current_field, value):
+        await _bulk_fill(message, state, data, schema, template_registry, openai_service)
+        return
+
     # Handle "today" default for date fields
-    if current_field.get("type") == "date" and current_field.get("default") == "today":
-        if value.lower() in ("сегодня", "today", ""):
-            value = datetime.now().strftime("%d.%m.%Y")
+    value = current_field.apply_default(value)
 
     # Handle empty input for optional field as skip
-    is_optional = not current_field.get("required", True)
+    is_optional = current_field.optional
     if not value and is_optional:
         skipped = set(data.get("skipped_fields", []))
-        skipped.add(current_field["key"])
+        skipped.add(current_field.key)
         collected = data.get("collected_data", {})
-        collected.pop(current_field["key"], None)
+        collected.pop(current_field.key, None)
         await state.update_data(ai_queries_manual=None)
 
-        next_idx = _next_unfilled_index(fields, collected, idx + 1, skipped)
+        next_idx = _next_unfilled_index(schema, collected, idx + 1, skipped)
         if next_idx is not None:
             await state.update_data(
                 current_field_index=next_idx, skipped_fields=list(skipped)
             )
-            await _send_field_prompt(message, state, fields, next_idx)
+            await _send_field_prompt(message, state, schema, next_idx)
         else:
             await state.update_data(skipped_fields=list(skipped))
-            await _show_confirmation(message, state)
+            await _show_confirmation(message, state, schema)
         return
 
     # Validate
     error = template_registry.validate_field(current_field, value)
     if error:
-        hint = current_field.get("validation_hint", error)
+        hint = current_field.validation_hint or error
         await message.answer(
             LEXICON_RU["validation_error"].format(hint=hint, value=value),
             reply_markup=build_field_nav_keyboard(
@@ -571,21 +689,113 @@ async def collect_requisite(
 
     # Store value and remove from skipped if it was there
     collected = data["collected_data"]
-    collected[current_field["key"]] = value
+    collected[current_field.key] = value
     skipped = set(data.get("skipped_fields", []))
-    skipped.discard(current_field["key"])
+    skipped.discard(current_field.key)
 
     # Clear manual mode flag if it was set
     await state.update_data(ai_queries_manual=None, skipped_fields=list(skipped))
 
-    next_idx = _next_unfilled_index(fields, collected, idx + 1, skipped)
+    next_idx = _next_unfilled_index(schema, collected, idx + 1, skipped)
     if next_idx is not None:
         await state.update_data(current_field_index=next_idx, collected_data=collected)
-        await _send_field_prompt(message, state, fields, next_idx)
+        await _send_field_prompt(message, state, schema, next_idx)
     else:
         # All fields collected — show confirmation
         await state.update_data(collected_data=collected)
-        await _show_confirmation(message, state)
+        await _show_confirmation(message, state, schema)
+
+
+# ---------------------------------------------------------------------------
+# FSM: Bulk fill from one free-text message
+# ---------------------------------------------------------------------------
+
+
+def _is_bulk_input(message: Message, field: FieldSchema, value: str) -> bool:
+    if message.forward_origin is not None:
+        return bool(value)
+    # Multi-line answers are normal for free-text fields
+    if field.type == "text":
+        return False
+    return sum(1 for line in value.splitlines() if line.strip()) >= BULK_MIN_LINES
+
+
+def _bulk_candidates(schema: TemplateSchema, collected: dict) -> list[FieldSchema]:
+    """Fields still without a value that can be taken from pasted text."""
+    return [
+        field for field in schema
+        if field.auto != "ai_queries" and not collected.get(field.key)
+    ]
+
+
+async def _bulk_fill(
+    message: Message,
+    state: FSMContext,
+    data: dict,
+    schema: TemplateSchema,
+    template_registry: TemplateRegistry,
+    openai_service: OpenAIService,
+):
+    """Fill every field found in a free-text message with one LLM call,
+    then prompt only for what is still missing or invalid."""
+    idx = data["current_field_index"]
+    current_field = schema[idx]
+    collected = data.get("collected_data", {})
+    candidates = _bulk_candidates(schema, collected)
+    nav = build_field_nav_keyboard(show_back=idx > 0, show_skip=current_field.optional)
+
+    waiting_msg = await message.answer(LEXICON_RU["bulk_analyzing"])
+    try:
+        values = await openai_service.extract_field_values(message.text, candidates)
+    except LLMUnavailableError:
+        await waiting_msg.delete()
+        await message.answer(LEXICON_RU["ai_unavailable"], reply_markup=nav)
+        return
+    except Exception:
+        logger.exception("Bulk field extraction failed")
+        await waiting_msg.delete()
+        await message.answer(LEXICON_RU["bulk_error"], reply_markup=nav)
+        return
+    await waiting_msg.delete()
+
+    filled_lines = []
+    invalid_lines = []
+    for field in candidates:
+        value = values.get(field.key)
+        if not value:
+            continue
+        value = field.apply_default(value)
+        if template_registry.validate_field(field, value):
+            invalid_lines.append(f"│ {field.label}: {value}")
+            continue
+        collected[field.key] = value
+        filled_lines.append(f"│ {field.label}: {value}")
+
+    if not filled_lines and not invalid_lines:
+        await message.answer(LEXICON_RU["bulk_no_match"], reply_markup=nav)
+        return
+
+    skipped = set(data.get("skipped_fields", [])) - collected.keys()
+    await state.update_data(
+        collected_data=collected, skipped_fields=list(skipped), ai_queries_manual=None
+    )
+
+    text = LEXICON_RU["bulk_filled"].format(summary="\n".join(filled_lines) or "—")
+    if invalid_lines:
+        text += LEXICON_RU["bulk_invalid"].format(invalid="\n".join(invalid_lines))
+
+    next_idx = _next_unfilled_index(schema, collected, 0, skipped)
+    if next_idx is not None:
+        remaining = sum(
+            1 for key in schema.keys
+            if not collected.get(key) and key not in skipped
+        )
+        await message.answer(text + LEXICON_RU["bulk_remaining"].format(remaining=remaining))
+        await state.update_data(current_field_index=next_idx)
+        await _send_field_prompt(message, state, schema, next_idx)
+    else:
+        await message.answer(text)
+        await _show_confirmation(message, state, schema)
 
 
 # ---------------------------------------------------------------------------
@@ -599,24 +809,28 @@ async def collect_requisite(
 async def ai_queries_accept(
     callback: CallbackQuery,
     state: FSMContext,
-    openai_service: OpenAIService,
+    genitive_service: GenitiveService,
+    template_registry: TemplateRegistry,
+    flow_tasks: FlowTasks,
 ):
     """Accept AI-generated queries and move to next field."""
     data = await state.get_data()
-    fields = data["fields"]
+    schema = _load_schema(data, template_registry)
     idx = data["current_field_index"]
     queries = data.get("ai_generated_queries", "")
     business_type = data.get("ai_queries_business", "")
 
     collected = data["collected_data"]
-    collected[fields[idx]["key"]] = queries
+    collected[schema[idx].key] = queries
 
-    # Convert business type to genitive case for Appendix 1
+    # Genitive case for Appendix 1, started when the business type was entered
+    genitive_task = flow_tasks.pop(callback.from_user.id, GENITIVE_TASK)
     if business_type:
         try:
-            genitive = await openai_service.convert_business_type_genitive(
-                business_type
-            )
+            if genitive_task is not None:
+                genitive = await genitive_task
+            else:
+                genitive = await genitive_service.convert(business_type)
             collected["customer_business_type_genitive"] = genitive
         except Exception:
             logger.warning("Failed to convert business type to genitive")
@@ -624,17 +838,17 @@ async def ai_queries_accept(
     await callback.message.edit_reply_markup(reply_markup=None)
 
     skipped = set(data.get("skipped_fields", []))
-    next_idx = _next_unfilled_index(fields, collected, idx + 1, skipped)
+    next_idx = _next_unfilled_index(schema, collected, idx + 1, skipped)
     if next_idx is not None:
         await state.update_data(
             current_field_index=next_idx,
             collected_data=collected,
             ai_generated_queries=None,
         )
-        await _send_field_prompt(callback.message, state, fields, next_idx)
+        await _send_field_prompt(callback.message, state, schema, next_idx)
     else:
         await state.update_data(collected_data=collected, ai_generated_queries=None)
-        await _show_confirmation(callback.message, state)
+        await _show_confirmation(callback.message, state, schema)
 
     await callback.answer()
 
@@ -642,25 +856,33 @@ async def ai_queries_accept(
 @router.callback_query(
     DocumentCreation.collecting_requisites, F.data == "ai_queries:regenerate"
 )
-async def ai_queries_regenerate(callback: CallbackQuery, state: FSMContext):
+async def ai_queries_regenerate(
+    callback: CallbackQuery,
+    state: FSMContext,
+    template_registry: TemplateRegistry,
+    flow_tasks: FlowTasks,
+):
     """Re-show the business type prompt for another generation."""
+    flow_tasks.cancel(callback.from_user.id, GENITIVE_TASK)
     data = await state.get_data()
-    fields = data["fields"]
+    schema = _load_schema(data, template_registry)
     idx = data["current_field_index"]
 
     await callback.message.edit_reply_markup(reply_markup=None)
-    await state.update_data(ai_generated_queries=None)
-    await _send_field_prompt(callback.message, state, fields, idx)
+    await state.update_data(ai_generated_queries=None, ai_queries_refresh=True)
+    await _send_field_prompt(callback.message, state, schema, idx)
     await callback.answer()
 
 
 @router.callback_query(
     DocumentCreation.collecting_requisites, F.data == "ai_queries:manual"
 )
-async def ai_queries_manual(callback: CallbackQuery, state: FSMContext):
+async def ai_queries_manual(
+    callback: CallbackQuery, state: FSMContext, flow_tasks: FlowTasks
+):
     """Switch to manual text input for queries."""
+    flow_tasks.cancel(callback.from_user.id, GENITIVE_TASK)
     data = await state.get_data()
-    fields = data["fields"]
     idx = data["current_field_index"]
 
     await callback.message.edit_reply_markup(reply_markup=None)
@@ -684,6 +906,8 @@ async def confirm_yes(
     callback: CallbackQuery,
     state: FSMContext,
     document_service: DocumentService,
+    generation_scheduler: GenerationScheduler,
+    template_registry: TemplateRegistry,
     db: aiosqlite.Connection,
 ):
     data = await state.get_data()
@@ -696,20 +920,16 @@ async def confirm_yes(
     )
     await state.set_state(DocumentCreation.generating_document)
 
+    # Number and date are fixed now and saved with the context for resends
+    context = document_service.stamp(data["collected_data"])
     try:
-        docx_path = await document_service.generate_document(
+        docx_path = await _generate_scheduled(
+            generation_scheduler,
+            document_service,
             template_filename=data["template_filename"],
-            context=data["collected_data"],
+            context=context,
             user_id=callback.from_user.id,
-        )
-
-        # Save to DB
-        await save_document(
-            db,
-            user_id=callback.from_user.id,
-            template_id=data["template_id"],
-            template_name=data["template_display_name"],
-            context=data["collected_data"],
+            status_msg=status_msg,
         )
 
         # Build short summary for the "ready" message
@@ -730,14 +950,35 @@ async def confirm_yes(
         docx_file = FSInputFile(
             docx_path, filename=f"{data['template_display_name']}.docx"
         )
-        await callback.message.answer_document(
+        sent = await callback.message.answer_document(
             docx_file,
             reply_markup=build_after_generation_keyboard(),
         )
 
+        # Save to DB with Telegram's file_id so /history can resend without re-upload
+        await save_document(
+            db,
+            user_id=callback.from_user.id,
+            template_id=data["template_id"],
+            template_name=data["template_display_name"],
+            context=context,
+            file_id=sent.document.file_id,
+        )
+
         # Cleanup temp files
         document_service.cleanup_files(docx_path)
 
+    except SchedulerBusyError:
+        # Queue is full: keep the collected data so the user can retry
+        try:
+            await status_msg.edit_text(LEXICON_RU["generation_busy"])
+        except TelegramBadRequest:
+            pass
+        schema = _load_schema(data, template_registry)
+        await _show_confirmation(callback.message, state, schema)
+        await callback.answer()
+        return
+
     except Exception:
         logger.exception("Document generation failed")
         try:
@@ -753,20 +994,23 @@ async def confirm_yes(
 
 
 @router.callback_query(DocumentCreation.confirming_data, F.data == "confirm:edit")
-async def confirm_edit(callback: CallbackQuery, state: FSMContext):
+async def confirm_edit(
+    callback: CallbackQuery, state: FSMContext, template_registry: TemplateRegistry
+):
     """Show field selection for editing."""
     data = await state.get_data()
-    fields = data["fields"]
+    schema = _load_schema(data, template_registry)
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer(
         LEXICON_RU["edit_which_field"],
-        reply_markup=build_edit_fields_keyboard(fields),
+        reply_markup=build_edit_fields_keyboard(schema),
     )
     await callback.answer()
 
 
 @router.callback_query(DocumentCreation.confirming_data, F.data == "confirm:cancel")
-async def confirm_cancel(callback: CallbackQuery, state: FSMContext):
+async def confirm_cancel(callback: CallbackQuery, state: FSMContext, flow_tasks: FlowTasks):
+    flow_tasks.cancel(callback.from_user.id)
     await state.clear()
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer(
@@ -784,44 +1028,46 @@ async def confirm_cancel(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(
     DocumentCreation.confirming_data, F.data.startswith("editfield:")
 )
-async def edit_field_chosen(callback: CallbackQuery, state: FSMContext):
+async def edit_field_chosen(
+    callback: CallbackQuery, state: FSMContext, template_registry: TemplateRegistry
+):
     value = callback.data.split(":")[1]
+    data = await state.get_data()
+    schema = _load_schema(data, template_registry)
 
     if value == "back":
         # Return to confirmation
         await callback.message.edit_reply_markup(reply_markup=None)
-        await _show_confirmation(callback.message, state)
+        await _show_confirmation(callback.message, state, schema)
         await callback.answer()
         return
 
     field_idx = int(value)
-    data = await state.get_data()
-    fields = data["fields"]
     collected = data["collected_data"]
     skipped = set(data.get("skipped_fields", []))
-    field = fields[field_idx]
+    field = schema[field_idx]
 
-    if field["key"] in skipped:
+    if field.key in skipped:
         current_value = "(пропущено)"
     else:
-        current_value = collected.get(field["key"], "")
+        current_value = collected.get(field.key, "")
 
     await state.update_data(editing_field_index=field_idx)
     await callback.message.edit_reply_markup(reply_markup=None)
 
     template_name = data["template_display_name"]
-    hint = field.get("hint", "")
+    hint = field.hint
     hint_line = f"💡 {hint}" if hint else ""
 
-    is_optional = not field.get("required", True)
+    is_optional = field.optional
     if is_optional:
         hint_line += "\nПоле необязательное — можно пропустить"
 
     text = LEXICON_RU["field_prompt_back"].format(
         template_name=template_name,
         current=field_idx + 1,
-        total=len(fields),
-        prompt=field["prompt_ru"],
+        total=len(schema),
+        prompt=field.prompt_ru,
         hint=hint_line,
         value=current_value or "—",
     )
@@ -834,37 +1080,43 @@ async def edit_field_chosen(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(DocumentCreation.editing_field, F.data == "field:keep")
-async def editing_field_keep(callback: CallbackQuery, state: FSMContext):
+async def editing_field_keep(
+    callback: CallbackQuery, state: FSMContext, template_registry: TemplateRegistry
+):
     """Keep current value and return to confirmation."""
+    data = await state.get_data()
+    schema = _load_schema(data, template_registry)
     await callback.message.edit_reply_markup(reply_markup=None)
     await state.set_state(DocumentCreation.confirming_data)
-    await _show_confirmation(callback.message, state)
+    await _show_confirmation(callback.message, state, schema)
     await callback.answer()
 
 
 @router.callback_query(DocumentCreation.editing_field, F.data == "field:skip")
-async def editing_field_skip(callback: CallbackQuery, state: FSMContext):
+async def editing_field_skip(
+    callback: CallbackQuery, state: FSMContext, template_registry: TemplateRegistry
+):
     """Skip this field during editing and return to confirmation."""
     data = await state.get_data()
     field_idx = data["editing_field_index"]
-    fields = data["fields"]
-    field = fields[field_idx]
+    schema = _load_schema(data, template_registry)
+    field = schema[field_idx]
 
-    if field.get("required", True):
+    if field.required:
         await callback.answer("Это поле обязательно")
         return
 
     skipped = set(data.get("skipped_fields", []))
-    skipped.add(field["key"])
+    skipped.add(field.key)
     collected = data["collected_data"]
-    collected.pop(field["key"], None)
+    collected.pop(field.key, None)
 
     await state.update_data(
         collected_data=collected, skipped_fields=list(skipped)
     )
     await callback.message.edit_reply_markup(reply_markup=None)
     await state.set_state(DocumentCreation.confirming_data)
-    await _show_confirmation(callback.message, state)
+    await _show_confirmation(callback.message, state, schema)
     await callback.answer()
 
 
@@ -876,22 +1128,18 @@ async def editing_field_value(
 ):
     data = await state.get_data()
     field_idx = data["editing_field_index"]
-    fields = data["fields"]
-    field = fields[field_idx]
+    schema = _load_schema(data, template_registry)
+    field = schema[field_idx]
 
     value = message.text.strip() if message.text else ""
 
     # Handle "today" default for date fields
-    if field.get("type") == "date" and field.get("default") == "today":
-        if value.lower() in ("сегодня", "today", ""):
-            from datetime import datetime
-
-            value = datetime.now().strftime("%d.%m.%Y")
+    value = field.apply_default(value)
 
     # Validate
     error = template_registry.validate_field(field, value)
     if error:
-        hint = field.get("validation_hint", error)
+        hint = field.validation_hint or error
         await message.answer(
             LEXICON_RU["validation_error"].format(hint=hint, value=value),
         )
@@ -899,14 +1147,14 @@ async def editing_field_value(
 
     # Store updated value and un-skip if it was skipped
     collected = data["collected_data"]
-    collected[field["key"]] = value
+    collected[field.key] = value
     skipped = set(data.get("skipped_fields", []))
-    skipped.discard(field["key"])
+    skipped.discard(field.key)
     await state.update_data(collected_data=collected, skipped_fields=list(skipped))
 
     # Return to confirmation
     await state.set_state(DocumentCreation.confirming_data)
-    await _show_confirmation(message, state)
+    await _show_confirmation(message, state, schema)
 
 
 # ---------------------------------------------------------------------------
@@ -949,37 +1197,40 @@ async def action_newdoc(
 # ---------------------------------------------------------------------------
 
 
+def _load_schema(data: dict, template_registry: TemplateRegistry) -> TemplateSchema:
+    """Compiled field schema of the template this flow started with."""
+    return template_registry.load_schema(data["fields"], data.get("schema_id"))
+
+
 async def _send_field_prompt(
-    message: Message, state: FSMContext, fields: list[dict], idx: int
+    message: Message, state: FSMContext, schema: TemplateSchema, idx: int
 ):
     """Send the prompt for field at given index with progress indicator."""
     data = await state.get_data()
     template_name = data["template_display_name"]
-    field = fields[idx]
+    field = schema[idx]
 
-    hint = field.get("hint", "")
+    hint = field.hint
     hint_line = f"💡 {hint}" if hint else ""
 
-    if field.get("default") == "today":
+    if field.default_today:
         hint_line += '\n📅 Отправьте «сегодня» для текущей даты'
 
     # Show file upload hint at the start of a new group with requisite fields
-    group = field.get("group", "")
-    is_new_group = idx == 0 or (idx > 0 and group != fields[idx - 1].get("group", ""))
-    if is_new_group and any(
-        kw in group for kw in ("Заказчик", "Плательщик", "Исполнитель", "Получатель", "Стороны")
+    if field.starts_group and any(
+        kw in field.group for kw in ("Заказчик", "Плательщик", "Исполнитель", "Получатель", "Стороны")
     ):
         hint_line += LEXICON_RU["requisite_upload_hint"]
 
-    is_optional = not field.get("required", True)
+    is_optional = field.optional
     if is_optional:
         hint_line += "\nПоле необязательное — можно пропустить"
 
     text = LEXICON_RU["field_prompt"].format(
         template_name=template_name,
         current=idx + 1,
-        total=len(fields),
-        prompt=field["prompt_ru"],
+        total=len(schema),
+        prompt=field.prompt_ru,
         hint=hint_line,
     )
 
@@ -994,27 +1245,27 @@ async def _send_field_prompt(
 async def _send_field_prompt_back(
     message: Message,
     state: FSMContext,
-    fields: list[dict],
+    schema: TemplateSchema,
     idx: int,
     prev_value: str | None,
 ):
     """Send prompt for going back — shows current value."""
     data = await state.get_data()
     template_name = data["template_display_name"]
-    field = fields[idx]
+    field = schema[idx]
 
-    hint = field.get("hint", "")
+    hint = field.hint
     hint_line = f"💡 {hint}" if hint else ""
 
-    is_optional = not field.get("required", True)
+    is_optional = field.optional
     if is_optional:
         hint_line += "\nПоле необязательное — можно пропустить"
 
     text = LEXICON_RU["field_prompt_back"].format(
         template_name=template_name,
         current=idx + 1,
-        total=len(fields),
-        prompt=field["prompt_ru"],
+        total=len(schema),
+        prompt=field.prompt_ru,
         hint=hint_line,
         value=prev_value or "—",
     )
@@ -1025,15 +1276,14 @@ async def _send_field_prompt_back(
     )
 
 
-async def _show_confirmation(message: Message, state: FSMContext):
+async def _show_confirmation(message: Message, state: FSMContext, schema: TemplateSchema):
     """Show grouped confirmation summary."""
     data = await state.get_data()
-    fields = data["fields"]
     collected = data["collected_data"]
     template_name = data["template_display_name"]
     skipped = set(data.get("skipped_fields", []))
 
-    summary = _format_grouped_summary(fields, collected, skipped)
+    summary = _format_grouped_summary(schema, collected, skipped)
 
     await message.answer(
         LEXICON_RU["confirm_data"].format(
@@ -1045,33 +1295,27 @@ async def _show_confirmation(message: Message, state: FSMContext):
 
 
 def _format_grouped_summary(
-    fields: list[dict],
+    schema: TemplateSchema,
     collected: dict,
     skipped_fields: set | None = None,
 ) -> str:
     """Format fields into grouped display with box-drawing characters."""
     skipped = skipped_fields or set()
-    groups: OrderedDict[str, list[tuple[str, str]]] = OrderedDict()
-    for field in fields:
-        group = field.get("group", "Данные")
-        key = field["key"]
-        if key in skipped:
-            value = "(пропущено)"
-        else:
-            value = collected.get(key, "—")
-        if group not in groups:
-            groups[group] = []
-        groups[group].append((field["label"], value))
-
+    fields = schema.fields
     lines = []
-    group_list = list(groups.items())
-    for i, (group_name, entries) in enumerate(group_list):
-        is_last = i == len(group_list) - 1
+    last = len(schema.groups) - 1
+    for i, (group_name, members) in enumerate(schema.groups):
+        is_last = i == last
         prefix = "└" if is_last else "┌" if i == 0 else "├"
         lines.append(f"{prefix} {group_name}")
 
-        for label, value in entries:
-            lines.append(f"│ {label}: {value}")
+        for idx in members:
+            field = fields[idx]
+            if field.key in skipped:
+                value = "(пропущено)"
+            else:
+                value = collected.get(field.key, "—")
+            lines.append(f"│ {field.label}: {value}")
 
         if not is_last:
             lines.append("│")
@@ -1101,15 +1345,16 @@ def _extract_city(address: str) -> str | None:
 
 
 def _next_unfilled_index(
-    fields: list[dict],
+    schema: TemplateSchema,
     collected: dict,
     start: int,
     skipped_fields: set | None = None,
 ) -> int | None:
     """Return the index of the next field that has no value in collected, or None."""
     skipped = skipped_fields or set()
-    for i in range(start, len(fields)):
-        key = fields[i]["key"]
+    keys = schema.keys
+    for i in range(start, len(keys)):
+        key = keys[i]
         if key in skipped:
             continue
         if key not in collected or not collected[key]:
@@ -1117,6 +1362,59 @@ def _next_unfilled_index(
     return None
 
 
+async def _generate_scheduled(
+    generation_scheduler: GenerationScheduler,
+    document_service: DocumentService,
+    template_filename: str,
+    context: dict,
+    user_id: int,
+    status_msg: Message | None = None,
+) -> str:
+    """Render a document through the scheduler, showing queue position in status_msg."""
+    queued = False
+
+    async def report_position(position: int):
+        nonlocal queued
+        queued = True
+        if status_msg:
+            try:
+                await status_msg.edit_text(
+                    LEXICON_RU["generating_queued"].format(position=position)
+                )
+            except TelegramBadRequest:
+                pass
+
+    async def render() -> str:
+        if queued and status_msg:
+            try:
+                await status_msg.edit_text(LEXICON_RU["generating"])
+            except TelegramBadRequest:
+                pass
+        return await document_service.generate_document(
+            template_filename=template_filename,
+            context=context,
+            user_id=user_id,
+        )
+
+    return await generation_scheduler.run(
+        user_id, render, on_position=report_position
+    )
+
+
+async def _resolve_template_filename(
+    db: aiosqlite.Connection,
+    template_registry: TemplateRegistry,
+    template_id: str,
+    user_id: int,
+) -> str | None:
+    """Map a stored template_id ("invoice" or "user:12") back to its .docx filename."""
+    if template_id.startswith("user:"):
+        ut = await get_user_template_by_id(db, int(template_id.split(":")[1]), user_id)
+        return ut["filename"] if ut else None
+    meta = template_registry.get_template_meta(template_id)
+    return meta["filename"] if meta else None
+
+
 async def _count_user_documents(db: aiosqlite.Connection, user_id: int) -> int:
     """Count total documents generated by a user."""
     cursor = await db.execute(
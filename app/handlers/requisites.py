@@ -1,8 +1,6 @@
 """Handler for user requisites setup — save executor info once, reuse in all documents."""
 
 import logging
-import os
-import uuid
 
 import aiosqlite
 from aiogram import Bot, F, Router
@@ -18,8 +16,11 @@ from app.database.repositories.user_requisites_repo import (
 from app.keyboards.inline import build_requisites_confirm_keyboard
 from app.keyboards.reply import BTN_MY_REQUISITES, main_menu_keyboard
 from app.lexicon.ru import LEXICON_RU
-from app.services.openai_service import OpenAIService
+from app.services.extraction_service import ExtractionTimeoutError
+from app.services.llm_client import LLMUnavailableError
 from app.services.requisite_parser import format_requisites_summary
+from app.services.requisite_reader import EmptyCardError, RequisiteReader
+from app.services.uploads import FileTooLargeError
 from app.states.document import RequisitesSetup
 from config.settings import settings
 
@@ -69,33 +70,22 @@ async def requisites_file_upload(
     message: Message,
     state: FSMContext,
     bot: Bot,
-    openai_service: OpenAIService,
+    db: aiosqlite.Connection,
+    requisite_reader: RequisiteReader,
 ):
     """Parse uploaded company card for requisites setup."""
-    file_name = message.document.file_name
-    is_pdf = file_name.lower().endswith(".pdf")
-
-    await message.answer(LEXICON_RU["requisite_analyzing"])
-
-    file = await bot.get_file(message.document.file_id)
-    ext = ".pdf" if is_pdf else ".docx"
-    unique_id = uuid.uuid4().hex[:8]
-    temp_path = os.path.join(settings.output_dir, f"reqsetup_{unique_id}{ext}")
-    await bot.download_file(file.file_path, temp_path)
-
     try:
-        from app.services.requisite_parser import (
-            extract_text_from_docx,
-            extract_text_from_pdf,
+        requisite_reader.check_size(message.document.file_size)
+    except FileTooLargeError:
+        await message.answer(
+            LEXICON_RU["requisite_too_large"].format(limit=settings.extraction_max_file_mb)
         )
+        return
 
-        text = extract_text_from_pdf(temp_path) if is_pdf else extract_text_from_docx(temp_path)
-
-        if len(text.strip()) < 20:
-            await message.answer(LEXICON_RU["requisite_empty_file"])
-            return
+    await message.answer(LEXICON_RU["requisite_analyzing"])
 
-        requisites = await openai_service.extract_requisites(text)
+    try:
+        requisites = await requisite_reader.read(bot, message.document, db)
 
         if not requisites:
             await message.answer(LEXICON_RU["requisite_no_match"])
@@ -111,14 +101,19 @@ async def requisites_file_upload(
         )
         await state.set_state(RequisitesSetup.confirming)
 
+    except FileTooLargeError:
+        await message.answer(
+            LEXICON_RU["requisite_too_large"].format(limit=settings.extraction_max_file_mb)
+        )
+    except EmptyCardError:
+        await message.answer(LEXICON_RU["requisite_empty_file"])
+    except ExtractionTimeoutError:
+        await message.answer(LEXICON_RU["requisite_timeout"])
+    except LLMUnavailableError:
+        await message.answer(LEXICON_RU["requisite_ai_unavailable"])
     except Exception:
         logger.exception("Requisite setup parsing failed")
         await message.answer(LEXICON_RU["requisite_error"])
-    finally:
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
 
 
 @router.message(RequisitesSetup.waiting_for_file)
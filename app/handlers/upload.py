@@ -1,18 +1,31 @@
+import asyncio
 import logging
 import os
-import shutil
-import uuid
 
 import aiosqlite
 from aiogram import Bot, F, Router
 from aiogram.filters import StateFilter
 from aiogram.types import Message
-from docxtpl import DocxTemplate
 
 from app.states.document import DocumentCreation, RequisitesSetup
 
 from app.database.repositories.user_template_repo import save_user_template
 from app.services.openai_service import OpenAIService
+from app.services.template_compiler import (
+    artifact_path,
+    compile_template,
+    load_artifact,
+    save_artifact,
+)
+from app.services.template_registry import TemplateRegistry
+from app.services.template_store import TemplateBlobStore
+from app.services.uploads import (
+    MAX_UNCOMPRESSED_RATIO,
+    FileTooLargeError,
+    check_docx_archive,
+    download_document,
+    stream_sha256,
+)
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -28,21 +41,43 @@ async def handle_docx_upload(
     message: Message,
     bot: Bot,
     openai_service: OpenAIService,
+    template_registry: TemplateRegistry,
+    template_store: TemplateBlobStore,
     db: aiosqlite.Connection,
 ):
     """Handle .docx upload: scan for {{ }} placeholders and create a user template."""
+    max_bytes = settings.template_max_file_mb * 1024 * 1024
 
-    # Download file
-    file = await bot.get_file(message.document.file_id)
-    unique_id = uuid.uuid4().hex[:8]
-    temp_path = os.path.join(settings.output_dir, f"upload_{unique_id}.docx")
-
-    await bot.download_file(file.file_path, temp_path)
+    # Download into memory; oversized files are cut off mid-download
+    try:
+        buffer = await download_document(bot, message.document, max_bytes)
+    except FileTooLargeError:
+        await message.answer(
+            f"❌ Файл слишком большой (больше {settings.template_max_file_mb} МБ)."
+        )
+        return
 
     try:
-        # Scan for {{ }} placeholders using docxtpl
-        doc = DocxTemplate(temp_path)
-        variables = doc.get_undeclared_template_variables()
+        check_docx_archive(buffer, max_bytes)
+
+        # Identical files are stored and compiled once
+        content_hash = await asyncio.to_thread(stream_sha256, buffer)
+        artifact = await asyncio.to_thread(
+            load_artifact, template_store.path(content_hash)
+        )
+        if artifact is None:
+            # Patch, compile and scan for {{ }} placeholders once; renders reuse the result
+            artifact = await asyncio.to_thread(compile_template, buffer, content_hash)
+        variables = artifact["variables"]
+
+        if artifact["errors"]:
+            logger.info("Template compile errors: %s", artifact["errors"])
+            await message.answer(
+                "❌ В шаблоне есть ошибки в плейсхолдерах:\n\n"
+                + "\n".join(f"• {e}" for e in artifact["errors"][:5])
+                + "\n\nПроверьте парные скобки {{ }} и {% %} и отправьте файл повторно."
+            )
+            return
 
         if not variables:
             await message.answer(
@@ -59,14 +94,16 @@ async def handle_docx_upload(
             )
             return
 
-        sorted_vars = sorted(variables)
+        sorted_vars = list(variables)
         logger.info("Found %d template variables: %s", len(sorted_vars), sorted_vars)
 
         # Use AI to generate Russian labels for variable names
         await message.answer("🔍 Найдено полей: %d. Генерирую описания..." % len(sorted_vars))
 
         try:
-            labels = await openai_service.generate_field_labels(sorted_vars)
+            labels = await openai_service.generate_field_labels(
+                sorted_vars, known=template_registry.known_field_labels()
+            )
         except Exception:
             logger.exception("AI label generation failed, using defaults")
             labels = {}
@@ -83,11 +120,12 @@ async def handle_docx_upload(
                 "required": True,
             })
 
-        # Copy .docx as-is to templates directory (no modification needed!)
+        # Store .docx as-is in the blob store (no modification needed!)
         user_id = message.from_user.id
-        template_filename = f"user_{user_id}_{unique_id}.docx"
-        template_path = os.path.join(settings.templates_dir, template_filename)
-        shutil.copy2(temp_path, template_path)
+        template_filename, _ = await template_store.add(db, buffer, content_hash)
+        template_path = template_store.path(content_hash)
+        if not os.path.exists(artifact_path(template_path)):
+            await asyncio.to_thread(save_artifact, artifact, template_path)
 
         # Generate template name from filename or AI
         original_name = message.document.file_name or "Шаблон"
@@ -100,6 +138,7 @@ async def handle_docx_upload(
             template_name=template_name,
             filename=template_filename,
             fields=fields,
+            content_hash=content_hash,
         )
 
         # Format response
@@ -111,6 +150,11 @@ async def handle_docx_upload(
             f"Для управления шаблонами: /mytemplates"
         )
 
+    except FileTooLargeError:
+        await message.answer(
+            f"❌ Файл слишком большой после распаковки "
+            f"(больше {settings.template_max_file_mb * MAX_UNCOMPRESSED_RATIO} МБ)."
+        )
     except Exception:
         logger.exception("Template upload failed")
         await message.answer(
@@ -118,7 +162,4 @@ async def handle_docx_upload(
             "Убедитесь, что файл — корректный .docx документ."
         )
     finally:
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
+        buffer.close()
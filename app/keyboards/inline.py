@@ -1,5 +1,7 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from app.services.field_schema import TemplateSchema
+
 
 def build_template_keyboard(
     global_templates: list[dict],
@@ -90,14 +92,14 @@ def build_confirm_keyboard() -> InlineKeyboardMarkup:
     )
 
 
-def build_edit_fields_keyboard(fields: list[dict]) -> InlineKeyboardMarkup:
+def build_edit_fields_keyboard(schema: TemplateSchema) -> InlineKeyboardMarkup:
     buttons = []
     row = []
-    for i, field in enumerate(fields):
+    for field in schema:
         row.append(
             InlineKeyboardButton(
-                text=field["label"],
-                callback_data=f"editfield:{i}",
+                text=field.label,
+                callback_data=f"editfield:{field.index}",
             )
         )
         if len(row) == 2:
@@ -164,3 +166,16 @@ def build_after_generation_keyboard() -> InlineKeyboardMarkup:
             ],
         ]
     )
+
+
+def build_history_keyboard(docs: list[dict]) -> InlineKeyboardMarkup:
+    buttons = [
+        [
+            InlineKeyboardButton(
+                text=f"📤 {i}. {doc['template_name']}",
+                callback_data=f"resend:{doc['id']}",
+            )
+        ]
+        for i, doc in enumerate(docs, 1)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
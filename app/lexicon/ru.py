@@ -16,16 +16,29 @@ LEXICON_RU = {
         "📎 Отправьте .docx с {{ плейсхолдерами }} — создам шаблон.\n"
         "💬 Или просто задайте вопрос — отвечу с помощью AI."
     ),
+    "greeting": "👋 Привет! Нажмите «📝 Новый документ», чтобы начать, или задайте вопрос.",
+    "thanks": "Пожалуйста! Обращайтесь 🙂",
+    "faq_template": (
+        "📎 Как добавить свой шаблон\n\n"
+        "1. Откройте .docx в Word\n"
+        "2. Замените изменяемые данные на плейсхолдеры: {{ executor_name }}, {{ amount }}\n"
+        "3. Отправьте файл мне — я создам шаблон\n\n"
+        "Ваши шаблоны: /mytemplates"
+    ),
     "cancelled": "❌ Действие отменено.",
     "nothing_to_cancel": "Нет активного действия для отмены.",
     "choose_template": "📁 Выберите тип документа:",
     "confirm_data": "📋 {template_name}\n\n{summary}\n\nВсё верно?",
     "generating": "⏳ Генерирую документ...",
+    "generating_queued": "⏳ Документ в очереди, вы {position}-й. Подождите немного...",
+    "generation_busy": "⚠️ Сейчас слишком много запросов. Попробуйте через минуту.",
     "document_ready": "✅ Готово!\n\n📄 {template_name}\n{details}",
     "generation_error": "⚠️ Ошибка при генерации документа. Попробуйте ещё раз.",
     "no_templates": "Шаблоны пока не добавлены.",
     "no_history": "📋 У вас пока нет созданных документов.",
     "history_header": "📋 Ваши документы:\n\n",
+    "history_resend_hint": "\n\nНажмите на документ, чтобы получить его ещё раз.",
+    "resend_not_found": "Документ не найден",
     "validation_error": "⚠️ {hint}\nВы ввели: {value}\n\nПопробуйте ещё раз:",
     "validation_error_simple": "⚠️ Ошибка: {error}\nПопробуйте ещё раз:",
     "confirm_yes": "✅ Создать документ",
@@ -56,12 +69,39 @@ LEXICON_RU = {
         "⚠️ Ошибка при извлечении реквизитов.\n"
         "Попробуйте другой файл или введите данные вручную."
     ),
+    "requisite_too_large": (
+        "⚠️ Файл слишком большой (больше {limit} МБ).\n"
+        "Отправьте карточку предприятия меньшего размера или введите данные вручную."
+    ),
+    "requisite_timeout": (
+        "⚠️ Файл обрабатывается слишком долго.\n"
+        "Попробуйте другой файл или введите данные вручную."
+    ),
+    "requisite_ai_unavailable": (
+        "⚠️ AI-сервис сейчас недоступен, реквизиты не распознаны.\n"
+        "Попробуйте через пару минут или введите данные вручную."
+    ),
+    "ai_unavailable": "⚠️ AI-сервис сейчас перегружен или недоступен. Попробуйте через пару минут.",
     "requisite_upload_hint": "\n\n📎 Или отправьте карточку предприятия (.docx / .pdf)",
     "requisites_not_set": (
         "🏢 Для быстрого создания документов настройте свои реквизиты.\n\n"
         "Нажмите «🏢 Мои реквизиты» и отправьте карточку предприятия — "
         "я запомню данные и буду подставлять их автоматически."
     ),
+    "bulk_fill_hint": (
+        "💡 Можно не отвечать на вопросы по одному: пришлите или перешлите "
+        "одним сообщением всё, что известно о сделке (реквизиты, суммы, даты), "
+        "— я заполню поля сам и спрошу только недостающее."
+    ),
+    "bulk_analyzing": "🔎 Разбираю данные...",
+    "bulk_filled": "📋 Заполнено из сообщения:\n\n{summary}",
+    "bulk_invalid": "\n\n⚠️ Не подошли по формату, спрошу отдельно:\n{invalid}",
+    "bulk_remaining": "\n\nОсталось заполнить {remaining} полей.",
+    "bulk_no_match": (
+        "⚠️ Не нашёл в сообщении данных для полей шаблона.\n"
+        "Ответьте на текущий вопрос или пришлите данные подробнее."
+    ),
+    "bulk_error": "⚠️ Не удалось разобрать сообщение. Ответьте на текущий вопрос:",
     "executor_auto_filled": (
         "🏢 Ваши реквизиты подставлены автоматически ({count} полей).\n"
     ),
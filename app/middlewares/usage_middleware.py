@@ -0,0 +1,23 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.services.llm_usage import llm_user
+
+
+class UsageContextMiddleware(BaseMiddleware):
+    """Attributes LLM calls made while handling an update to its user."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        token = llm_user.set(user.id if user else None)
+        try:
+            return await handler(event, data)
+        finally:
+            llm_user.reset(token)
@@ -1,12 +1,17 @@
+import asyncio
 import os
 import re
+import threading
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 
 from docxtpl import DocxTemplate
 from num2words import num2words
 
+from app.services.template_compiler import CompiledTemplate, load_artifact
+
 
 def _format_money(amount_str: str) -> str:
     """Format money: '45000' -> '45 000 (сорок пять тысяч) рублей 00 копеек'."""
@@ -38,10 +43,16 @@ def _format_days(days_str: str) -> str:
 
 
 class DocumentService:
+    # How many precompiled templates to keep materialized in memory
+    COMPILED_CACHE_SIZE = 128
+
     def __init__(self, templates_dir: str, output_dir: str):
         self.templates_dir = Path(templates_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._compiled: OrderedDict[str, CompiledTemplate | None] = OrderedDict()
+        # Renders run in worker threads; the LRU is shared between them
+        self._compiled_lock = threading.Lock()
 
     async def generate_document(
         self,
@@ -49,13 +60,26 @@ class DocumentService:
         context: dict,
         user_id: int,
     ) -> str:
-        """Generate a document from template and return docx_path."""
+        """Generate a document from template and return docx_path.
+
+        Rendering is blocking, so it runs in a worker thread.
+        """
+        return await asyncio.to_thread(
+            self._render, template_filename, context, user_id
+        )
+
+    def _render(self, template_filename: str, context: dict, user_id: int) -> str:
         template_path = self.templates_dir / template_filename
-        doc = DocxTemplate(str(template_path))
+        compiled = self._get_compiled(template_path)
+        if compiled:
+            doc = compiled.build(template_path)
+        else:
+            doc = DocxTemplate(str(template_path))
 
-        # Add auto-generated fields
-        context["generation_date"] = datetime.now().strftime("%d.%m.%Y")
-        context["document_number"] = self._generate_doc_number()
+        # Work on a copy: the caller stores the raw values so the document
+        # can be re-rendered later from generated_documents.context_json.
+        # A stamped context keeps its number and date on re-render.
+        context = self.stamp(context)
 
         # Extract short name from full company name if not already set
         if "customer_short_name" not in context or not context.get("customer_short_name"):
@@ -107,6 +131,35 @@ class DocumentService:
 
         return str(docx_path)
 
+    def _get_compiled(self, template_path: Path) -> CompiledTemplate | None:
+        """Return the precompiled form of a template, if it has an artifact."""
+        key = str(template_path)
+        with self._compiled_lock:
+            if key in self._compiled:
+                self._compiled.move_to_end(key)
+                return self._compiled[key]
+
+        # Loaded outside the lock; two threads may build the same entry once
+        artifact = load_artifact(template_path, recompile=True)
+        compiled = CompiledTemplate(artifact) if artifact else None
+        with self._compiled_lock:
+            self._compiled[key] = compiled
+            self._compiled.move_to_end(key)
+            if len(self._compiled) > self.COMPILED_CACHE_SIZE:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def stamp(self, context: dict) -> dict:
+        """Copy of context with generation_date and document_number set,
+        unless it already has them. Store the stamped context so re-sending
+        the document reproduces the number and date the user received."""
+        context = dict(context)
+        if not context.get("generation_date"):
+            context["generation_date"] = datetime.now().strftime("%d.%m.%Y")
+        if not context.get("document_number"):
+            context["document_number"] = self._generate_doc_number()
+        return context
+
     def cleanup_files(self, *paths: str) -> None:
         for path in paths:
             try:
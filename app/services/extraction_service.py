@@ -0,0 +1,146 @@
+"""Run requisite text extraction in a process pool.
+
+PyMuPDF and python-docx parsing is CPU-bound and holds the GIL, so it runs in
+worker processes; the event loop only awaits the result. Size, page and time
+limits keep one large upload from tying up a worker indefinitely.
+
+PDFs are read by priority: the first and last page first, then the remaining
+pages in batches spread over the workers, stopping as soon as the key
+requisites have been found.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.services.requisite_parser import (
+    extract_pdf_pages,
+    extract_text,
+    has_key_requisites,
+    join_pdf_pages,
+    pdf_page_count,
+    pdf_page_order,
+)
+from app.services.uploads import FileTooLargeError
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionError(Exception):
+    """Base class for extraction failures the user should be told about."""
+
+
+class ExtractionTimeoutError(ExtractionError):
+    pass
+
+
+class ExtractionService:
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_pages: int = 50,
+        timeout: float = 30.0,
+    ):
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self._pool: ProcessPoolExecutor | None = None
+        # Extractions in flight per pool, and pools retired after a timeout
+        # that are killed once their other extractions have finished
+        self._active: dict[ProcessPoolExecutor, int] = {}
+        self._draining: set[ProcessPoolExecutor] = set()
+
+    def check_size(self, size: int | None) -> None:
+        """Reject files over the limit before they are downloaded."""
+        if size is not None and size > self.max_bytes:
+            raise FileTooLargeError(size)
+
+    async def extract(self, data: bytes, is_pdf: bool) -> str:
+        """Extract text from .pdf or .docx contents in a worker process."""
+        self.check_size(len(data))
+
+        pool = self._get_pool()
+        self._active[pool] = self._active.get(pool, 0) + 1
+        try:
+            if is_pdf:
+                return await asyncio.wait_for(self._extract_pdf(pool, data), self.timeout)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(pool, extract_text, data, False)
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            # A running task can't be cancelled: new extractions go to a fresh
+            # pool, and this one is killed once the others in it have finished
+            logger.warning("Text extraction timed out after %.0fs", self.timeout)
+            self._retire_pool(pool)
+            raise ExtractionTimeoutError(len(data))
+        except BrokenProcessPool:
+            logger.exception("Extraction worker died, restarting pool")
+            self._retire_pool(pool)
+            raise
+        finally:
+            self._active[pool] -= 1
+            if not self._active[pool]:
+                del self._active[pool]
+                if pool in self._draining:
+                    self._draining.discard(pool)
+                    self._kill_pool(pool)
+
+    async def _extract_pdf(self, pool: ProcessPoolExecutor, data: bytes) -> str:
+        loop = asyncio.get_running_loop()
+        page_count = await loop.run_in_executor(pool, pdf_page_count, data)
+        order = pdf_page_order(page_count, self.max_pages)
+
+        # Requisites usually sit on the first or last page
+        head, rest = order[:2], order[2:]
+        texts = await loop.run_in_executor(pool, extract_pdf_pages, data, head)
+        if not rest or has_key_requisites(texts):
+            return join_pdf_pages(texts)
+
+        # Every batch ships the whole file to a worker, so keep the count small
+        batch_count = min(len(rest), self.max_workers * 2)
+        size = -(-len(rest) // batch_count)
+        futures = [
+            loop.run_in_executor(pool, extract_pdf_pages, data, rest[i:i + size])
+            for i in range(0, len(rest), size)
+        ]
+        try:
+            for next_done in asyncio.as_completed(futures):
+                texts.update(await next_done)
+                if has_key_requisites(texts):
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+        return join_pdf_pages(texts)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        for pool in self._draining:
+            self._kill_pool(pool)
+        self._draining.clear()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _retire_pool(self, pool: ProcessPoolExecutor) -> None:
+        if self._pool is pool:
+            self._pool = None
+        self._draining.add(pool)
+
+    @staticmethod
+    def _kill_pool(pool: ProcessPoolExecutor) -> None:
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
@@ -0,0 +1,125 @@
+"""Compiled field schemas for document templates.
+
+Template fields arrive as loose dicts (template_meta.json, user templates).
+They are parsed once into compact slot objects with precompiled validators,
+so per-message handlers only do attribute lookups.
+"""
+
+import hashlib
+import json
+import re
+import sys
+from datetime import datetime
+
+# Inputs accepted as "today" for date fields with "default": "today"
+_TODAY_WORDS = frozenset(("сегодня", "today", ""))
+
+DEFAULT_GROUP_TITLE = "Данные"
+
+
+class FieldSchema:
+    __slots__ = (
+        "index",
+        "key",
+        "label",
+        "prompt_ru",
+        "hint",
+        "type",
+        "required",
+        "validator",
+        "validation_hint",
+        "default_today",
+        "auto",
+        "auto_value",
+        "group",
+        "group_index",
+        "starts_group",
+    )
+
+    def __init__(self, index: int, raw: dict, group_index: int, starts_group: bool):
+        self.index = index
+        self.key = sys.intern(raw["key"])
+        self.label = raw.get("label") or raw["key"]
+        self.prompt_ru = raw.get("prompt_ru") or f"Введите {raw['key']}:"
+        self.hint = raw.get("hint", "")
+        self.type = sys.intern(raw.get("type", "string"))
+        self.required = bool(raw.get("required", True))
+        pattern = raw.get("validation")
+        self.validator = re.compile(pattern) if pattern else None
+        self.validation_hint = raw.get("validation_hint")
+        self.default_today = raw.get("default") == "today"
+        self.auto = raw.get("auto")
+        self.auto_value = raw.get("auto_value")
+        self.group = sys.intern(raw.get("group", ""))
+        self.group_index = group_index
+        self.starts_group = starts_group
+
+    @property
+    def optional(self) -> bool:
+        return not self.required
+
+    def apply_default(self, value: str) -> str:
+        """Substitute today's date for «сегодня»/empty input on date fields."""
+        if self.default_today and self.type == "date" and value.lower() in _TODAY_WORDS:
+            return datetime.now().strftime("%d.%m.%Y")
+        return value
+
+    def validate(self, value: str) -> str | None:
+        """Return an error message, or None if the value is valid."""
+        value = value.strip()
+        if not value:
+            if self.required:
+                return f"Поле «{self.label}» обязательно для заполнения."
+            return None  # optional field, empty is OK
+        if self.validator is not None and not self.validator.match(value):
+            return f"Неверный формат для «{self.label}»."
+        return None
+
+
+class TemplateSchema:
+    """Ordered, indexed set of FieldSchema for one template version."""
+
+    __slots__ = ("schema_id", "fields", "keys", "groups", "_positions")
+
+    def __init__(self, schema_id: str, fields: list[dict]):
+        self.schema_id = schema_id
+        group_ids: dict[str, int] = {}
+        compiled = []
+        prev_group = None
+        for i, raw in enumerate(fields):
+            group = raw.get("group", "")
+            group_index = group_ids.setdefault(group, len(group_ids))
+            compiled.append(FieldSchema(i, raw, group_index, group != prev_group))
+            prev_group = group
+        self.fields: tuple[FieldSchema, ...] = tuple(compiled)
+        self.keys: tuple[str, ...] = tuple(f.key for f in compiled)
+        # (group title, field indices) in order of first appearance
+        members: list[list[int]] = [[] for _ in group_ids]
+        for f in compiled:
+            members[f.group_index].append(f.index)
+        self.groups: tuple[tuple[str, tuple[int, ...]], ...] = tuple(
+            (name or DEFAULT_GROUP_TITLE, tuple(members[gid]))
+            for name, gid in group_ids.items()
+        )
+        self._positions = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __getitem__(self, index: int) -> FieldSchema:
+        return self.fields[index]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def index_of(self, key: str) -> int | None:
+        return self._positions.get(key)
+
+
+def schema_id_for(fields: list[dict]) -> str:
+    canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def compile_schema(fields: list[dict]) -> TemplateSchema:
+    return TemplateSchema(schema_id_for(fields), fields)
@@ -0,0 +1,46 @@
+"""Background tasks that belong to a user's document flow.
+
+asyncio tasks can't live in FSM data, so they are kept here by
+(user_id, name) and cancelled whenever the flow goes back or is cancelled.
+"""
+
+import asyncio
+import logging
+from typing import Coroutine
+
+logger = logging.getLogger(__name__)
+
+
+class FlowTasks:
+    def __init__(self):
+        self._tasks: dict[tuple[int, str], asyncio.Task] = {}
+
+    def start(self, user_id: int, name: str, coro: Coroutine) -> asyncio.Task:
+        """Run coro in the background, replacing (and cancelling) a task of the same name."""
+        self.cancel(user_id, name)
+        task = asyncio.create_task(coro)
+        self._tasks[(user_id, name)] = task
+        task.add_done_callback(_retrieve_exception)
+        return task
+
+    def pop(self, user_id: int, name: str) -> asyncio.Task | None:
+        """Take ownership of a task (finished or not); the caller awaits it."""
+        return self._tasks.pop((user_id, name), None)
+
+    def cancel(self, user_id: int, name: str | None = None) -> None:
+        """Cancel one named task, or all tasks of the user when name is None."""
+        if name is not None:
+            keys = [(user_id, name)]
+        else:
+            keys = [key for key in self._tasks if key[0] == user_id]
+        for key in keys:
+            task = self._tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    # Marks the exception as retrieved so an abandoned task doesn't warn;
+    # whoever awaits the task still gets it
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug("Flow task failed: %r", task.exception())
@@ -0,0 +1,166 @@
+"""Admission control for document generation.
+
+Limits how many renders run at once (globally and per user), keeps a bounded
+queue of waiting jobs and serves users round-robin, so one user submitting a
+batch cannot starve everyone else.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SchedulerBusyError(Exception):
+    """Raised immediately when the generation queue is full."""
+
+
+class _Job:
+    __slots__ = ("user_id", "started", "position", "wakeup")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.started = False
+        self.position = 0
+        self.wakeup = asyncio.Event()
+
+
+class GenerationScheduler:
+    def __init__(
+        self,
+        max_concurrent: int = 4,
+        max_queue: int = 50,
+        per_user_limit: int = 1,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+        self._running: dict[int, int] = {}
+        self._running_total = 0
+        # user_id -> pending jobs; key order is the round-robin rotation
+        self._pending: OrderedDict[int, deque[_Job]] = OrderedDict()
+        self._pending_total = 0
+
+    @property
+    def queued(self) -> int:
+        return self._pending_total
+
+    @property
+    def running(self) -> int:
+        return self._running_total
+
+    async def run(
+        self,
+        user_id: int,
+        job: Callable[[], Awaitable[T]],
+        on_position: Callable[[int], Awaitable[None]] | None = None,
+    ) -> T:
+        """Run job under the limits, waiting in the queue if needed.
+
+        on_position is awaited with the 1-based queue position each time it
+        changes while the job waits. Raises SchedulerBusyError without waiting
+        when the queue is full.
+        """
+        entry = self._submit(user_id)
+        try:
+            reported = None
+            while not entry.started:
+                if on_position is not None and entry.position != reported:
+                    reported = entry.position
+                    await on_position(reported)
+                await entry.wakeup.wait()
+                entry.wakeup.clear()
+        except BaseException:
+            if not entry.started:
+                self._discard(entry)
+            else:
+                self._release(user_id)
+            raise
+
+        try:
+            return await job()
+        finally:
+            self._release(user_id)
+
+    def _submit(self, user_id: int) -> _Job:
+        entry = _Job(user_id)
+        # _dispatch keeps every pending job blocked, so a job that can start
+        # right away does not jump ahead of anyone eligible
+        if self._can_start(user_id):
+            self._start(entry)
+            return entry
+        if self._pending_total >= self.max_queue:
+            raise SchedulerBusyError()
+        self._pending.setdefault(user_id, deque()).append(entry)
+        self._pending_total += 1
+        self._update_positions()
+        return entry
+
+    def _can_start(self, user_id: int) -> bool:
+        return (
+            self._running_total < self.max_concurrent
+            and self._running.get(user_id, 0) < self.per_user_limit
+        )
+
+    def _start(self, entry: _Job) -> None:
+        entry.started = True
+        self._running[entry.user_id] = self._running.get(entry.user_id, 0) + 1
+        self._running_total += 1
+        entry.wakeup.set()
+
+    def _release(self, user_id: int) -> None:
+        count = self._running.get(user_id, 0) - 1
+        if count > 0:
+            self._running[user_id] = count
+        else:
+            self._running.pop(user_id, None)
+        self._running_total -= 1
+        self._dispatch()
+
+    def _discard(self, entry: _Job) -> None:
+        jobs = self._pending.get(entry.user_id)
+        if jobs and entry in jobs:
+            jobs.remove(entry)
+            self._pending_total -= 1
+            if not jobs:
+                del self._pending[entry.user_id]
+        self._update_positions()
+
+    def _dispatch(self) -> None:
+        """Start eligible jobs round-robin across users, then refresh positions."""
+        progressed = True
+        while progressed and self._running_total < self.max_concurrent:
+            progressed = False
+            for user_id in list(self._pending):
+                if not self._can_start(user_id):
+                    continue
+                jobs = self._pending[user_id]
+                entry = jobs.popleft()
+                self._pending_total -= 1
+                # Served users go to the back of the rotation
+                del self._pending[user_id]
+                if jobs:
+                    self._pending[user_id] = jobs
+                self._start(entry)
+                progressed = True
+                break
+        self._update_positions()
+
+    def _update_positions(self) -> None:
+        # Expected start order: one job per user per round, in rotation order
+        position = 0
+        depth = 0
+        while True:
+            found = False
+            for jobs in self._pending.values():
+                if depth < len(jobs):
+                    found = True
+                    position += 1
+                    entry = jobs[depth]
+                    if entry.position != position:
+                        entry.position = position
+                        entry.wakeup.set()
+            if not found:
+                break
+            depth += 1
@@ -0,0 +1,174 @@
+"""Genitive forms of business types for "карточка [ТИП] Заказчика".
+
+Resolved locally in this order:
+1. the override table: DOMAIN_GENITIVES (phrases the document words
+   differently, e.g. стоматология -> стоматологической клиники) merged
+   with forms learned from the LLM, stored in genitive_overrides;
+2. morphology of the head phrase: leading adjectives and the first noun
+   are inflected, dependent words ("салон красоты") are kept. Nouns are
+   inflected with pymorphy3 and its Russian dictionary (requirements.txt);
+   suffix rules for the regular patterns are the fallback for words the
+   dictionary can't parse, or if the package is missing;
+3. the LLM, whose answer is learned into the override table so the same
+   phrase is local next time.
+"""
+
+import logging
+import re
+
+import aiosqlite
+
+from app.database.repositories.genitive_repo import (
+    get_genitive_overrides,
+    save_genitive_override,
+)
+from app.services.llm_cache import normalize_input
+from app.services.openai_service import OpenAIService
+
+try:
+    import pymorphy3
+except ImportError:
+    pymorphy3 = None
+
+logger = logging.getLogger(__name__)
+
+DOMAIN_GENITIVES = {
+    "стоматология": "стоматологической клиники",
+    "ветеринария": "ветеринарной клиники",
+    "косметология": "косметологического кабинета",
+    "массаж": "массажного салона",
+    "маникюр": "маникюрного салона",
+    "фитнес": "фитнес-клуба",
+    "шиномонтаж": "шиномонтажа",
+    "кафе": "кафе",
+    # Common types the suffix rules leave to the LLM
+    "отель": "отеля",
+    "столовая": "столовой",
+    "рынок": "рынка",
+    "магазинчик": "магазинчика",
+}
+
+# Longest learned answer accepted; longer means the model explained itself
+MAX_LEARNED_LENGTH = 80
+
+_WORD_RE = re.compile(r"^[а-яё]+(?:-[а-яё]+)*$")
+_VOWELS = "аеёиоуыэюя"
+_HUSHING = "гкхжчшщ"  # after these, -ы becomes -и
+
+_morph = pymorphy3.MorphAnalyzer() if pymorphy3 is not None else None
+
+
+class GenitiveService:
+    def __init__(self, db_path: str, openai_service: OpenAIService):
+        self.db_path = db_path
+        self.openai_service = openai_service
+        self._overrides = dict(DOMAIN_GENITIVES)
+
+    async def load(self) -> None:
+        """Merge learned forms from SQLite into the override table."""
+        async with aiosqlite.connect(self.db_path) as db:
+            self._overrides.update(await get_genitive_overrides(db))
+
+    def local(self, business_type: str) -> str | None:
+        """Genitive form without the LLM, or None if the phrase is unknown."""
+        phrase = normalize_input(business_type)
+        if phrase in self._overrides:
+            return self._overrides[phrase]
+        return inflect_phrase(phrase)
+
+    async def convert(self, business_type: str) -> str:
+        genitive = self.local(business_type)
+        if genitive is not None:
+            return genitive
+
+        genitive = await self.openai_service.convert_business_type_genitive(business_type)
+        genitive = genitive.strip().strip("«»\"'.")
+        if genitive and "\n" not in genitive and len(genitive) <= MAX_LEARNED_LENGTH:
+            phrase = normalize_input(business_type)
+            self._overrides[phrase] = genitive
+            try:
+                async with aiosqlite.connect(self.db_path) as db:
+                    await save_genitive_override(db, phrase, genitive)
+            except Exception:
+                logger.exception("Failed to save learned genitive form")
+        return genitive
+
+
+def inflect_phrase(phrase: str) -> str | None:
+    """Genitive of a lowercase phrase: leading adjectives and the head noun
+    are inflected, the words after the head noun are kept."""
+    words = phrase.split()
+    if not words or not all(_WORD_RE.match(w) for w in words):
+        return None
+
+    result = []
+    for i, word in enumerate(words):
+        adjective = _adjective_genitive(word)
+        if adjective is not None and i < len(words) - 1:
+            result.append(adjective)
+            continue
+        noun = _noun_genitive(word)
+        if noun is None:
+            return None
+        return " ".join(result + [noun] + words[i + 1:])
+    return None
+
+
+def _adjective_genitive(word: str) -> str | None:
+    if len(word) < 4:
+        return None
+    stem, ending = word[:-2], word[-2:]
+    if ending in ("ый", "ой"):
+        return stem + "ого"
+    if ending == "ий":
+        return stem + ("ого" if stem[-1] in "гкх" else "его")
+    if ending == "ая":
+        return stem + "ой"
+    if ending == "яя":
+        return stem + "ей"
+    if ending == "ое":
+        return stem + "ого"
+    if ending == "ее":
+        return stem + "его"
+    return None
+
+
+def _noun_genitive(word: str) -> str | None:
+    if "-" in word:
+        head, _, last = word.rpartition("-")
+        inflected = _noun_genitive(last)
+        return f"{head}-{inflected}" if inflected is not None else None
+
+    if _morph is not None:
+        # The likeliest nominative noun reading ("рынок" is parsed as accs first)
+        parse = next(
+            (p for p in _morph.parse(word) if {"NOUN", "nomn"} <= p.tag.grammemes), None
+        )
+        if parse is not None:
+            inflected = parse.inflect({"gent"})
+            if inflected is not None:
+                return inflected.word
+
+    # Substantivized adjectives: парикмахерская, булочная
+    if word.endswith(("ская", "ная")):
+        return word[:-2] + "ой"
+    if word.endswith("ия"):
+        return word[:-1] + "и"
+    if word.endswith("ие"):
+        return word[:-1] + "я"
+    if word.endswith("ство"):
+        return word[:-1] + "а"
+    if word.endswith("а"):
+        return word[:-1] + ("и" if word[-2] in _HUSHING else "ы")
+    if word.endswith("я") and word[-2] not in _VOWELS:
+        return word[:-1] + "и"
+    if word.endswith("й") and word[-2] in _VOWELS:
+        return word[:-1] + "я"
+    if word.endswith("е") and word[-2] not in _VOWELS:
+        return word  # loanwords in -е do not decline: кафе, ателье, пюре
+    if word.endswith(("ок", "ек", "ец")):
+        return None  # the vowel may drop (рынок -> рынка) or not (урок -> урока)
+    if word[-1] not in _VOWELS and word[-1] not in "ьъй":
+        return word + "а"
+    # -ь (конь / сталь), -о, -у, -и, -ю: gender or declinability unknown
+    return None
@@ -0,0 +1,100 @@
+"""Local intent detection for messages that reach the catch-all chat.
+
+Short messages that are really a menu action ("как создать договор",
+"помощь", a mistyped button label) are recognized here and handled without
+the LLM. Anything with content the rules can't account for returns None
+and goes to the AI chat as before.
+"""
+
+import difflib
+import re
+
+from app.keyboards.reply import (
+    BTN_CANCEL,
+    BTN_HELP,
+    BTN_HISTORY,
+    BTN_MY_REQUISITES,
+    BTN_MY_TEMPLATES,
+    BTN_NEW_DOC,
+)
+
+# Longer messages are open questions, not menu actions
+MAX_INTENT_WORDS = 6
+# Words of a message that no rule explains; more than this goes to the LLM
+MAX_UNEXPLAINED_WORDS = 1
+# Similarity needed to treat a message as a mistyped button label or command
+LABEL_CUTOFF = 0.8
+
+_LABELS = {
+    BTN_NEW_DOC: "newdoc",
+    BTN_MY_TEMPLATES: "mytemplates",
+    BTN_MY_REQUISITES: "myrequisites",
+    BTN_HISTORY: "history",
+    BTN_HELP: "help",
+    BTN_CANCEL: "cancel",
+}
+_COMMANDS = ("newdoc", "mytemplates", "myrequisites", "history", "help", "cancel")
+
+# (intent, word stem groups; every group must match a word), first match wins
+_KEYWORD_INTENTS: tuple[tuple[str, tuple[tuple[str, ...], ...]], ...] = (
+    ("mytemplates", (("мои", "моих", "список", "покажи"), ("шаблон",))),
+    ("faq_template", (("шаблон",), ("загруз", "добав", "созда", "сдела", "сво", "как"))),
+    ("newdoc", (
+        ("созда", "сдела", "состав", "оформ", "нов", "нуж", "хочу", "сгенер"),
+        ("договор", "счет", "акт", "документ"),
+    )),
+    ("myrequisites", (("реквизит",),)),
+    ("history", (("истори",),)),
+    ("help", (("помощ", "помоги", "help", "умеешь", "инструкц", "справк", "пользоват"),)),
+    ("greeting", (("привет", "здравствуй", "добр", "hello", "хай", "салют"),)),
+    ("thanks", (("спасибо", "благодар", "спс"),)),
+    ("cancel", (("отмен", "стоп"),)),
+)
+
+# Words that carry no meaning of their own in a request
+_FILLER = {
+    "а", "и", "в", "на", "с", "мне", "я", "ты", "как", "где", "можно", "пожалуйста",
+    "плиз", "бот", "день", "утро", "вечер", "же", "ли", "еще", "тут", "здесь",
+}
+
+_NON_WORD_RE = re.compile(r"[^\w\s-]+")
+
+
+def classify_intent(text: str) -> str | None:
+    """Intent name for a chat message, or None if it needs the LLM."""
+    normalized = _normalize(text)
+    if not normalized:
+        return None
+
+    if normalized in _LABEL_INTENTS:
+        return _LABEL_INTENTS[normalized]
+    match = difflib.get_close_matches(normalized, _LABEL_INTENTS, n=1, cutoff=LABEL_CUTOFF)
+    if match:
+        return _LABEL_INTENTS[match[0]]
+
+    words = normalized.split()
+    if len(words) > MAX_INTENT_WORDS:
+        return None
+    for intent, groups in _KEYWORD_INTENTS:
+        matched = set()
+        for group in groups:
+            hits = {w for w in words if w.startswith(group)}
+            if not hits:
+                break
+            matched |= hits
+        else:
+            unexplained = [w for w in words if w not in matched and w not in _FILLER]
+            if len(unexplained) <= MAX_UNEXPLAINED_WORDS:
+                return intent
+            return None
+    return None
+
+
+def _normalize(text: str) -> str:
+    text = _NON_WORD_RE.sub(" ", text.lower().replace("ё", "е"))
+    return " ".join(text.split())
+
+
+# Normalized button labels and command names -> intent
+_LABEL_INTENTS = {_normalize(label): intent for label, intent in _LABELS.items()}
+_LABEL_INTENTS.update({command: command for command in _COMMANDS})
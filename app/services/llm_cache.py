@@ -0,0 +1,195 @@
+"""Two-level cache for LLM responses that depend only on a short input.
+
+Level one is an in-process LRU, level two a SQLite table shared across
+restarts. Keys combine the prompt kind and version, the model and the
+normalized input, so changing a prompt or model never serves stale answers.
+"""
+
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import aiosqlite
+
+from app.database.repositories.llm_cache_repo import (
+    delete_expired_llm_cache,
+    get_llm_cache,
+    get_llm_cache_many,
+    save_llm_cache,
+    save_llm_cache_many,
+)
+
+logger = logging.getLogger(__name__)
+
+# Expired rows are deleted every this many writes
+PRUNE_EVERY = 100
+
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_input(text: str) -> str:
+    return _SPACES_RE.sub(" ", text.strip().lower().replace("ё", "е"))
+
+
+class _KindStats:
+    __slots__ = ("memory_hits", "db_hits", "misses", "saved", "bypassed")
+
+    def __init__(self):
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved = 0.0  # seconds of LLM latency avoided by hits
+
+
+class LLMCache:
+    def __init__(self, db_path: str, ttl: int = 30 * 86400, max_memory_entries: int = 512):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        # key -> (response, latency, expires_at on the monotonic clock)
+        self._memory: OrderedDict[str, tuple[str, float, float]] = OrderedDict()
+        self._stats: dict[str, _KindStats] = {}
+        self._writes = 0
+
+    @staticmethod
+    def make_key(kind: str, version: int, model: str, text: str, variant: str = "") -> str:
+        raw = f"{kind}\x00{version}\x00{model}\x00{variant}\x00{normalize_input(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_call(
+        self,
+        kind: str,
+        version: int,
+        model: str,
+        text: str,
+        call: Callable[[], Awaitable[str]],
+        refresh: bool = False,
+        variant: str = "",
+    ) -> str:
+        """Return the cached response, or await call() and cache its result.
+
+        variant distinguishes calls with the same input but other parameters.
+        refresh=True skips the lookup (the user asked for a new answer) but
+        still stores the fresh response.
+        """
+        stats = self._stats.setdefault(kind, _KindStats())
+        key = self.make_key(kind, version, model, text, variant)
+
+        if refresh:
+            stats.bypassed += 1
+        else:
+            hit = self._memory_get(key)
+            if hit is not None:
+                stats.memory_hits += 1
+                stats.saved += hit[1]
+                return hit[0]
+            try:
+                async with aiosqlite.connect(self.db_path) as db:
+                    hit = await get_llm_cache(db, key, self.ttl)
+            except Exception:
+                logger.exception("LLM cache read failed")
+                hit = None
+            if hit is not None:
+                stats.db_hits += 1
+                stats.saved += hit[1]
+                self._memory_put(key, hit[0], hit[1])
+                return hit[0]
+            stats.misses += 1
+
+        started = time.monotonic()
+        response = await call()
+        latency = time.monotonic() - started
+
+        self._memory_put(key, response, latency)
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await save_llm_cache(db, key, kind, response, latency)
+                self._writes += 1
+                if self._writes % PRUNE_EVERY == 0:
+                    await delete_expired_llm_cache(db, self.ttl)
+        except Exception:
+            logger.exception("LLM cache write failed")
+        return response
+
+    async def get_many(
+        self, kind: str, version: int, model: str, texts: list[str]
+    ) -> dict[str, str]:
+        """Cached responses for the texts that have one, keyed by text.
+
+        For responses cached per item but produced in batches (put_many).
+        """
+        stats = self._stats.setdefault(kind, _KindStats())
+        keys = {self.make_key(kind, version, model, text): text for text in texts}
+        result = {}
+        for key, text in keys.items():
+            hit = self._memory_get(key)
+            if hit is not None:
+                stats.memory_hits += 1
+                stats.saved += hit[1]
+                result[text] = hit[0]
+
+        pending = [key for key, text in keys.items() if text not in result]
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                rows = await get_llm_cache_many(db, pending, self.ttl)
+        except Exception:
+            logger.exception("LLM cache read failed")
+            rows = {}
+        for key, (response, latency) in rows.items():
+            stats.db_hits += 1
+            stats.saved += latency
+            self._memory_put(key, response, latency)
+            result[keys[key]] = response
+        stats.misses += len(keys) - len(result)
+        return result
+
+    async def put_many(
+        self, kind: str, version: int, model: str, responses: dict[str, str], latency: float
+    ) -> None:
+        """Store one response per text; latency is that of the batch call."""
+        rows = []
+        for text, response in responses.items():
+            key = self.make_key(kind, version, model, text)
+            self._memory_put(key, response, latency)
+            rows.append((key, response, latency))
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await save_llm_cache_many(db, kind, rows)
+        except Exception:
+            logger.exception("LLM cache write failed")
+
+    def stats(self) -> dict[str, dict]:
+        """Per-kind counters: hits by level, misses, hit rate and seconds saved."""
+        result = {}
+        for kind, s in self._stats.items():
+            hits = s.memory_hits + s.db_hits
+            lookups = hits + s.misses
+            result[kind] = {
+                "memory_hits": s.memory_hits,
+                "db_hits": s.db_hits,
+                "misses": s.misses,
+                "bypassed": s.bypassed,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "saved_seconds": s.saved,
+            }
+        return result
+
+    def _memory_get(self, key: str) -> tuple[str, float] | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if entry[2] < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry[0], entry[1]
+
+    def _memory_put(self, key: str, response: str, latency: float) -> None:
+        self._memory[key] = (response, latency, time.monotonic() + self.ttl)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
@@ -0,0 +1,463 @@
+"""Chat completions client shared by all LLM calls.
+
+Wraps AsyncOpenAI with the policies the bot needs when the upstream slows
+down or fails:
+
+- per-method timeouts (a genitive form should not wait as long as labels);
+- a concurrency limit that grows while calls are fast and shrinks on
+  latency spikes, 429s and 5xx (AIMD), so slow upstream time is not spent
+  by a pile of coroutines each holding a DB connection;
+- retries on 429/5xx/timeouts with full-jitter exponential backoff,
+  honoring Retry-After;
+- a circuit breaker that fails fast with LLMUnavailableError after
+  repeated failures and lets a single trial call through after a cooldown;
+- optional hedging for selected methods: a call still running at the
+  method's observed p90 latency gets an identical second request, the first
+  answer wins and the other is cancelled. Hedges are capped to a fraction
+  of calls so the extra cost stays bounded.
+
+The SDK's own retries are disabled so these are the only ones. Point
+base_url at a local server to exercise the policies offline.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import openai
+from openai import AsyncOpenAI
+
+from app.services.llm_usage import LLMUsage
+from app.services.tokens import estimate_message_tokens, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    asyncio.TimeoutError,
+)
+# Errors that say the upstream is overloaded rather than broken
+OVERLOAD_ERRORS = (openai.RateLimitError, openai.APITimeoutError, asyncio.TimeoutError)
+
+BACKOFF_BASE = 0.5  # Seconds before the first retry (upper bound of the jitter)
+BACKOFF_CAP = 10.0
+# A Retry-After longer than this is not waited out; the call fails instead
+MAX_RETRY_AFTER = 30.0
+# A call slower than this multiple of its method's usual latency counts as congestion
+LATENCY_TOLERANCE = 2.0
+# Limit multipliers on 429s/timeouts and on merely slow answers; slow replicas
+# are common and should not collapse the limit the way real overload does
+OVERLOAD_BACKOFF = 0.7
+SLOW_BACKOFF = 0.9
+# Weight of the newest sample in the per-method latency average
+LATENCY_SMOOTHING = 0.1
+# Latencies kept per method for the hedging percentile
+LATENCY_WINDOW = 200
+# No hedging until a method has this many samples
+HEDGE_MIN_SAMPLES = 20
+HEDGE_PERCENTILE = 0.9
+
+
+class LLMUnavailableError(Exception):
+    """The upstream is unhealthy: the breaker is open or retries ran out."""
+
+
+class AdaptiveLimiter:
+    """Concurrency limit with additive increase, multiplicative decrease."""
+
+    def __init__(self, initial: int = 8, min_limit: int = 1, max_limit: int = 32):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(initial, max_limit))
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    self._wake()  # pass the wakeup on to the next waiter
+                raise
+        self.in_flight += 1
+
+    def release(self, congested: bool | None, backoff: float = OVERLOAD_BACKOFF) -> None:
+        """congested: True shrinks the limit by backoff, False grows it, None leaves it."""
+        self.in_flight -= 1
+        if congested:
+            self.limit = max(self.min_limit, self.limit * backoff)
+        elif congested is not None:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures; after reset_timeout
+    one trial call is let through and its outcome closes or reopens it."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial_running:
+                logger.warning("LLM circuit breaker opened after %d failures", self.failures)
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release_trial(self) -> None:
+        # A trial call that was cancelled proved nothing; let the next one try
+        self._trial_running = False
+
+
+class _MethodStats:
+    __slots__ = (
+        "calls", "retries", "failures", "rejected", "hedges", "hedge_wins",
+        "latency", "recent",
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0  # hedges that answered before the original
+        self.latency: float | None = None  # moving average of successful calls
+        self.recent: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def percentile(self, q: float) -> float | None:
+        if len(self.recent) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMClient:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str | None = None,
+        timeouts: dict[str, float] | None = None,
+        default_timeout: float = 30.0,
+        max_retries: int = 3,
+        limiter: AdaptiveLimiter | None = None,
+        breaker: CircuitBreaker | None = None,
+        hedged_methods: list[str] | None = None,
+        hedge_max_rate: float = 0.1,
+        usage: LLMUsage | None = None,
+    ):
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedged_methods = set(hedged_methods or ())
+        self.hedge_max_rate = hedge_max_rate  # Hedges per call, at most
+        self.usage = usage
+        self._stats: dict[str, _MethodStats] = {}
+
+    def timeout_for(self, method: str) -> float:
+        return self.timeouts.get(method, self.default_timeout)
+
+    async def create(self, method: str, **kwargs):
+        """chat.completions.create under the method's policies.
+
+        method names the calling operation ("chat", "genitive", ...) for
+        timeouts and stats. With stream=True the returned stream is open;
+        the timeout then bounds opening it and each wait for a chunk, and
+        the stream holds its concurrency slot until it ends or is aclose()d.
+        Raises LLMUnavailableError when the upstream can't be reached, and
+        non-retryable API errors (400, 401, ...) as they are.
+        """
+        stats = self._stats.setdefault(method, _MethodStats())
+        stats.calls += 1
+        if kwargs.get("stream") and self.usage is not None:
+            # The last chunk then carries token counts
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        if method in self.hedged_methods and not kwargs.get("stream"):
+            return await self._hedged(method, stats, kwargs)
+        return await self._call(method, stats, kwargs)
+
+    async def _hedged(self, method: str, stats: _MethodStats, kwargs: dict):
+        delay = stats.percentile(HEDGE_PERCENTILE)
+        primary = asyncio.create_task(self._call(method, stats, kwargs))
+        if delay is None:
+            return await primary
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and stats.hedges < self.hedge_max_rate * stats.calls:
+                stats.hedges += 1
+                logger.debug("Hedging %s after %.1fs", method, delay)
+                tasks.add(asyncio.create_task(self._call(method, stats, kwargs)))
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if t.exception() is None), None)
+                if winner is not None:
+                    if winner is not primary:
+                        stats.hedge_wins += 1
+                    return winner.result()
+                tasks -= done
+                if not tasks:
+                    # Both failed; report the original's error
+                    return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _call(self, method: str, stats: _MethodStats, kwargs: dict):
+        timeout = self.timeout_for(method)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                stats.rejected += 1
+                self._record(method, kwargs, 0.0, "circuit_open")
+                raise LLMUnavailableError("circuit open")
+
+            await self.limiter.acquire()
+            congested = None
+            backoff = OVERLOAD_BACKOFF
+            held = False  # an open stream keeps the slot until it ends
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(**kwargs, timeout=timeout),
+                    timeout,
+                )
+            except RETRYABLE_ERRORS as e:
+                congested = isinstance(e, OVERLOAD_ERRORS)
+                self.breaker.record_failure()
+                self._record(method, kwargs, time.monotonic() - started, _outcome(e))
+                error = e
+            except openai.APIStatusError as e:
+                # The upstream answered, it just rejected this request
+                congested = False
+                self.breaker.record_success()
+                self._record(method, kwargs, time.monotonic() - started, _outcome(e))
+                raise
+            except BaseException:
+                self.breaker.release_trial()
+                self._record(method, kwargs, time.monotonic() - started, "cancelled")
+                raise
+            else:
+                latency = time.monotonic() - started
+                congested = self._observe(stats, latency)
+                backoff = SLOW_BACKOFF
+                self.breaker.record_success()
+                if kwargs.get("stream"):
+                    held = True
+                    return _LimitedStream(self, method, kwargs, response, started, congested, backoff)
+                self._record(method, kwargs, latency, "ok", response.usage, response)
+                return response
+            finally:
+                if not held:
+                    self.limiter.release(congested, backoff)
+
+            stats.failures += 1
+            delay = self._retry_delay(attempt, error)
+            if attempt >= self.max_retries or delay is None:
+                logger.warning("LLM %s failed after %d attempts: %r", method, attempt + 1, error)
+                raise LLMUnavailableError(method) from error
+            attempt += 1
+            stats.retries += 1
+            logger.info("LLM %s attempt %d failed (%r), retrying in %.1fs", method, attempt, error, delay)
+            await asyncio.sleep(delay)
+
+    def _record(
+        self, method: str, kwargs: dict, latency: float, outcome: str,
+        usage=None, response=None, text: str | None = None,
+    ) -> None:
+        if self.usage is None:
+            return
+        prompt_tokens = completion_tokens = 0
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens or 0
+            completion_tokens = usage.completion_tokens or 0
+        elif outcome == "ok" or text is not None:
+            # Some upstreams omit usage, and a stream cut short never gets it;
+            # fall back to local estimates
+            prompt_tokens = sum(estimate_message_tokens(m) for m in kwargs.get("messages", ()))
+            if response is not None and response.choices:
+                text = response.choices[0].message.content
+            completion_tokens = estimate_tokens(text or "")
+        self.usage.record(
+            method, kwargs.get("model", ""), latency, outcome, prompt_tokens, completion_tokens
+        )
+
+    def stats(self) -> dict:
+        """Breaker state, current concurrency limit and per-method counters."""
+        return {
+            "breaker": self.breaker.state,
+            "limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "methods": {
+                method: {
+                    "calls": s.calls,
+                    "retries": s.retries,
+                    "failures": s.failures,
+                    "rejected": s.rejected,
+                    "hedges": s.hedges,
+                    "hedge_wins": s.hedge_wins,
+                    "avg_latency": s.latency,
+                    "p90_latency": s.percentile(HEDGE_PERCENTILE),
+                }
+                for method, s in self._stats.items()
+            },
+        }
+
+    @staticmethod
+    def _observe(stats: _MethodStats, latency: float) -> bool:
+        """Fold latency into the method's average; True if it looks congested."""
+        stats.recent.append(latency)
+        if stats.latency is None:
+            stats.latency = latency
+            return False
+        congested = latency > stats.latency * LATENCY_TOLERANCE
+        stats.latency += LATENCY_SMOOTHING * (latency - stats.latency)
+        return congested
+
+    @staticmethod
+    def _retry_delay(attempt: int, error: BaseException) -> float | None:
+        """Full-jitter backoff, at least Retry-After; None if that is too long."""
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            if retry_after > MAX_RETRY_AFTER:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+
+class _LimitedStream:
+    """An open completions stream that holds its limiter slot until it is
+    exhausted, fails or is closed; usage is recorded at the same point with
+    outcome "ok", "error" or "cancelled".
+
+    Consumers that stop early must call aclose().
+    """
+
+    def __init__(
+        self, client: LLMClient, method: str, kwargs: dict, stream,
+        started: float, congested: bool | None, backoff: float,
+    ):
+        self._client = client
+        self._method = method
+        self._kwargs = kwargs
+        self._stream = stream
+        self._started = started
+        self._congested = congested
+        self._backoff = backoff
+        self._usage = None
+        self._parts: list[str] = []
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            self._finish("ok")
+            raise
+        except asyncio.CancelledError:
+            self._finish("cancelled")
+            raise
+        except Exception:
+            self._finish("error")
+            raise
+        if chunk.usage is not None:
+            self._usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            self._parts.append(chunk.choices[0].delta.content)
+        return chunk
+
+    async def aclose(self) -> None:
+        # Closed before the end: the reader gave up on the reply
+        self._finish("cancelled")
+        await self._stream.close()
+
+    def _finish(self, outcome: str) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._client.limiter.release(self._congested, self._backoff)
+        self._client._record(
+            self._method, self._kwargs, time.monotonic() - self._started, outcome,
+            self._usage, text="".join(self._parts),
+        )
+
+
+def _outcome(error: BaseException) -> str:
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, (openai.APITimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, openai.InternalServerError):
+        return "server_error"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection_error"
+    return "client_error"
+
+
+def _retry_after(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # HTTP-date form; fall back to our own backoff
+    return None
@@ -0,0 +1,186 @@
+"""Per-call accounting of LLM latency, tokens and cost.
+
+LLMClient records every attempt here. Calls are aggregated in memory by
+(user, method, model, outcome) with a fixed-bucket latency histogram, and
+the aggregates are flushed to the llm_usage table every flush interval, so
+a busy hour costs a few dozen rows rather than one per call. Histograms
+merge by adding counts, which is how reports get p50/p95/p99 over any
+window.
+
+The user is taken from llm_user, a context variable set per update by
+UsageContextMiddleware; background tasks inherit it when created.
+"""
+
+import asyncio
+import json
+import logging
+from contextvars import ContextVar
+
+import aiosqlite
+
+from app.database.repositories.llm_usage_repo import (
+    delete_usage_before,
+    get_usage_since,
+    save_usage_rows,
+)
+
+logger = logging.getLogger(__name__)
+
+llm_user: ContextVar[int | None] = ContextVar("llm_user", default=None)
+
+# Upper bounds of the latency histogram buckets, seconds; the last is open
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+
+
+class _Aggregate:
+    __slots__ = ("calls", "prompt_tokens", "completion_tokens", "cost", "latency_sum", "hist")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.latency_sum = 0.0
+        self.hist = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+def _bucket(latency: float) -> int:
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if latency <= bound:
+            return i
+    return len(LATENCY_BUCKETS)
+
+
+def percentile(hist: list[int], q: float) -> float | None:
+    """Latency at quantile q, interpolated within its histogram bucket."""
+    total = sum(hist)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(hist):
+        if count and seen + count >= rank:
+            if i == len(LATENCY_BUCKETS):
+                return float(LATENCY_BUCKETS[-1])  # open bucket: report its floor
+            low = LATENCY_BUCKETS[i - 1] if i else 0.0
+            return low + (LATENCY_BUCKETS[i] - low) * (rank - seen) / count
+        seen += count
+    return None
+
+
+class LLMUsage:
+    def __init__(
+        self,
+        db_path: str,
+        prices: dict[str, list[float]] | None = None,
+        retention_days: int = 90,
+    ):
+        self.db_path = db_path
+        self.prices = prices or {}  # model -> [USD per 1M prompt, per 1M completion tokens]
+        self.retention_days = retention_days
+        self._pending: dict[tuple, _Aggregate] = {}
+        self._flusher: asyncio.Task | None = None
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self.prices.get(model)
+        if not price:
+            return 0.0
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+    def record(
+        self,
+        method: str,
+        model: str,
+        latency: float,
+        outcome: str = "ok",
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+    ) -> None:
+        key = (llm_user.get(), method, model, outcome)
+        agg = self._pending.get(key)
+        if agg is None:
+            agg = self._pending[key] = _Aggregate()
+        agg.calls += 1
+        agg.prompt_tokens += prompt_tokens
+        agg.completion_tokens += completion_tokens
+        agg.cost += self.cost(model, prompt_tokens, completion_tokens)
+        agg.latency_sum += latency
+        agg.hist[_bucket(latency)] += 1
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [
+            (user_id, method, model, outcome, a.calls, a.prompt_tokens,
+             a.completion_tokens, a.cost, a.latency_sum, json.dumps(a.hist))
+            for (user_id, method, model, outcome), a in pending.items()
+        ]
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await save_usage_rows(db, rows)
+                await delete_usage_before(db, self.retention_days * 86400)
+        except Exception:
+            logger.exception("LLM usage flush failed")
+
+    async def start(self, interval: float) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    async def report(self, seconds: int, top: int = 5) -> dict:
+        """Usage over the last seconds: totals, methods and top users by cost.
+
+        Methods carry calls, errors, tokens, cost and p50/p95/p99 latency of
+        successful calls. Cancelled calls (e.g. an aborted stream) count as
+        neither errors nor successes.
+        """
+        await self.flush()
+        async with aiosqlite.connect(self.db_path) as db:
+            rows = await get_usage_since(db, seconds)
+
+        methods: dict[str, dict] = {}
+        users: dict[int | None, dict] = {}
+        totals = {"calls": 0, "errors": 0, "cost": 0.0, "tokens": 0}
+        for row in rows:
+            tokens = row["prompt_tokens"] + row["completion_tokens"]
+            m = methods.setdefault(row["method"], {
+                "calls": 0, "errors": 0, "tokens": 0, "cost": 0.0,
+                "hist": [0] * (len(LATENCY_BUCKETS) + 1),
+            })
+            u = users.setdefault(row["user_id"], {"calls": 0, "tokens": 0, "cost": 0.0})
+            for target in (m, u, totals):
+                target["calls"] += row["calls"]
+                target["tokens"] += tokens
+                target["cost"] += row["cost"]
+            if row["outcome"] == "ok":
+                for i, count in enumerate(json.loads(row["latency_hist"])):
+                    m["hist"][i] += count
+            elif row["outcome"] != "cancelled":
+                m["errors"] += row["calls"]
+                totals["errors"] += row["calls"]
+
+        for m in methods.values():
+            hist = m.pop("hist")
+            m["p50"] = percentile(hist, 0.5)
+            m["p95"] = percentile(hist, 0.95)
+            m["p99"] = percentile(hist, 0.99)
+        return {
+            "totals": totals,
+            "methods": dict(sorted(methods.items(), key=lambda kv: -kv[1]["cost"])),
+            "users": sorted(users.items(), key=lambda kv: -kv[1]["cost"])[:top],
+        }
@@ -1,7 +1,17 @@
-from openai import AsyncOpenAI
+import asyncio
+import copy
+import logging
+import time
+from typing import AsyncIterator
 
+from app.services.llm_cache import LLMCache
+from app.services.llm_client import LLMClient
+from app.services.single_flight import SingleFlight
+from app.services.tokens import estimate_message_tokens
 from config.settings import settings
 
+logger = logging.getLogger(__name__)
+
 SYSTEM_PROMPT = (
     "Ты — полезный ассистент бота для генерации документов. "
     "Ты помогаешь фрилансерам и малому бизнесу создавать договоры, "
@@ -10,38 +20,237 @@ SYSTEM_PROMPT = (
     "команду /newdoc."
 )
 
+SUMMARY_PROMPT = (
+    "Кратко перескажи предыдущую часть диалога пользователя с ассистентом, "
+    "сохранив факты, которые могут понадобиться дальше: имена, реквизиты, "
+    "суммы, даты, договорённости и открытые вопросы. Не больше 150 слов, "
+    "без вступлений."
+)
+# Each old message contributes at most this many characters to the summary input
+SUMMARY_MESSAGE_CHARS = 2000
+# Characters of old messages per summary call; the rest waits for the next turn
+SUMMARY_INPUT_CHARS = 12000
+
+# Bump when a cached prompt changes so old answers are not served
+TARGET_QUERIES_PROMPT_VERSION = 1
+GENITIVE_PROMPT_VERSION = 1
+FIELD_LABELS_PROMPT_VERSION = 1
+
+# Variable names per label request; small enough to answer fast and as valid JSON
+LABEL_CHUNK_SIZE = 15
+
 
 class OpenAIService:
-    def __init__(self, api_key: str, base_url: str | None = None, model: str = "gpt-4o-mini"):
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+    def __init__(
+        self,
+        llm: LLMClient,
+        model: str = "gpt-4o-mini",
+        cache: LLMCache | None = None,
+    ):
+        self.llm = llm
         self.model = model
+        self.cache = cache
+        # Identical non-chat requests in flight at once share one API call
+        self.single_flight = SingleFlight()
         self._conversations: dict[int, list[dict]] = {}
+        # Rolling summary of turns that no longer fit the token budget
+        self._summaries: dict[int, str] = {}
+        self._summary_tasks: dict[int, asyncio.Task] = {}
 
-    async def chat(self, user_id: int, user_message: str) -> str:
-        history = self._get_or_create_history(user_id)
-        history.append({"role": "user", "content": user_message})
+    def chat(self, user_id: int, user_message: str, stream: bool = False):
+        """Reply to a chat message.
 
-        trimmed = self._trim_history(
-            history, max_messages=settings.max_conversation_messages
-        )
+        Returns an awaitable with the full reply, or with stream=True an async
+        iterator of text deltas. Either way the reply is added to history once
+        complete.
+        """
+        if stream:
+            return self._chat_stream(user_id, user_message)
+        return self._chat_complete(user_id, user_message)
 
-        response = await self.client.chat.completions.create(
+    async def _chat_complete(self, user_id: int, user_message: str) -> str:
+        response = await self.llm.create(
+            "chat",
             model=self.model,
-            messages=[{"role": "system", "content": SYSTEM_PROMPT}] + trimmed,
+            messages=self._chat_messages(user_id, user_message),
         )
 
         assistant_msg = response.choices[0].message.content
-        history.append({"role": "assistant", "content": assistant_msg})
+        self._get_or_create_history(user_id).append(
+            {"role": "assistant", "content": assistant_msg}
+        )
         return assistant_msg
 
-    async def generate_field_labels(self, variable_names: list[str]) -> dict:
+    async def _chat_stream(self, user_id: int, user_message: str) -> AsyncIterator[str]:
+        response = await self.llm.create(
+            "chat",
+            model=self.model,
+            messages=self._chat_messages(user_id, user_message),
+            stream=True,
+        )
+
+        parts = []
+        try:
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            # Frees the concurrency slot if the reader stops early
+            await response.aclose()
+
+        self._get_or_create_history(user_id).append(
+            {"role": "assistant", "content": "".join(parts)}
+        )
+
+    def _chat_messages(self, user_id: int, user_message: str) -> list[dict]:
+        """Prompt for a chat turn: system prompt, rolling summary and the most
+        recent turns that fit in chat_history_token_budget."""
+        history = self._get_or_create_history(user_id)
+        history.append({"role": "user", "content": user_message})
+
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        summary = self._summaries.get(user_id)
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": f"Краткое содержание предыдущей части диалога:\n{summary}",
+            })
+        budget = settings.chat_history_token_budget - sum(
+            estimate_message_tokens(m) for m in messages
+        )
+        window = self._fit_history(
+            history, budget, max_messages=settings.max_conversation_messages
+        )
+
+        dropped = len(history) - len(window)
+        if dropped:
+            self._schedule_summary(user_id, history, dropped)
+        return messages + window
+
+    @staticmethod
+    def _fit_history(history: list[dict], budget: int, max_messages: int = 20) -> list[dict]:
+        """Newest messages whose estimated tokens fit budget (always at least one)."""
+        used = 0
+        start = len(history)
+        while start > 0 and len(history) - start < max_messages:
+            cost = estimate_message_tokens(history[start - 1])
+            if used + cost > budget and start < len(history):
+                break
+            used += cost
+            start -= 1
+        return history[start:]
+
+    def _schedule_summary(self, user_id: int, history: list[dict], count: int) -> None:
+        """Fold history[:count] into the rolling summary in the background."""
+        task = self._summary_tasks.get(user_id)
+        if task is not None and not task.done():
+            return  # the next turn picks up whatever is still left over
+        self._summary_tasks[user_id] = asyncio.create_task(
+            self._summarize(user_id, history, count)
+        )
+
+    async def _summarize(self, user_id: int, history: list[dict], count: int) -> None:
+        previous = self._summaries.get(user_id)
+        lines = [f"Ранее: {previous}"] if previous else []
+        used = 0
+        for i, m in enumerate(history[:count]):
+            if i and used >= SUMMARY_INPUT_CHARS:
+                count = i
+                break
+            who = "Пользователь" if m["role"] == "user" else "Ассистент"
+            lines.append(f"{who}: {m['content'][:SUMMARY_MESSAGE_CHARS]}")
+            used += len(lines[-1])
+        try:
+            response = await self.llm.create(
+                "summary",
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": "\n\n".join(lines)},
+                ],
+            )
+        except Exception:
+            logger.warning("Chat summary failed for user %s", user_id, exc_info=True)
+            # Without a summary the old turns are lost, but history stays bounded
+            limit = settings.max_conversation_messages
+            if self._conversations.get(user_id) is history and len(history) > limit:
+                del history[:len(history) - limit]
+            return
+        if self._conversations.get(user_id) is not history:
+            return  # history was cleared meanwhile
+        self._summaries[user_id] = response.choices[0].message.content.strip()
+        # Only appends happen meanwhile, so the first count entries are the summarized ones
+        del history[:count]
+
+    async def generate_field_labels(
+        self, variable_names: list[str], known: dict[str, dict] | None = None
+    ) -> dict:
         """Generate Russian labels and prompts for template variable names.
 
         Input: ["executor_inn", "contract_amount", ...]
         Output: {"executor_inn": {"label": "ИНН исполнителя", "prompt_ru": "Введите ИНН:", "type": "string"}, ...}
+
+        Names found in known (labels of the bundled templates) or labeled
+        before skip the model; the rest are sent in parallel chunks of
+        LABEL_CHUNK_SIZE. A failed chunk is left out, so only its names fall
+        back to defaults.
         """
         import json
 
+        known = known or {}
+        labels = {name: dict(known[name]) for name in variable_names if name in known}
+        missing = [name for name in variable_names if name not in labels]
+        if missing and self.cache is not None:
+            cached = await self.cache.get_many(
+                "field_label", FIELD_LABELS_PROMPT_VERSION, self.model, missing
+            )
+            for name, raw in cached.items():
+                labels[name] = json.loads(raw)
+            missing = [name for name in missing if name not in labels]
+
+        chunks = [
+            missing[i:i + LABEL_CHUNK_SIZE] for i in range(0, len(missing), LABEL_CHUNK_SIZE)
+        ]
+        results = await asyncio.gather(
+            *(self._field_labels_chunk(chunk) for chunk in chunks),
+            return_exceptions=True,
+        )
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                logger.warning("Labels for %d variables failed: %r", len(chunk), result)
+                continue
+            generated, latency = result
+            fresh = {
+                name: generated[name] for name in chunk
+                if isinstance(generated.get(name), dict)
+            }
+            # Chunks are shared by concurrent uploads; keep our own copies
+            labels.update(copy.deepcopy(fresh))
+            if fresh and self.cache is not None:
+                await self.cache.put_many(
+                    "field_label",
+                    FIELD_LABELS_PROMPT_VERSION,
+                    self.model,
+                    {name: json.dumps(info, ensure_ascii=False) for name, info in fresh.items()},
+                    latency,
+                )
+        return labels
+
+    async def _field_labels_chunk(self, variable_names: list[str]) -> tuple[dict, float]:
+        async def call():
+            started = time.monotonic()
+            labels = await self._generate_field_labels(variable_names)
+            return labels, time.monotonic() - started
+
+        return await self._single_flight("field_labels", ", ".join(variable_names), call)
+
+    async def _generate_field_labels(self, variable_names: list[str]) -> dict:
+        import json
+
         prompt = (
             "Тебе дан список имён переменных из шаблона документа (snake_case).\n"
             "Для каждой переменной придумай:\n"
@@ -54,7 +263,8 @@ class OpenAIService:
 
         vars_text = ", ".join(variable_names)
 
-        response = await self.client.chat.completions.create(
+        response = await self.llm.create(
+            "field_labels",
             model=self.model,
             messages=[
                 {"role": "system", "content": prompt},
@@ -68,13 +278,29 @@ class OpenAIService:
             if raw.endswith("```"):
                 raw = raw[:-3]
             raw = raw.strip()
-        return json.loads(raw)
+        labels = json.loads(raw)
+        if not isinstance(labels, dict):
+            raise ValueError("Expected a JSON object of labels")
+        return labels
 
-    async def generate_target_queries(self, business_type: str, count: int = 20) -> str:
+    async def generate_target_queries(
+        self, business_type: str, count: int = 20, refresh: bool = False
+    ) -> str:
         """Generate target search queries for a business type.
 
         Returns a numbered list as plain text, e.g. "1. стоматология\\n2. ..."
+        Cached per business type; refresh=True asks the model again.
         """
+        return await self._cached(
+            "target_queries",
+            TARGET_QUERIES_PROMPT_VERSION,
+            business_type,
+            lambda: self._generate_target_queries(business_type, count),
+            refresh,
+            variant=str(count),
+        )
+
+    async def _generate_target_queries(self, business_type: str, count: int) -> str:
         prompt = (
             "Ты — SEO-специалист по продвижению организаций в Яндекс Картах и 2ГИС.\n"
             f"Составь {count} целевых поисковых запросов для продвижения "
@@ -99,7 +325,8 @@ class OpenAIService:
             "Верни ТОЛЬКО пронумерованный список, без заголовков и пояснений."
         )
 
-        response = await self.client.chat.completions.create(
+        response = await self.llm.create(
+            "target_queries",
             model=self.model,
             messages=[
                 {"role": "system", "content": prompt},
@@ -109,12 +336,23 @@ class OpenAIService:
 
         return response.choices[0].message.content.strip()
 
-    async def convert_business_type_genitive(self, business_type: str) -> str:
+    async def convert_business_type_genitive(
+        self, business_type: str, refresh: bool = False
+    ) -> str:
         """Convert business type to genitive case for document.
 
         'стоматология' -> 'стоматологической клиники'
         'автосервис' -> 'автосервиса'
         """
+        return await self._cached(
+            "genitive",
+            GENITIVE_PROMPT_VERSION,
+            business_type,
+            lambda: self._convert_business_type_genitive(business_type),
+            refresh,
+        )
+
+    async def _convert_business_type_genitive(self, business_type: str) -> str:
         prompt = (
             "Преобразуй тип бизнеса в родительный падеж для фразы "
             "'карточка [ТИП] Заказчика'. "
@@ -126,7 +364,8 @@ class OpenAIService:
             "ресторан → ресторана\n"
             "фитнес-клуб → фитнес-клуба"
         )
-        response = await self.client.chat.completions.create(
+        response = await self.llm.create(
+            "genitive",
             model=self.model,
             messages=[
                 {"role": "system", "content": prompt},
@@ -135,17 +374,30 @@ class OpenAIService:
         )
         return response.choices[0].message.content.strip()
 
-    async def extract_requisites(self, document_text: str) -> dict:
+    async def extract_requisites(
+        self, document_text: str, fields: list[str] | None = None
+    ) -> dict:
         """Extract company requisites from a company card document.
 
         Returns a flat dict with keys like company_name, inn, kpp, etc.
+        If fields is given, only those keys are requested.
         """
-        from app.services.requisite_parser import REQUISITE_PROMPT
+        requisites = await self._single_flight(
+            "requisites",
+            document_text,
+            lambda: self._extract_requisites(document_text, fields),
+            variant=",".join(fields or ()),
+        )
+        return dict(requisites)
 
-        response = await self.client.chat.completions.create(
+    async def _extract_requisites(self, document_text: str, fields: list[str] | None) -> dict:
+        from app.services.requisite_parser import build_requisite_prompt
+
+        response = await self.llm.create(
+            "requisites",
             model=self.model,
             messages=[
-                {"role": "system", "content": REQUISITE_PROMPT},
+                {"role": "system", "content": build_requisite_prompt(fields)},
                 {"role": "user", "content": document_text},
             ],
         )
@@ -161,16 +413,93 @@ class OpenAIService:
             raw = raw.strip()
         return json.loads(raw)
 
+    async def extract_field_values(self, text: str, fields: list) -> dict[str, str]:
+        """Map a free-text message (deal terms, a forwarded email) onto
+        template fields in one call.
+
+        fields are FieldSchema objects; returns {field key: value} for the
+        fields found in the text, values unvalidated.
+        """
+        keys = ",".join(field.key for field in fields)
+        values = await self._single_flight(
+            "field_values",
+            text,
+            lambda: self._extract_field_values(text, fields),
+            variant=keys,
+        )
+        return dict(values)
+
+    async def _extract_field_values(self, text: str, fields: list) -> dict[str, str]:
+        import json
+
+        lines = []
+        for field in fields:
+            line = f"- {field.key}: {field.label}"
+            details = [d for d in (field.hint, field.validation_hint) if d]
+            if field.type == "date":
+                details.append("дата в формате ДД.ММ.ГГГГ")
+            if details:
+                line += f" ({'; '.join(details)})"
+            lines.append(line)
+        prompt = (
+            "Тебе дан текст с данными для договора или другого документа "
+            "(например, пересланное письмо с условиями сделки). "
+            "Извлеки из него значения полей шаблона:\n\n"
+            + "\n".join(lines)
+            + "\n\nВерни СТРОГО JSON без markdown: {\"key\": \"значение\", ...}\n"
+            "Значения — строки, как они должны стоять в документе. "
+            "Включай только поля, значения которых явно есть в тексте, ничего не придумывай.\n"
+        )
+
+        response = await self.llm.create(
+            "field_values",
+            model=self.model,
+            messages=[
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": text},
+            ],
+        )
+
+        raw = response.choices[0].message.content.strip()
+        if raw.startswith("```"):
+            raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
+            if raw.endswith("```"):
+                raw = raw[:-3]
+            raw = raw.strip()
+        values = json.loads(raw)
+        if not isinstance(values, dict):
+            raise ValueError("Expected a JSON object of field values")
+        known = {field.key for field in fields}
+        return {
+            key: str(value).strip()
+            for key, value in values.items()
+            if key in known and value is not None and str(value).strip()
+        }
+
+    async def _cached(self, kind, version, text, call, refresh: bool, variant: str = "") -> str:
+        if self.cache is None:
+            cached_call = call
+        else:
+            def cached_call():
+                return self.cache.get_or_call(
+                    kind, version, self.model, text, call, refresh, variant
+                )
+        # A refresh must not join a plain lookup that may return the old answer
+        flight_variant = f"{version}:{variant}:{'refresh' if refresh else ''}"
+        return await self._single_flight(kind, text, cached_call, flight_variant)
+
+    async def _single_flight(self, kind, text, call, variant: str = ""):
+        key = LLMCache.make_key(kind, 0, self.model, text, variant)
+        return await self.single_flight.do(kind, key, call)
+
     def clear_history(self, user_id: int) -> None:
         self._conversations.pop(user_id, None)
+        self._summaries.pop(user_id, None)
+        task = self._summary_tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
 
     def _get_or_create_history(self, user_id: int) -> list[dict]:
         if user_id not in self._conversations:
             self._conversations[user_id] = []
         return self._conversations[user_id]
-
-    @staticmethod
-    def _trim_history(history: list[dict], max_messages: int = 20) -> list[dict]:
-        if len(history) > max_messages:
-            return history[-max_messages:]
-        return history
@@ -1,28 +1,51 @@
 """Parse company requisites from .docx and .pdf files."""
 
+import io
+import logging
+import re
+import zipfile
+
 import fitz  # PyMuPDF
-from docx import Document
-
-REQUISITE_PROMPT = (
-    "Ты — эксперт по анализу карточек предприятий и реквизитов организаций.\n"
-    "Тебе дан текст документа с реквизитами. Извлеки следующие поля:\n\n"
-    "- company_name: Полное наименование организации\n"
-    "- legal_address: Юридический адрес\n"
-    "- phone_email: Телефон / электронная почта / сайт (всё что есть)\n"
-    "- ogrn: ОГРН\n"
-    "- inn: ИНН\n"
-    "- kpp: КПП\n"
-    "- bank_account: Расчётный счёт\n"
-    "- corr_account: Корреспондентский счёт\n"
-    "- bik: БИК\n"
-    "- bank_name: Название банка\n"
-    "- bank_inn: ИНН банка\n"
-    "- bank_address: Юридический адрес банка\n"
-    "- director: ФИО генерального директора (только ФИО, без должности)\n\n"
-    "Верни СТРОГО JSON без markdown и без ```json, только найденные поля:\n"
-    '{"company_name": "...", "inn": "...", ...}\n'
-    "Если поле не найдено в тексте — не включай его.\n"
-)
+from lxml import etree
+
+from app.services.field_schema import TemplateSchema
+
+logger = logging.getLogger(__name__)
+
+# Field descriptions for the LLM prompt, in prompt order
+REQUISITE_DESCRIPTIONS: dict[str, str] = {
+    "company_name": "Полное наименование организации",
+    "legal_address": "Юридический адрес",
+    "phone_email": "Телефон / электронная почта / сайт (всё что есть)",
+    "ogrn": "ОГРН",
+    "inn": "ИНН",
+    "kpp": "КПП",
+    "bank_account": "Расчётный счёт",
+    "corr_account": "Корреспондентский счёт",
+    "bik": "БИК",
+    "bank_name": "Название банка",
+    "bank_inn": "ИНН банка",
+    "bank_address": "Юридический адрес банка",
+    "director": "ФИО генерального директора (только ФИО, без должности)",
+}
+
+
+def build_requisite_prompt(keys=None) -> str:
+    """System prompt asking the LLM for the given requisite keys (all by default)."""
+    keys = list(keys) if keys is not None else list(REQUISITE_DESCRIPTIONS)
+    listing = "\n".join(f"- {k}: {REQUISITE_DESCRIPTIONS[k]}" for k in keys)
+    example = ", ".join(f'"{k}": "..."' for k in keys[:2])
+    return (
+        "Ты — эксперт по анализу карточек предприятий и реквизитов организаций.\n"
+        "Тебе дан текст документа с реквизитами. Извлеки следующие поля:\n\n"
+        f"{listing}\n\n"
+        "Верни СТРОГО JSON без markdown и без ```json, только найденные поля:\n"
+        f"{{{example}, ...}}\n"
+        "Если поле не найдено в тексте — не включай его.\n"
+    )
+
+
+REQUISITE_PROMPT = build_requisite_prompt()
 
 # Maps AI-returned keys to possible template field keys.
 # Each AI key maps to a list of candidate field keys, tried in order.
@@ -80,72 +103,506 @@ REQUISITE_TO_FIELD_MAP: dict[str, list[str]] = {
 }
 
 
-def extract_text_from_pdf(path: str) -> str:
-    """Extract text from all pages of a PDF using PyMuPDF."""
-    doc = fitz.open(path)
-    pages = []
-    for page in doc:
-        pages.append(page.get_text())
-    doc.close()
-    return "\n".join(pages)
+def extract_text(data: bytes, is_pdf: bool, max_pages: int | None = None) -> str:
+    """Extract text from .pdf or .docx card contents (runs in worker processes)."""
+    if is_pdf:
+        return extract_text_from_pdf(data, max_pages)
+    return extract_text_from_docx(data)
 
 
-def extract_text_from_docx(path: str) -> str:
-    """Extract text from .docx — paragraphs and tables as 'label: value' pairs."""
-    doc = Document(path)
-    lines = []
+def extract_text_from_pdf(source: str | bytes, max_pages: int | None = None) -> str:
+    """Extract text from a PDF (path or bytes), most likely requisite pages first.
 
-    for p in doc.paragraphs:
-        text = p.text.strip()
-        if text:
-            lines.append(text)
-
-    for table in doc.tables:
-        for row in table.rows:
-            cells = [cell.text.strip() for cell in row.cells]
-            # Format as "label: value" for 2-column tables
-            if len(cells) == 2 and cells[0] and cells[1]:
-                lines.append(f"{cells[0]}: {cells[1]}")
-            else:
-                line = " | ".join(c for c in cells if c)
-                if line:
-                    lines.append(line)
+    Pages are read in pdf_page_order and reading stops once the key
+    requisites are found; the result is in document page order.
+    """
+    doc = _open_pdf(source)
+    try:
+        texts: dict[int, str] = {}
+        for number in pdf_page_order(doc.page_count, max_pages):
+            texts[number] = doc[number].get_text()
+            # First and last page are always read before checking
+            if len(texts) >= 2 and has_key_requisites(texts):
+                break
+    finally:
+        doc.close()
+    return join_pdf_pages(texts)
+
+
+def pdf_page_order(page_count: int, max_pages: int | None = None) -> list[int]:
+    """Page numbers by priority: first, last, then front to back, capped at max_pages."""
+    order = [0, page_count - 1] if page_count > 1 else list(range(page_count))
+    order += range(1, page_count - 1)
+    return order[:max_pages] if max_pages is not None else order
+
+
+def pdf_page_count(data: bytes) -> int:
+    doc = _open_pdf(data)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+
+def extract_pdf_pages(data: bytes, numbers: list[int]) -> dict[int, str]:
+    """Text of the given pages (runs in worker processes)."""
+    doc = _open_pdf(data)
+    try:
+        return {n: doc[n].get_text() for n in numbers}
+    finally:
+        doc.close()
+
+
+def join_pdf_pages(texts: dict[int, str]) -> str:
+    return "\n".join(texts[n] for n in sorted(texts))
+
+
+def has_key_requisites(texts: dict[int, str]) -> bool:
+    """True once the pages read so far contain every key requisite."""
+    found = parse_requisites(join_pdf_pages(texts))
+    return all(key in found for key in KEY_REQUISITES)
+
+
+def _open_pdf(source: str | bytes):
+    if isinstance(source, bytes):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+
+def extract_text_from_docx(source: str | bytes) -> str:
+    """Extract text from .docx (path or bytes) — paragraphs and tables as 'label: value' pairs.
+
+    Streams word/document.xml with iterparse instead of building the python-docx
+    object model. Body paragraphs come first, then one line per table row;
+    horizontally merged cells count once, vertically merged ones repeat the
+    text of the cell above, and nested tables produce rows of their own.
+    """
+    with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source) as archive:
+        with archive.open("word/document.xml") as xml:
+            paragraphs, rows = _iter_docx_text(xml)
+
+    lines = list(paragraphs)
+    for cells in rows:
+        # Format as "label: value" for 2-column tables
+        if len(cells) == 2 and cells[0] and cells[1]:
+            lines.append(f"{cells[0]}: {cells[1]}")
+        else:
+            line = " | ".join(c for c in cells if c)
+            if line:
+                lines.append(line)
 
     return "\n".join(lines)
 
 
-def detect_side(fields: list[dict], current_index: int) -> str:
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+_RUN_TEXT = {
+    _W + "tab": "\t",
+    _W + "ptab": "\t",
+    _W + "cr": "\n",
+    _W + "noBreakHyphen": "-",
+}
+
+# Only these elements produce iterparse events; the rest is skipped in C
+_DOCX_TAGS = (
+    _MC_FALLBACK,
+    *(_W + name for name in (
+        "p", "t", "tab", "ptab", "cr", "br", "noBreakHyphen",
+        "tbl", "tr", "tc", "gridSpan", "vMerge",
+    )),
+)
+
+
+class _TableState:
+    __slots__ = ("row", "cell", "span", "vmerge", "above", "grid")
+
+    def __init__(self):
+        self.row: list[str] = []
+        self.cell: list[str] = []
+        self.span = 1
+        self.vmerge: str | None = None
+        self.above: dict[int, str] = {}  # grid column -> text, for vMerge="continue"
+        self.grid: dict[int, str] = {}
+
+
+def _iter_docx_text(xml) -> tuple[list[str], list[list[str]]]:
+    """One pass over document.xml: (body paragraphs, table rows as cell texts)."""
+    paragraphs: list[str] = []
+    rows: list[list[str]] = []
+    tables: list[_TableState] = []
+    runs: list[list[str]] = []  # text parts of the open paragraphs (text boxes nest)
+    fallback = 0
+
+    for event, elem in etree.iterparse(xml, events=("start", "end"), tag=_DOCX_TAGS):
+        tag = elem.tag
+        if event == "start":
+            if tag == _MC_FALLBACK:
+                fallback += 1  # duplicate of the mc:Choice content
+            elif fallback:
+                pass
+            elif tag == _W + "p":
+                runs.append([])
+            elif tag == _W + "tbl":
+                tables.append(_TableState())
+            elif tag == _W + "tr":
+                tables[-1].row = []
+                tables[-1].grid = {}
+            elif tag == _W + "tc":
+                table = tables[-1]
+                table.cell, table.span, table.vmerge = [], 1, None
+            continue
+
+        if tag == _MC_FALLBACK:
+            fallback -= 1
+            elem.clear()
+            continue
+        if fallback:
+            continue
+
+        if tag == _W + "t":
+            if runs:
+                runs[-1].append(elem.text or "")
+        elif tag in _RUN_TEXT or tag == _W + "br":
+            parent = elem.getparent()
+            if runs and parent is not None and parent.tag == _W + "r":
+                if tag == _W + "br":
+                    if elem.get(_W + "type", "textWrapping") == "textWrapping":
+                        runs[-1].append("\n")
+                else:
+                    runs[-1].append(_RUN_TEXT[tag])
+        elif tag == _W + "gridSpan" and tables:
+            tables[-1].span = int(elem.get(_W + "val", "1"))
+        elif tag == _W + "vMerge" and tables:
+            tables[-1].vmerge = elem.get(_W + "val", "continue")
+        elif tag == _W + "p":
+            text = "".join(runs.pop())
+            if tables:
+                tables[-1].cell.append(text)
+            elif text.strip():
+                paragraphs.append(text.strip())
+        elif tag == _W + "tc":
+            table = tables[-1]
+            col = len(table.grid)
+            if table.vmerge == "continue":
+                text = table.above.get(col, "")
+            else:
+                text = "\n".join(table.cell).strip()
+            table.row.append(text)
+            for offset in range(table.span):
+                table.grid[col + offset] = text
+        elif tag == _W + "tr":
+            table = tables[-1]
+            rows.append(table.row)
+            table.above = table.grid
+        elif tag == _W + "tbl":
+            tables.pop()
+        else:
+            continue
+
+        # Processed: free the subtree, and drop finished siblings in the body/table
+        if tag in (_W + "p", _W + "tbl", _W + "tr"):
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None and parent.tag in (_W + "body", _W + "tbl"):
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+    return paragraphs, rows
+
+
+# ---------------------------------------------------------------------------
+# Local extraction: numeric requisites are found by format and checked with
+# their published checksums; text fields are read from "label: value" lines.
+# ---------------------------------------------------------------------------
+
+_INN10_WEIGHTS = (2, 4, 10, 3, 5, 9, 4, 6, 8)
+_INN11_WEIGHTS = (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+_INN12_WEIGHTS = (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+_ACCOUNT_WEIGHTS = (7, 1, 3) * 8
+
+_DIGITS_RE = re.compile(r"(?<!\d)\d{9,20}(?!\d)")
+_KPP_RE = re.compile(r"(?<![\dA-Z])\d{4}[\dA-Z]{2}\d{3}(?![\dA-Z])")
+_DIGIT_GAP_RE = re.compile(r"(?<=\d)[ \u00a0](?=\d)")
+_LETTER_RE = re.compile(r"[A-Za-zА-Яа-яЁё]")
+_FIO_RE = re.compile(
+    r"[А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?\s+"
+    r"(?:[А-ЯЁ][а-яё]+\s+[А-ЯЁ][а-яё]+|[А-ЯЁ]\.\s?[А-ЯЁ]\.)"
+)
+_LABEL_SPLIT_RE = re.compile(r"\s*(?::|\t|\s\|\s)\s*")
+_ACCOUNT_LABEL_RE = re.compile(r"сч[её]т|р/с|к/с|р/сч|к/сч", re.IGNORECASE)
+
+# key -> pattern matched against the label part of a "label: value" line
+_TEXT_LABELS: dict[str, re.Pattern] = {
+    "bank_address": re.compile(r"адрес\s+банка", re.IGNORECASE),
+    "legal_address": re.compile(
+        r"юридический\s+адрес|адрес\s+регистрации|место\s*нахождени|местонахождени",
+        re.IGNORECASE,
+    ),
+    "bank_name": re.compile(
+        r"^(?:наименование\s+)?банк(?:а|\s+получателя)?$"
+        r"|(?:наименование|название)\s+банка|обслуживающий\s+банк",
+        re.IGNORECASE,
+    ),
+    "company_name": re.compile(
+        r"^(?:полное\s+)?(?:наименование|название)(?:\s+(?:организации|предприятия|компании))?$"
+        r"|^организация$",
+        re.IGNORECASE,
+    ),
+    "director": re.compile(r"директор|руководитель", re.IGNORECASE),
+    "phone_email": re.compile(r"телефон|^тел\.?$|e-?mail|почта|сайт", re.IGNORECASE),
+}
+
+# Found on nearly every card; once all are present the rest of a PDF is skipped
+KEY_REQUISITES = ("inn", "ogrn", "bik", "bank_account")
+
+# Evidence that a card contains a field at all; the LLM is asked only for
+# missing fields whose marker appears in the text.
+_MARKERS: dict[str, re.Pattern] = {
+    "company_name": re.compile(
+        r"(?i:наименование|название|организаци|предприяти)"
+        r"|\b(?:ООО|ОАО|ЗАО|ПАО|АО|ИП)\b|«"
+    ),
+    "legal_address": re.compile(r"адрес|местонахождени", re.IGNORECASE),
+    "phone_email": re.compile(r"тел|e-?mail|почта|@", re.IGNORECASE),
+    "ogrn": re.compile(r"ОГРН"),
+    "inn": re.compile(r"ИНН"),
+    "kpp": re.compile(r"КПП"),
+    "bank_account": re.compile(r"р/с|расч[её]тный|р/сч", re.IGNORECASE),
+    "corr_account": re.compile(r"к/с|корр", re.IGNORECASE),
+    "bik": re.compile(r"БИК"),
+    "bank_name": re.compile(r"банк", re.IGNORECASE),
+    "bank_inn": re.compile(r"ИНН\s+банка", re.IGNORECASE),
+    "bank_address": re.compile(r"адрес\s+банка", re.IGNORECASE),
+    "director": re.compile(r"директор|руководитель", re.IGNORECASE),
+}
+
+
+def _weighted(digits: str, weights: tuple[int, ...]) -> int:
+    return sum(int(d) * w for d, w in zip(digits, weights))
+
+
+def is_valid_inn(inn: str) -> bool:
+    if not inn.isdigit():
+        return False
+    if len(inn) == 10:
+        return _weighted(inn, _INN10_WEIGHTS) % 11 % 10 == int(inn[9])
+    if len(inn) == 12:
+        return (
+            _weighted(inn, _INN11_WEIGHTS) % 11 % 10 == int(inn[10])
+            and _weighted(inn, _INN12_WEIGHTS) % 11 % 10 == int(inn[11])
+        )
+    return False
+
+
+def is_valid_ogrn(ogrn: str) -> bool:
+    """ОГРН (13 digits) or ОГРНИП (15 digits)."""
+    if not ogrn.isdigit():
+        return False
+    if len(ogrn) == 13:
+        return int(ogrn[:12]) % 11 % 10 == int(ogrn[12])
+    if len(ogrn) == 15:
+        return int(ogrn[:14]) % 13 % 10 == int(ogrn[14])
+    return False
+
+
+def is_valid_bik(bik: str) -> bool:
+    # Russian БИК: 9 digits, country code 04
+    return len(bik) == 9 and bik.isdigit() and bik.startswith("04")
+
+
+def is_valid_account(account: str, bik: str) -> bool:
+    """Settlement account checked against the bank's БИК (last 3 digits of БИК)."""
+    if len(account) != 20 or not account.isdigit() or not is_valid_bik(bik):
+        return False
+    return _weighted(bik[-3:] + account, _ACCOUNT_WEIGHTS) % 10 == 0
+
+
+def is_valid_corr_account(account: str, bik: str) -> bool:
+    """Correspondent account checked against БИК ("0" + digits 5-6 of БИК)."""
+    if len(account) != 20 or not account.startswith("301") or not is_valid_bik(bik):
+        return False
+    return _weighted("0" + bik[4:6] + account, _ACCOUNT_WEIGHTS) % 10 == 0
+
+
+def _split_label(line: str) -> tuple[str, str]:
+    parts = _LABEL_SPLIT_RE.split(line, maxsplit=1)
+    if len(parts) == 2:
+        return parts[0].strip(), parts[1].strip()
+    return line.strip(), ""
+
+
+def _number_tokens(line: str) -> list[str]:
+    tokens = _DIGITS_RE.findall(line)
+    if _ACCOUNT_LABEL_RE.search(line):
+        # Accounts are often printed in groups: "40702 810 3 3800 0012345"
+        tokens += [t for t in _DIGITS_RE.findall(_DIGIT_GAP_RE.sub("", line)) if len(t) == 20]
+    return tokens
+
+
+def parse_requisites(text: str) -> dict[str, str]:
+    """Extract requisites without the LLM. Returns only fields that were found
+    and, for numeric fields, passed checksum validation."""
+    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    result: dict[str, str] = {}
+
+    inns: list[str] = []
+    bank_inns: list[str] = []
+    ogrns: list[str] = []
+    kpps: list[str] = []
+    biks: list[str] = []
+    accounts: list[str] = []
+    corr_accounts: list[str] = []
+
+    prev = ""
+    pending_label: str | None = None
+    for line in lines:
+        # A value printed on its own line takes the label context of the previous one
+        context = line if _LETTER_RE.search(line) else f"{prev} {line}"
+        lower = context.lower()
+        on_bank_line = "банк" in lower
+        # A checksum alone passes one random number in ten: require the label
+        on_inn_line = "инн" in line.lower() or "инн" in prev.lower()
+
+        for token in _number_tokens(line):
+            n = len(token)
+            if n in (10, 12) and on_inn_line and is_valid_inn(token):
+                (bank_inns if on_bank_line and n == 10 else inns).append(token)
+            elif n in (13, 15) and is_valid_ogrn(token):
+                ogrns.append(token)
+            elif n == 20:
+                (corr_accounts if token.startswith("301") else accounts).append(token)
+            elif n == 9:
+                has_bik, has_kpp = "бик" in lower, "кпп" in lower
+                if is_valid_bik(token) and (has_bik or not has_kpp):
+                    biks.append(token)
+                elif has_kpp:
+                    kpps.append(token)
+        if "кпп" in lower:
+            kpps += [t for t in _KPP_RE.findall(line) if not t.isdigit()]
+
+        label, value = _split_label(line)
+        if pending_label and not value and not _text_key(label):
+            label, value = pending_label, line
+        key = _text_key(label)
+        pending_label = label if key and not value else None
+        if key and value:
+            _store_text(result, key, value)
+        prev = line
+
+    if inns:
+        result["inn"] = inns[0]
+    if bank_inns:
+        result["bank_inn"] = bank_inns[0]
+    if ogrns:
+        result["ogrn"] = ogrns[0]
+    if kpps:
+        result["kpp"] = kpps[0]
+
+    # Pick the БИК the accounts validate against; accounts are only trusted paired
+    for bik in dict.fromkeys(biks):
+        account = next((a for a in accounts if is_valid_account(a, bik)), None)
+        corr = next((a for a in corr_accounts if is_valid_corr_account(a, bik)), None)
+        if account or corr:
+            result["bik"] = bik
+            if account:
+                result["bank_account"] = account
+            if corr:
+                result["corr_account"] = corr
+            break
+    else:
+        if biks:
+            result["bik"] = biks[0]
+
+    return result
+
+
+def _text_key(label: str) -> str | None:
+    if not label or len(label) > 60 or _DIGITS_RE.search(label):
+        return None
+    for key, pattern in _TEXT_LABELS.items():
+        if pattern.search(label):
+            return key
+    return None
+
+
+def _store_text(result: dict[str, str], key: str, value: str) -> None:
+    if key == "director":
+        match = _FIO_RE.search(value)
+        if match and "director" not in result:
+            result["director"] = match.group(0)
+    elif key == "phone_email":
+        result["phone_email"] = (
+            f"{result['phone_email']}, {value}" if "phone_email" in result else value
+        )
+    else:
+        result.setdefault(key, value)
+
+
+def missing_requisites(text: str, found: dict) -> list[str]:
+    """Keys not found locally that the text appears to contain."""
+    return [
+        key for key, marker in _MARKERS.items()
+        if key not in found and marker.search(text)
+    ]
+
+
+async def resolve_requisites(text: str, openai_service) -> tuple[dict, bool]:
+    """Extract requisites locally, asking the LLM only for the fields still missing.
+
+    Returns (requisites, complete); complete is False when the LLM step
+    failed and only the local fields are returned, so the result must not
+    be cached.
+    """
+    requisites = parse_requisites(text)
+    missing = missing_requisites(text, requisites)
+    if not missing:
+        logger.info("Requisites resolved locally (%d fields)", len(requisites))
+        return requisites, True
+
+    try:
+        extracted = await openai_service.extract_requisites(text, missing)
+    except Exception:
+        if not requisites:
+            raise
+        logger.exception("LLM requisite extraction failed, using local fields only")
+        return requisites, False
+    for key in missing:
+        if extracted.get(key):
+            requisites[key] = extracted[key]
+    return requisites, True
+
+
+def detect_side(schema: TemplateSchema, current_index: int) -> str:
     """Determine if we're filling client or executor fields based on current field group.
 
     Returns a prefix that matches the field key prefixes: 'client', 'customer', or 'executor'.
     """
-    if current_index < len(fields):
-        group = fields[current_index].get("group", "").lower()
+    if current_index < len(schema):
+        field = schema[current_index]
+        group = field.group.lower()
         if any(kw in group for kw in ("исполнитель", "получатель")):
             return "executor"
         # Check field key prefix to determine correct side prefix
-        key = fields[current_index].get("key", "")
-        if key.startswith("customer_"):
+        if field.key.startswith("customer_"):
             return "customer"
     return "client"
 
 
 def map_requisites_to_fields(
     requisites: dict,
-    fields: list[dict],
+    schema: TemplateSchema,
     side: str,
 ) -> dict[str, str]:
     """Map parsed requisites to template field keys for the given side.
 
     Args:
         requisites: AI-parsed dict like {"company_name": "ООО ...", "inn": "123..."}
-        fields: Template field definitions (each has "key")
+        schema: Compiled template fields
         side: "client" or "executor"
 
     Returns:
         Dict mapping field_key -> value for fields that matched.
     """
-    field_keys = {f["key"] for f in fields}
     result = {}
 
     for req_key, value in requisites.items():
@@ -153,7 +610,7 @@ def map_requisites_to_fields(
             continue
         candidates = REQUISITE_TO_FIELD_MAP.get(req_key, [])
         for candidate in candidates:
-            if candidate in field_keys and candidate.startswith(side):
+            if schema.index_of(candidate) is not None and candidate.startswith(side):
                 result[candidate] = str(value).strip()
                 break
 
@@ -0,0 +1,96 @@
+"""Read requisites from an uploaded company card.
+
+The card is downloaded into a memory buffer (see uploads) and its bytes are
+handed to the extraction worker pool; nothing is written to output_dir.
+Results are cached in SQLite: first by Telegram's file_unique_id, which
+skips even the download for a file seen before, then by the SHA-256 of the
+downloaded bytes, which catches the same card re-sent as a new file.
+Only complete results are cached: if the LLM step fails, the locally found
+fields are returned but the card is read again next time.
+"""
+
+import asyncio
+import logging
+import zipfile
+
+import aiosqlite
+from aiogram import Bot
+from aiogram.types import Document
+
+from app.database.repositories.requisite_cache_repo import (
+    get_cached_by_file_id,
+    get_cached_by_hash,
+    link_file_id,
+    prune_cache,
+    save_cached,
+)
+from app.services.extraction_service import ExtractionError, ExtractionService
+from app.services.openai_service import OpenAIService
+from app.services.requisite_parser import resolve_requisites
+from app.services.uploads import check_docx_archive, download_document, stream_sha256
+
+logger = logging.getLogger(__name__)
+
+# Shorter than this, extracted text is treated as an empty/scanned file
+MIN_TEXT_LENGTH = 20
+
+
+class EmptyCardError(ExtractionError):
+    pass
+
+
+class InvalidCardError(ExtractionError):
+    pass
+
+
+class RequisiteReader:
+    def __init__(
+        self,
+        extraction_service: ExtractionService,
+        openai_service: OpenAIService,
+        cache_ttl: int = 30 * 86400,
+        cache_max_entries: int = 1000,
+    ):
+        self.extraction_service = extraction_service
+        self.openai_service = openai_service
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+
+    def check_size(self, size: int | None) -> None:
+        self.extraction_service.check_size(size)
+
+    async def read(self, bot: Bot, document: Document, db: aiosqlite.Connection) -> dict:
+        """Return requisites found in the card. Raises ExtractionError subclasses."""
+        cached = await get_cached_by_file_id(db, document.file_unique_id, self.cache_ttl)
+        if cached is not None:
+            logger.info("Requisite cache hit by file id")
+            return cached
+
+        is_pdf = document.file_name.lower().endswith(".pdf")
+        max_bytes = self.extraction_service.max_bytes
+        with await download_document(bot, document, max_bytes) as buffer:
+            content_hash = await asyncio.to_thread(stream_sha256, buffer)
+            cached = await get_cached_by_hash(db, content_hash, self.cache_ttl)
+            if cached is not None:
+                logger.info("Requisite cache hit by content hash")
+                await link_file_id(db, document.file_unique_id, content_hash)
+                return cached
+
+            if not is_pdf:
+                try:
+                    check_docx_archive(buffer, max_bytes)
+                except zipfile.BadZipFile:
+                    raise InvalidCardError(document.file_name)
+            data = buffer.read()
+
+        text = await self.extraction_service.extract(data, is_pdf)
+
+        if len(text.strip()) < MIN_TEXT_LENGTH:
+            raise EmptyCardError(document.file_name)
+
+        requisites, complete = await resolve_requisites(text, self.openai_service)
+        # A partial result (LLM step failed) is retried on the next upload
+        if requisites and complete:
+            await save_cached(db, content_hash, document.file_unique_id, requisites)
+            await prune_cache(db, self.cache_ttl, self.cache_max_entries)
+        return requisites
@@ -0,0 +1,49 @@
+"""Coalesce identical LLM calls that are in flight at the same time.
+
+The first caller starts the request as a task; callers arriving with the
+same key while it runs await that task instead of sending a duplicate.
+Waiters await it through asyncio.shield, so a cancelled waiter (user
+pressed cancel, handler timed out) never cancels the call the others share.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+        # kind -> [calls started, duplicate calls joined to one in flight]
+        self._counts: dict[str, list[int]] = {}
+
+    async def do(self, kind: str, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        counts = self._counts.setdefault(kind, [0, 0])
+        task = self._inflight.get(key)
+        if task is None:
+            counts[0] += 1
+            task = asyncio.create_task(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            counts[1] += 1
+            logger.debug("Joined in-flight %s request", kind)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict[str, dict]:
+        """Per-kind counters: requests sent and duplicates that shared one."""
+        return {
+            kind: {"calls": calls, "duplicates": duplicates}
+            for kind, (calls, duplicates) in self._counts.items()
+        }
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Retrieve the exception so a call abandoned by all waiters doesn't warn
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Shared %s call failed: %r", key[:12], task.exception())
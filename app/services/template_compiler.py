@@ -0,0 +1,203 @@
+"""Precompile .docx templates into a reusable render artifact.
+
+docxtpl re-patches the XML (merging placeholders split across Word runs) and
+re-compiles it with Jinja2 on every render. For user templates this work is
+done once at upload time and stored next to the template as
+``<name>.compiled.json``: the variable set, a content hash, the patched XML
+of every part, the Jinja2 code compiled to Python source and the
+compile-check results. DocumentService renders straight from the artifact.
+
+The compiled code targets the installed Jinja2 runtime, so the artifact
+records the Jinja2 version and is recompiled when it changes.
+"""
+
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import BinaryIO
+
+import jinja2
+from docxtpl import DocxTemplate
+from jinja2 import Environment, TemplateSyntaxError, meta
+from lxml import etree
+
+ARTIFACT_VERSION = 1
+JINJA_VERSION = jinja2.__version__
+ARTIFACT_SUFFIX = ".compiled.json"
+BODY_PART = "body"
+
+
+def artifact_path(template_path: str | Path) -> Path:
+    path = Path(template_path)
+    return path.with_name(path.stem + ARTIFACT_SUFFIX)
+
+
+def file_sha256(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compile_template(source: str | Path | BinaryIO, content_hash: str | None = None) -> dict:
+    """Parse, patch and compile a .docx template. Blocking — run in a thread.
+
+    source is a path or a seekable stream; pass content_hash when it is
+    already known to avoid hashing the file again. Returns the artifact dict.
+    Syntax errors are collected in ``artifact["errors"]`` instead of being
+    raised; a template with errors must not be used for rendering.
+    """
+    env = Environment()
+    if isinstance(source, (str, Path)):
+        source = str(source)
+        if content_hash is None:
+            content_hash = file_sha256(source)
+    else:
+        source.seek(0)
+        if content_hash is None:
+            content_hash = hashlib.sha256(source.read()).hexdigest()
+            source.seek(0)
+    tpl = DocxTemplate(source)
+    tpl.init_docx(reload=False)
+
+    sources: dict[str, tuple[str, str | None]] = {
+        BODY_PART: (tpl.patch_xml(tpl.get_xml()), None),
+    }
+    for uri in (DocxTemplate.HEADER_URI, DocxTemplate.FOOTER_URI):
+        for _, part in tpl.get_headers_footers(uri):
+            xml = tpl.get_part_xml(part)
+            encoding = tpl.get_headers_footers_encoding(xml)
+            sources[str(part.partname)] = (tpl.patch_xml(xml), encoding)
+
+    parts: dict[str, dict] = {}
+    variables: set[str] = set()
+    errors: list[str] = []
+    warnings: list[str] = []
+
+    for name, (patched, encoding) in sources.items():
+        # Same line layout docxtpl uses before handing XML to Jinja2
+        xml = re.sub(r"<w:p([ >])", r"\n<w:p\1", patched)
+        try:
+            variables |= meta.find_undeclared_variables(env.parse(xml))
+            code = env.compile(xml, raw=True)
+        except TemplateSyntaxError as exc:
+            errors.append(f"{name}: {exc.message} ({_error_context(xml, exc.lineno)})")
+            continue
+
+        # Dry run with empty values: the result must still be well-formed XML
+        try:
+            rendered = _load_code(env, code).render({})
+            etree.fromstring(re.sub(r"\n<w:p([ >])", r"<w:p\1", rendered).encode())
+        except Exception as exc:
+            warnings.append(f"{name}: {exc}")
+
+        parts[name] = {"xml": patched, "code": code, "encoding": encoding}
+
+    return {
+        "version": ARTIFACT_VERSION,
+        "jinja2": JINJA_VERSION,
+        "content_hash": content_hash,
+        "variables": sorted(variables),
+        "parts": parts,
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+def save_artifact(artifact: dict, template_path: str | Path) -> Path:
+    target = artifact_path(template_path)
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_text(json.dumps(artifact, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(target)
+    return target
+
+
+def load_artifact(template_path: str | Path, recompile: bool = False) -> dict | None:
+    """Load the artifact stored next to a template, or None if absent/stale.
+
+    With recompile=True a stale artifact (older format or Jinja2 version) is
+    rebuilt from the template and saved. Blocking — run in a thread.
+    """
+    try:
+        artifact = json.loads(artifact_path(template_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if artifact.get("errors"):
+        return None
+    if artifact.get("version") != ARTIFACT_VERSION or artifact.get("jinja2") != JINJA_VERSION:
+        if not recompile or not Path(template_path).exists():
+            return None
+        artifact = compile_template(template_path)
+        if artifact["errors"]:
+            return None
+        save_artifact(artifact, template_path)
+    return artifact
+
+
+class CompiledTemplate:
+    """Jinja2 templates materialized from an artifact, ready to render."""
+
+    def __init__(self, artifact: dict):
+        env = Environment()
+        self.content_hash = artifact["content_hash"]
+        self.variables = frozenset(artifact["variables"])
+        self.parts = {
+            name: (_load_code(env, part["code"]), part.get("encoding"))
+            for name, part in artifact["parts"].items()
+        }
+
+    def build(self, template_path: str | Path) -> "PrecompiledDocxTemplate":
+        return PrecompiledDocxTemplate(str(template_path), self)
+
+
+class PrecompiledDocxTemplate(DocxTemplate):
+    """DocxTemplate that skips XML patching and Jinja2 compilation."""
+
+    def __init__(self, template_file: str, compiled: CompiledTemplate):
+        super().__init__(template_file)
+        self.compiled = compiled
+
+    def build_xml(self, context, jinja_env=None):
+        template, _ = self.compiled.parts[BODY_PART]
+        return self._render_part(template, self.docx._part, context)
+
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        for rel_key, part in self.get_headers_footers(uri):
+            entry = self.compiled.parts.get(str(part.partname))
+            if entry is None:
+                # Part unknown to the artifact — render the regular way
+                xml = self.get_part_xml(part)
+                encoding = self.get_headers_footers_encoding(xml)
+                xml = self.render_xml_part(self.patch_xml(xml), part, context, jinja_env)
+            else:
+                template, encoding = entry
+                xml = self._render_part(template, part, context)
+            yield rel_key, xml.encode(encoding or "utf-8")
+
+    def _render_part(self, template, part, context) -> str:
+        # Mirrors DocxTemplate.render_xml_part after the Jinja2 step
+        self.current_rendering_part = part
+        dst_xml = template.render(context)
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = (
+            dst_xml.replace("{_{", "{{")
+            .replace("}_}", "}}")
+            .replace("{_%", "{%")
+            .replace("%_}", "%}")
+        )
+        return self.resolve_listing(dst_xml)
+
+
+def _load_code(env: Environment, source: str):
+    code = compile(source, "<docx template>", "exec")
+    return env.template_class.from_code(env, code, env.make_globals(None))
+
+
+def _error_context(xml: str, lineno: int | None) -> str:
+    lines = xml.splitlines()
+    if lineno is None or not 0 < lineno <= len(lines):
+        return ""
+    line = lines[lineno - 1]
+    return re.sub(r"<[^>]+>", "", line).strip()[:80]
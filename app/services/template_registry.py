@@ -1,54 +1,309 @@
+import asyncio
+import hashlib
 import json
-import re
+import logging
+import shutil
+import time
+from collections import OrderedDict
 from pathlib import Path
 
+from app.services.field_schema import FieldSchema, TemplateSchema, compile_schema
+from app.services.template_store import BLOBS_DIRNAME
+
+logger = logging.getLogger(__name__)
+
+META_FILENAME = "template_meta.json"
+# Immutable copies of global template files, one per content version
+VERSIONS_DIRNAME = ".versions"
+# How long a superseded version stays on disk for flows started before a reload
+VERSION_RETENTION_SECONDS = 24 * 3600
+# Compiled schemas kept for in-flight flows (global versions and user templates)
+SCHEMA_CACHE_SIZE = 256
+
+
+class _Entry:
+    """One parsed template entry; reused as-is while its inputs are unchanged."""
+
+    __slots__ = ("key", "meta", "schema")
+
+    def __init__(self, key: tuple, meta: dict, schema: TemplateSchema):
+        self.key = key
+        self.meta = meta
+        self.schema = schema
+
+
+class _Index:
+    """Immutable snapshot of all global templates. Swapped as a whole on reload."""
+
+    __slots__ = ("version", "entries")
+
+    def __init__(self, version: int, entries: dict[str, _Entry]):
+        self.version = version
+        self.entries = entries
+
 
 class TemplateRegistry:
     def __init__(self, templates_dir: str):
         self.templates_dir = Path(templates_dir)
-        self._meta: dict = {}
-        self._load_metadata()
+        self._versions_dir = self.templates_dir / VERSIONS_DIRNAME
+        self._schemas: OrderedDict[str, TemplateSchema] = OrderedDict()
+        # Field labels of the global templates, rebuilt when the index version changes
+        self._labels: dict[str, dict] = {}
+        self._labels_version = 0
+        self._index = self._build_index(None)
+        self._cache_index_schemas(self._index)
+        self._retired: dict[str, float] = {}
+        self._watch_task: asyncio.Task | None = None
+        self._prune_versions(startup=True)
+
+    @property
+    def version(self) -> int:
+        return self._index.version
+
+    # --- Hot reload ---
+
+    async def start_watching(self, poll_interval: float = 2.0) -> None:
+        """Watch templates_dir and reload the index when templates change."""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(poll_interval))
+
+    async def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def reload(self) -> bool:
+        """Rebuild the index in a worker thread and swap it in. Returns True if changed."""
+        old = self._index
+        new = await asyncio.to_thread(self._build_index, old)
+        if new is old:
+            return False
+
+        # Single attribute assignment: readers see either the old or the new index
+        self._index = new
+        self._cache_index_schemas(new)
+        now = time.monotonic()
+        current = {e.meta["filename"] for e in new.entries.values()}
+        for entry in old.entries.values():
+            if entry.meta["filename"] not in current:
+                self._retired.setdefault(entry.meta["filename"], now)
+        self._prune_versions()
+        logger.info("Templates reloaded: version %d, %d templates", new.version, len(new.entries))
+        return True
+
+    async def _watch(self, poll_interval: float) -> None:
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            awatch = None
+
+        if awatch is not None:
+            logger.info("Watching %s for template changes (inotify)", self.templates_dir)
+            async for _ in awatch(self.templates_dir, watch_filter=self._is_watched):
+                await self._reload_logged()
+            return
 
-    def _load_metadata(self) -> None:
-        meta_path = self.templates_dir / "template_meta.json"
+        logger.warning(
+            "watchfiles is not installed; polling %s for template changes every %.0fs",
+            self.templates_dir,
+            poll_interval,
+        )
+        # None forces one (usually no-op) reload to catch changes made before start
+        signature = None
+        while True:
+            current = await asyncio.to_thread(self._signature)
+            if current != signature:
+                signature = current
+                await self._reload_logged()
+            await asyncio.sleep(poll_interval)
+
+    async def _reload_logged(self) -> None:
+        try:
+            await self.reload()
+        except Exception:
+            # Keep serving the previous index; the next change retries
+            logger.exception("Template reload failed")
+
+    def _is_watched(self, change, path: str) -> bool:
+        p = Path(path)
+        if VERSIONS_DIRNAME in p.parts or BLOBS_DIRNAME in p.parts:
+            return False
+        return p.name == META_FILENAME or (
+            p.suffix == ".docx" and not p.name.startswith("user_")
+        )
+
+    def _signature(self) -> tuple:
+        """Cheap change detector for polling: stat of the meta file and its templates."""
+        paths = [self.templates_dir / META_FILENAME]
+        paths += [self.templates_dir / e.meta["source"] for e in self._index.entries.values()]
+        result = []
+        for path in paths:
+            try:
+                st = path.stat()
+                result.append((str(path), st.st_mtime_ns, st.st_size))
+            except OSError:
+                result.append((str(path), None, None))
+        return tuple(result)
+
+    def _build_index(self, previous: "_Index | None") -> "_Index":
+        """Parse template_meta.json, reusing entries whose inputs did not change."""
+        meta_path = self.templates_dir / META_FILENAME
+        raw: dict = {}
         if meta_path.exists():
             with open(meta_path, encoding="utf-8") as f:
-                self._meta = json.load(f)
+                raw = json.load(f)
+
+        old_entries = previous.entries if previous else {}
+        entries: dict[str, _Entry] = {}
+        changed = previous is None or set(raw) != set(old_entries)
+
+        for tid, tmpl in raw.items():
+            source = self.templates_dir / tmpl["filename"]
+            try:
+                st = source.stat()
+                file_key = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                logger.warning("Template file missing for %s: %s", tid, source)
+                file_key = None
+            key = (json.dumps(tmpl, sort_keys=True, ensure_ascii=False), file_key)
+
+            old = old_entries.get(tid)
+            if old is not None and old.key == key:
+                entries[tid] = old
+                continue
+
+            changed = True
+            entries[tid] = _Entry(
+                key,
+                self._parse_entry(tmpl, source, file_key),
+                compile_schema(tmpl.get("fields", [])),
+            )
+
+        if not changed:
+            return previous
+        version = previous.version + 1 if previous else 1
+        return _Index(version, entries)
+
+    def _parse_entry(self, tmpl: dict, source: Path, file_key: tuple | None) -> dict:
+        meta = dict(tmpl, source=tmpl["filename"])
+        if file_key is not None:
+            meta["filename"] = self._snapshot_file(source)
+        return meta
+
+    def _snapshot_file(self, source: Path) -> str:
+        """Copy a template to an immutable per-version file; return its relative path."""
+        digest = hashlib.sha256(source.read_bytes()).hexdigest()[:16]
+        name = f"{source.stem}-{digest}{source.suffix}"
+        target = self._versions_dir / name
+        if not target.exists():
+            self._versions_dir.mkdir(exist_ok=True)
+            tmp = target.with_name(name + ".tmp")
+            shutil.copyfile(source, tmp)
+            tmp.replace(target)
+        return f"{VERSIONS_DIRNAME}/{name}"
+
+    def _prune_versions(self, startup: bool = False) -> None:
+        """Delete snapshot files no flow can still reference."""
+        if not self._versions_dir.exists():
+            return
+        current = {e.meta["filename"] for e in self._index.entries.values()}
+        now = time.monotonic()
+        for path in self._versions_dir.iterdir():
+            rel = f"{VERSIONS_DIRNAME}/{path.name}"
+            if rel in current:
+                continue
+            # FSM storage is in memory, so nothing survives a restart
+            retired_at = self._retired.get(rel)
+            if startup or (
+                retired_at is not None and now - retired_at > VERSION_RETENTION_SECONDS
+            ):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                self._retired.pop(rel, None)
+
+    # --- Lookups ---
 
     def list_templates(self) -> list[dict]:
         return [
             {
                 "id": tid,
-                "display_name": tmpl["display_name"],
-                "icon": tmpl.get("icon", "📄"),
+                "display_name": entry.meta["display_name"],
+                "icon": entry.meta.get("icon", "📄"),
             }
-            for tid, tmpl in self._meta.items()
+            for tid, entry in self._index.entries.items()
         ]
 
     def get_template_meta(self, template_id: str) -> dict | None:
-        return self._meta.get(template_id)
+        entry = self._index.entries.get(template_id)
+        return entry.meta if entry else None
 
     def get_fields(self, template_id: str) -> list[dict]:
-        meta = self._meta.get(template_id)
+        meta = self.get_template_meta(template_id)
         if not meta:
             return []
         return meta.get("fields", [])
 
+    def known_field_labels(self) -> dict[str, dict]:
+        """{key: {label, prompt_ru, type}} for every field of the global templates."""
+        index = self._index
+        if self._labels_version != index.version:
+            labels = {}
+            for entry in index.entries.values():
+                for field in entry.meta.get("fields", []):
+                    if field.get("label") and field.get("prompt_ru"):
+                        labels.setdefault(field["key"], {
+                            "label": field["label"],
+                            "prompt_ru": field["prompt_ru"],
+                            "type": field.get("type", "string"),
+                        })
+            self._labels = labels
+            self._labels_version = index.version
+        return self._labels
+
     def get_template_path(self, template_id: str) -> Path | None:
-        meta = self._meta.get(template_id)
+        meta = self.get_template_meta(template_id)
         if not meta:
             return None
         return self.templates_dir / meta["filename"]
 
-    def validate_field(self, field_meta: dict, value: str) -> str | None:
+    # --- Field schemas ---
+
+    def get_schema(self, template_id: str) -> TemplateSchema | None:
+        """Compiled schema of the current version of a global template."""
+        entry = self._index.entries.get(template_id)
+        return entry.schema if entry else None
+
+    def load_schema(self, fields: list[dict], schema_id: str | None = None) -> TemplateSchema:
+        """Return the compiled schema for a field list, compiling it on a cache miss.
+
+        Flows store schema_id and the raw fields in FSM data; the raw fields
+        make the schema recoverable after eviction or a registry reload.
+        """
+        if schema_id is not None:
+            schema = self._schemas.get(schema_id)
+            if schema is not None:
+                self._schemas.move_to_end(schema_id)
+                return schema
+        schema = compile_schema(fields)
+        self._remember_schema(schema)
+        return schema
+
+    def validate_field(self, field: FieldSchema, value: str) -> str | None:
         """Validate a field value. Returns error message or None if valid."""
-        if not value.strip():
-            if field_meta.get("required"):
-                return f"Поле «{field_meta['label']}» обязательно для заполнения."
-            return None  # optional field, empty is OK
+        return field.validate(value)
 
-        pattern = field_meta.get("validation")
-        if pattern and not re.match(pattern, value.strip()):
-            return f"Неверный формат для «{field_meta['label']}»."
+    def _cache_index_schemas(self, index: "_Index") -> None:
+        for entry in index.entries.values():
+            self._remember_schema(entry.schema)
 
-        return None
+    def _remember_schema(self, schema: TemplateSchema) -> None:
+        self._schemas[schema.schema_id] = schema
+        self._schemas.move_to_end(schema.schema_id)
+        while len(self._schemas) > SCHEMA_CACHE_SIZE:
+            self._schemas.popitem(last=False)
@@ -0,0 +1,112 @@
+"""Content-addressed storage for uploaded user templates.
+
+Each distinct .docx is stored once under templates/blobs/, keyed by its
+SHA-256 and sharded two levels deep (blobs/ab/cd/<hash>.docx) so no directory
+grows past a few hundred entries. user_templates rows reference blobs by
+content_hash; a blob whose last reference is gone is removed by the sweeper
+after a grace period, so flows still using it can finish.
+"""
+
+import asyncio
+import logging
+import shutil
+from pathlib import Path
+from typing import BinaryIO
+
+import aiosqlite
+
+from app.database.repositories.template_blob_repo import (
+    delete_orphan_blob,
+    get_orphan_blobs,
+    register_blob,
+)
+from app.services.template_compiler import artifact_path
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIRNAME = "blobs"
+# Unreferenced blobs are kept this long after their last use
+ORPHAN_GRACE_SECONDS = 24 * 3600
+
+
+class TemplateBlobStore:
+    def __init__(self, templates_dir: str):
+        self.templates_dir = Path(templates_dir)
+        self.blobs_dir = self.templates_dir / BLOBS_DIRNAME
+        # Serializes add vs. sweep so a blob being re-uploaded is never collected
+        self._lock = asyncio.Lock()
+        self._sweeper: asyncio.Task | None = None
+
+    def relative_path(self, content_hash: str) -> str:
+        """Path relative to templates_dir, as stored in user_templates.filename."""
+        return f"{BLOBS_DIRNAME}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.docx"
+
+    def path(self, content_hash: str) -> Path:
+        return self.templates_dir / self.relative_path(content_hash)
+
+    async def add(
+        self, db: aiosqlite.Connection, src: BinaryIO, content_hash: str
+    ) -> tuple[str, bool]:
+        """Store a seekable stream under its hash. Returns (relative path, True if newly written)."""
+        async with self._lock:
+            src.seek(0, 2)
+            await register_blob(db, content_hash, src.tell())
+            created = await asyncio.to_thread(self._write, src, content_hash)
+        return self.relative_path(content_hash), created
+
+    def _write(self, src: BinaryIO, content_hash: str) -> bool:
+        target = self.path(content_hash)
+        if target.exists():
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        src.seek(0)
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(src, f)
+        tmp.replace(target)
+        return True
+
+    async def sweep(self, db: aiosqlite.Connection) -> int:
+        """Remove unreferenced blobs past the grace period. Returns the count removed."""
+        removed = 0
+        async with self._lock:
+            for content_hash in await get_orphan_blobs(db, ORPHAN_GRACE_SECONDS):
+                # Re-checked in the DELETE itself in case a reference appeared
+                if await delete_orphan_blob(db, content_hash, ORPHAN_GRACE_SECONDS):
+                    self._remove_files(content_hash)
+                    removed += 1
+        if removed:
+            logger.info("Template sweeper removed %d orphaned blobs", removed)
+        return removed
+
+    def _remove_files(self, content_hash: str) -> None:
+        path = self.path(content_hash)
+        for p in (path, artifact_path(path)):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+    # --- Background sweeper ---
+
+    async def start_sweeper(self, db_path: str, interval: float) -> None:
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop(db_path, interval))
+
+    async def stop_sweeper(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep_loop(self, db_path: str, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with aiosqlite.connect(db_path) as db:
+                    await self.sweep(db)
+            except Exception:
+                logger.exception("Template sweep failed")
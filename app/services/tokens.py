@@ -0,0 +1,30 @@
+"""Local token count estimates for prompt budgeting.
+
+Uses tiktoken when it is installed; otherwise a character-based estimate
+tuned for mixed Russian/English text, which is close enough for budgets.
+"""
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Roughly 3 characters per token for Cyrillic-heavy text on GPT-4o tokenizers
+CHARS_PER_TOKEN = 3
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD = 4
+
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD
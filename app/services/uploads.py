@@ -0,0 +1,91 @@
+"""Download user uploads into memory-backed buffers.
+
+Files are streamed into a SpooledTemporaryFile (in memory below
+SPOOL_THRESHOLD, an anonymous temp file above) and parsed straight from it,
+so nothing is left behind in output_dir. The size cap is enforced on every
+chunk, and .docx archives are checked for their uncompressed size before a
+parser opens them.
+"""
+
+import hashlib
+import tempfile
+import zipfile
+from typing import BinaryIO
+
+from aiogram import Bot
+from aiogram.types import Document
+
+SPOOL_THRESHOLD = 1024 * 1024
+# A .docx may unpack to at most this many times the upload limit
+MAX_UNCOMPRESSED_RATIO = 10
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+class _CappedWriter:
+    """File-like sink that aborts the download once max_bytes is exceeded."""
+
+    def __init__(self, buffer: BinaryIO, max_bytes: int):
+        self.buffer = buffer
+        self.max_bytes = max_bytes
+        self.written = 0
+
+    def write(self, chunk: bytes) -> int:
+        self.written += len(chunk)
+        if self.written > self.max_bytes:
+            raise FileTooLargeError(self.written)
+        return self.buffer.write(chunk)
+
+    def flush(self) -> None:
+        self.buffer.flush()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.buffer.seek(offset, whence)
+
+
+async def download_document(
+    bot: Bot, document: Document, max_bytes: int
+) -> tempfile.SpooledTemporaryFile:
+    """Download a Telegram document into a spooled buffer positioned at 0.
+
+    Raises FileTooLargeError as soon as the declared or received size
+    exceeds max_bytes. The caller owns (and must close) the buffer.
+    """
+    if document.file_size is not None and document.file_size > max_bytes:
+        raise FileTooLargeError(document.file_size)
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+    try:
+        file = await bot.get_file(document.file_id)
+        await bot.download_file(file.file_path, _CappedWriter(buffer, max_bytes))
+    except BaseException:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+
+def stream_sha256(stream: BinaryIO) -> str:
+    """SHA-256 of a seekable stream; leaves it rewound."""
+    stream.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1 << 16), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def check_docx_archive(stream: BinaryIO, max_bytes: int) -> None:
+    """Reject archives that would unpack past MAX_UNCOMPRESSED_RATIO * max_bytes.
+
+    Only the zip central directory is read. Raises zipfile.BadZipFile for
+    files that are not archives at all.
+    """
+    stream.seek(0)
+    with zipfile.ZipFile(stream) as archive:
+        total = sum(info.file_size for info in archive.infolist())
+    stream.seek(0)
+    if total > max_bytes * MAX_UNCOMPRESSED_RATIO:
+        raise FileTooLargeError(total)
@@ -7,11 +7,21 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from app.database.connection import init_db
 from app.handlers import admin, chat, common, document, requisites, upload
 from app.middlewares.db_middleware import DatabaseMiddleware
+from app.middlewares.usage_middleware import UsageContextMiddleware
 from app.middlewares.user_middleware import UserRegistrationMiddleware
 from app.middlewares.whitelist_middleware import WhitelistMiddleware
 from app.services.document_service import DocumentService
+from app.services.extraction_service import ExtractionService
+from app.services.flow_tasks import FlowTasks
+from app.services.generation_scheduler import GenerationScheduler
+from app.services.genitive import GenitiveService
+from app.services.llm_cache import LLMCache
+from app.services.llm_client import AdaptiveLimiter, CircuitBreaker, LLMClient
+from app.services.llm_usage import LLMUsage
 from app.services.openai_service import OpenAIService
+from app.services.requisite_reader import RequisiteReader
 from app.services.template_registry import TemplateRegistry
+from app.services.template_store import TemplateBlobStore
 from config.settings import settings
 
 
@@ -25,13 +35,57 @@ async def main():
     await init_db()
 
     # Create services
-    openai_service = OpenAIService(
+    llm_cache = LLMCache(
+        settings.db_path,
+        ttl=settings.llm_cache_ttl,
+        max_memory_entries=settings.llm_cache_memory_entries,
+    )
+    llm_usage = LLMUsage(
+        settings.db_path,
+        prices=settings.llm_prices,
+        retention_days=settings.llm_usage_retention_days,
+    )
+    await llm_usage.start(settings.llm_usage_flush_interval)
+    llm_client = LLMClient(
         api_key=settings.openai_api_key,
         base_url=settings.openai_base_url,
+        timeouts=settings.llm_timeouts,
+        default_timeout=settings.llm_timeout,
+        max_retries=settings.llm_max_retries,
+        limiter=AdaptiveLimiter(max_limit=settings.llm_max_concurrency),
+        breaker=CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_reset),
+        hedged_methods=settings.llm_hedged_methods,
+        hedge_max_rate=settings.llm_hedge_max_rate,
+        usage=llm_usage,
+    )
+    openai_service = OpenAIService(
+        llm_client,
         model=settings.openai_chat_model,
+        cache=llm_cache,
     )
+    genitive_service = GenitiveService(settings.db_path, openai_service)
+    await genitive_service.load()
     template_registry = TemplateRegistry(settings.templates_dir)
+    await template_registry.start_watching(settings.templates_poll_interval)
+    template_store = TemplateBlobStore(settings.templates_dir)
+    await template_store.start_sweeper(settings.db_path, settings.template_sweep_interval)
     document_service = DocumentService(settings.templates_dir, settings.output_dir)
+    generation_scheduler = GenerationScheduler(
+        max_concurrent=settings.generation_max_concurrent,
+        max_queue=settings.generation_queue_size,
+    )
+    extraction_service = ExtractionService(
+        max_workers=settings.extraction_workers,
+        max_bytes=settings.extraction_max_file_mb * 1024 * 1024,
+        max_pages=settings.extraction_max_pages,
+        timeout=settings.extraction_timeout,
+    )
+    requisite_reader = RequisiteReader(
+        extraction_service,
+        openai_service,
+        cache_ttl=settings.requisite_cache_ttl,
+        cache_max_entries=settings.requisite_cache_max_entries,
+    )
 
     # Create bot and dispatcher
     bot = Bot(token=settings.bot_token)
@@ -41,13 +95,20 @@ async def main():
     dp.message.middleware(DatabaseMiddleware())
     dp.message.middleware(WhitelistMiddleware())
     dp.message.middleware(UserRegistrationMiddleware())
+    dp.message.middleware(UsageContextMiddleware())
     dp.callback_query.middleware(DatabaseMiddleware())
     dp.callback_query.middleware(WhitelistMiddleware())
+    dp.callback_query.middleware(UsageContextMiddleware())
 
     # Inject services into handler data
     dp["openai_service"] = openai_service
     dp["template_registry"] = template_registry
     dp["document_service"] = document_service
+    dp["generation_scheduler"] = generation_scheduler
+    dp["template_store"] = template_store
+    dp["requisite_reader"] = requisite_reader
+    dp["flow_tasks"] = FlowTasks()
+    dp["genitive_service"] = genitive_service
 
     # Register routers (order matters: specific first, catch-all last)
     dp.include_routers(
@@ -61,14 +122,20 @@ async def main():
 
     # Start polling with retry on network errors
     logger = logging.getLogger(__name__)
-    while True:
-        try:
-            logger.info("Bot starting...")
-            await dp.start_polling(bot)
-            break
-        except Exception as e:
-            logger.error("Bot crashed: %s. Retrying in 5 seconds...", e)
-            await asyncio.sleep(5)
+    try:
+        while True:
+            try:
+                logger.info("Bot starting...")
+                await dp.start_polling(bot)
+                break
+            except Exception as e:
+                logger.error("Bot crashed: %s. Retrying in 5 seconds...", e)
+                await asyncio.sleep(5)
+    finally:
+        await template_store.stop_sweeper()
+        await template_registry.stop_watching()
+        extraction_service.shutdown()
+        await llm_usage.stop()
 
 
 if __name__ == "__main__":
@@ -14,9 +14,32 @@ class Settings(BaseSettings):
     openai_base_url: str = "https://openrouter.ai/api/v1"
     openai_chat_model: str = "openai/gpt-4o-mini"
     openai_document_model: str = "openai/gpt-4o"
+    llm_timeout: float = 30  # Seconds per attempt unless llm_timeouts overrides the method
+    llm_timeouts: dict[str, float] = {
+        "chat": 60,
+        "field_labels": 90,
+        "requisites": 45,
+        "field_values": 45,
+        "genitive": 15,
+    }
+    llm_max_retries: int = 3  # Retries on 429/5xx/timeouts
+    llm_max_concurrency: int = 16  # Upper bound for the adaptive limit
+    llm_breaker_failures: int = 5  # Consecutive failures that open the breaker
+    llm_breaker_reset: float = 30  # Seconds before a trial call after opening
+    llm_hedged_methods: list[str] = ["requisites", "target_queries"]  # Re-sent at p90 latency
+    llm_hedge_max_rate: float = 0.1  # Share of calls that may be hedged
+    llm_usage_flush_interval: float = 60  # Seconds between usage table writes
+    llm_usage_retention_days: int = 90
+    # USD per 1M [prompt, completion] tokens, for cost estimates
+    llm_prices: dict[str, list[float]] = {
+        "openai/gpt-4o-mini": [0.15, 0.6],
+        "openai/gpt-4o": [2.5, 10.0],
+    }
 
     # Paths
     templates_dir: str = str(BASE_DIR / "templates")
+    templates_poll_interval: float = 2.0  # Seconds, when inotify is unavailable
+    template_sweep_interval: float = 3600  # Seconds between orphaned blob sweeps
     output_dir: str = str(BASE_DIR / "output")
     db_path: str = str(BASE_DIR / "data" / "teledocs.db")
 
@@ -26,6 +49,19 @@ class Settings(BaseSettings):
 
     # Limits
     max_conversation_messages: int = 20
+    chat_history_token_budget: int = 3000  # Estimated prompt tokens per chat turn
+    chat_stream_edit_interval: float = 1.0  # Seconds between edits of a streamed reply
+    llm_cache_ttl: int = 30 * 86400  # Seconds cached target queries / genitive forms live
+    llm_cache_memory_entries: int = 512
+    generation_max_concurrent: int = 4  # Renders running at once (all users)
+    generation_queue_size: int = 50  # Jobs allowed to wait before "busy"
+    template_max_file_mb: int = 20  # Uploaded .docx templates
+    extraction_workers: int = 2  # Processes parsing uploaded company cards
+    extraction_max_file_mb: int = 20
+    extraction_max_pages: int = 50  # PDF pages read per company card
+    extraction_timeout: float = 30  # Seconds per file before the worker is killed
+    requisite_cache_ttl: int = 30 * 86400  # Seconds a cached card extraction stays valid
+    requisite_cache_max_entries: int = 1000
 
     model_config = {
         "env_file": str(BASE_DIR / ".env"),
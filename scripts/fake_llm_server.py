@@ -0,0 +1,258 @@
+"""Local OpenAI-compatible chat completions server for offline load tests.
+
+Answers the bot's prompts (chat, target queries, genitive form, requisites,
+field values, field labels, history summary) with canned responses, with configurable
+latency, 5xx and 429 injection and SSE streaming. No tokens are spent.
+
+Run:    python scripts/fake_llm_server.py --port 8089 --latency 0.4 --slow-rate 0.05
+Then:   OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python bot.py
+
+Scripted responses (--script rules.json) are checked before the canned ones:
+    [{"match": "стоматолог", "content": "1. стоматология"},
+     {"match": "ошибка", "status": 429, "retry_after": 2}]
+"match" is a regex searched in the last message. GET /stats returns
+request counters.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+from aiohttp import web
+
+CANNED_REQUISITES = {
+    "company_name": "ООО «Тестовая компания»",
+    "inn": "7707083893",
+    "kpp": "773601001",
+    "ogrn": "1027700132195",
+    "legal_address": "117312, г. Москва, ул. Вавилова, д. 19",
+    "bank_name": "ПАО Сбербанк",
+    "bik": "044525225",
+    "bank_account": "40702810938000000001",
+    "corr_account": "30101810400000000225",
+    "director_name": "Иванов Иван Иванович",
+    "phone_email": "+7 495 000-00-00, test@example.com",
+}
+
+TARGET_QUERIES = [
+    "стоматология", "стоматолог", "стоматологическая клиника", "лечение зубов",
+    "лечение кариеса", "пломбирование зубов", "профессиональная чистка зубов",
+    "отбеливание зубов", "лечение каналов", "удаление зуба", "имплантация зубов",
+    "протезирование зубов", "брекеты", "детский стоматолог", "стоматология рядом",
+    "стоматолог рядом", "записаться к стоматологу", "срочная стоматология",
+    "стоматология круглосуточно", "стоматология без очереди",
+]
+
+
+class FakeLLM:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rules = []
+        if args.script:
+            with open(args.script, encoding="utf-8") as f:
+                self.rules = [dict(rule, match=re.compile(rule["match"], re.I)) for rule in json.load(f)]
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "streams": 0, "by_kind": {}}
+
+    async def completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        messages = body.get("messages", [])
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = messages[-1]["content"] if messages else ""
+        kind = detect_kind(system)
+        self.stats["requests"] += 1
+        self.stats["by_kind"][kind] = self.stats["by_kind"].get(kind, 0) + 1
+
+        await asyncio.sleep(self.latency())
+
+        rule = next((r for r in self.rules if r["match"].search(user)), None)
+        status = rule.get("status") if rule else None
+        if status is None:
+            roll = random.random()
+            if roll < self.args.rate_limit_rate:
+                status = 429
+            elif roll < self.args.rate_limit_rate + self.args.error_rate:
+                status = 500
+        if status == 429:
+            self.stats["rate_limited"] += 1
+            retry_after = rule.get("retry_after", self.args.retry_after) if rule else self.args.retry_after
+            return web.json_response(
+                {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                status=429,
+                headers={"Retry-After": str(retry_after)},
+            )
+        if status is not None:
+            self.stats["errors"] += 1
+            return web.json_response(
+                {"error": {"message": "Injected upstream error", "type": "server_error"}},
+                status=status,
+            )
+
+        content = rule["content"] if rule and "content" in rule else canned_response(kind, system, user)
+        model = body.get("model", "fake")
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 3
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 3,
+            "total_tokens": prompt_tokens + len(content) // 3,
+        }
+        if body.get("stream"):
+            self.stats["streams"] += 1
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            return await self.stream(request, model, content, usage if include_usage else None)
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": usage,
+        })
+
+    async def stream(
+        self, request: web.Request, model: str, content: str, usage: dict | None
+    ) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        pieces = re.findall(r"\S+\s*", content) or [content]
+        for i, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            await self.send_chunk(response, chunk_id, model, delta, None)
+            await asyncio.sleep(self.args.token_delay)
+        await self.send_chunk(response, chunk_id, model, {}, "stop")
+        if usage is not None:
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": usage,
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    async def send_chunk(response, chunk_id, model, delta, finish_reason) -> None:
+        chunk = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+
+    def latency(self) -> float:
+        """Log-normal around --latency, with a --slow-rate share of slow replicas."""
+        if random.random() < self.args.slow_rate:
+            return self.args.slow_latency
+        if self.args.latency <= 0:
+            return 0.0
+        return self.args.latency * random.lognormvariate(0, self.args.jitter)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+def detect_kind(system: str) -> str:
+    if "поисковых запросов" in system:
+        return "target_queries"
+    if "родительный падеж" in system:
+        return "genitive"
+    if "карточек предприятий" in system:
+        return "requisites"
+    if "значения полей шаблона" in system:
+        return "field_values"
+    if "имён переменных" in system:
+        return "field_labels"
+    if "перескажи" in system:
+        return "summary"
+    return "chat"
+
+
+def canned_response(kind: str, system: str, user: str) -> str:
+    if kind == "target_queries":
+        match = re.search(r"Составь (\d+)", system)
+        count = int(match.group(1)) if match else 20
+        queries = (TARGET_QUERIES * (count // len(TARGET_QUERIES) + 1))[:count]
+        return "\n".join(f"{i}. {q}" for i, q in enumerate(queries, 1))
+    if kind == "genitive":
+        return genitive(user)
+    if kind in ("requisites", "field_values"):
+        keys = re.findall(r"^- (\w+):", system, re.M) or list(CANNED_REQUISITES)
+        return json.dumps(
+            {k: CANNED_REQUISITES.get(k, f"тест {k}") for k in keys}, ensure_ascii=False
+        )
+    if kind == "field_labels":
+        names = [n.strip() for n in user.split(",") if n.strip()]
+        return json.dumps({
+            n: {
+                "label": n.replace("_", " ").capitalize(),
+                "prompt_ru": f"Введите {n.replace('_', ' ')}:",
+                "type": "date" if "date" in n else "string",
+            }
+            for n in names
+        }, ensure_ascii=False)
+    if kind == "summary":
+        return "Пользователь обсуждал с ассистентом подготовку документов."
+    return f"Тестовый ответ на сообщение: {user[:200]}"
+
+
+def genitive(phrase: str) -> str:
+    """Rough genitive form of the last word; good enough for canned replies."""
+    words = phrase.strip().lower().split()
+    if not words:
+        return phrase
+    last = words[-1]
+    if last.endswith("ия"):
+        last = last[:-1] + "и"
+    elif last.endswith(("а", "я")):
+        last = last[:-1] + ("и" if last[-2:-1] in "гкхжчшщ" else "ы")
+    elif last[-1] not in "аеёиоуыэюяь":
+        last += "а"
+    return " ".join(words[:-1] + [last])
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3, help="median seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.3, help="log-normal sigma of the latency")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests that are slow")
+    parser.add_argument("--slow-latency", type=float, default=10.0, help="seconds for slow requests")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between stream chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of 429s, seconds")
+    parser.add_argument("--script", help="JSON file with scripted responses")
+    return parser
+
+
+def create_app(args: argparse.Namespace) -> web.Application:
+    fake = FakeLLM(args)
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", fake.completions)
+    app.router.add_post("/chat/completions", fake.completions)
+    app.router.add_get("/stats", fake.get_stats)
+    return app
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    web.run_app(create_app(args), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Drive OpenAIService with concurrent requests and report latency percentiles.
+
+Meant to run against scripts/fake_llm_server.py, fully offline:
+
+    python scripts/fake_llm_server.py --latency 0.4 --slow-rate 0.05 --rate-limit-rate 0.02
+    python scripts/llm_load_test.py --base-url http://127.0.0.1:8089/v1 --users 50
+
+Uses the same LLMClient policies as the bot (timeouts, retries, breaker,
+hedging) but no response cache, so every request reaches the server.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("BOT_TOKEN", "offline")
+os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+from app.services.llm_client import AdaptiveLimiter, CircuitBreaker, LLMClient  # noqa: E402
+from app.services.openai_service import OpenAIService  # noqa: E402
+from config.settings import settings  # noqa: E402
+
+BUSINESS_TYPES = ["стоматология", "автосервис", "салон красоты", "ресторан", "фитнес-клуб"]
+CARD_TEXT = "ООО «Ромашка», ИНН 7707083893, КПП 773601001, р/с 40702810938000000001"
+
+
+async def user_flow(service: OpenAIService, user_id: int, latencies: dict, errors: dict):
+    business = random.choice(BUSINESS_TYPES)
+    steps = [
+        ("target_queries", lambda: service.generate_target_queries(business, refresh=True)),
+        ("genitive", lambda: service.convert_business_type_genitive(business, refresh=True)),
+        ("requisites", lambda: service.extract_requisites(CARD_TEXT, ["company_name", "bik"])),
+        ("chat", lambda: _drain(service.chat(user_id, "Как составить акт?", stream=True))),
+    ]
+    for name, call in steps:
+        started = time.monotonic()
+        try:
+            await call()
+        except Exception as e:
+            errors[name] = errors.get(name, 0) + 1
+            errors.setdefault("types", set()).add(type(e).__name__)
+            continue
+        latencies.setdefault(name, []).append(time.monotonic() - started)
+
+
+async def _drain(stream) -> None:
+    async for _ in stream:
+        pass
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8089/v1")
+    parser.add_argument("--users", type=int, default=20, help="concurrent user flows")
+    parser.add_argument("--rounds", type=int, default=3, help="flows per user")
+    args = parser.parse_args()
+
+    llm = LLMClient(
+        api_key="offline",
+        base_url=args.base_url,
+        timeouts=settings.llm_timeouts,
+        default_timeout=settings.llm_timeout,
+        max_retries=settings.llm_max_retries,
+        limiter=AdaptiveLimiter(max_limit=settings.llm_max_concurrency),
+        breaker=CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_reset),
+        hedged_methods=settings.llm_hedged_methods,
+        hedge_max_rate=settings.llm_hedge_max_rate,
+    )
+    service = OpenAIService(llm, model="fake")
+    latencies: dict[str, list[float]] = {}
+    errors: dict = {}
+
+    started = time.monotonic()
+    for _ in range(args.rounds):
+        await asyncio.gather(*(
+            user_flow(service, user_id, latencies, errors) for user_id in range(args.users)
+        ))
+    elapsed = time.monotonic() - started
+
+    print(f"{args.users} users x {args.rounds} rounds in {elapsed:.1f}s")
+    for name, values in latencies.items():
+        print(
+            f"  {name:15} n={len(values):4}  p50={percentile(values, 0.5):.2f}s  "
+            f"p90={percentile(values, 0.9):.2f}s  p99={percentile(values, 0.99):.2f}s  "
+            f"errors={errors.get(name, 0)}"
+        )
+    if errors.get("types"):
+        print("  error types:", ", ".join(sorted(errors["types"])))
+    stats = llm.stats()
+    print(f"  breaker={stats['breaker']} limit={stats['limit']}")
+    for method, s in stats["methods"].items():
+        print(f"  {method:15} retries={s['retries']} hedges={s['hedges']} hedge_wins={s['hedge_wins']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,5 @@
+import os
+
+# Settings require these; tests never reach Telegram or OpenAI
+os.environ.setdefault("BOT_TOKEN", "offline")
+os.environ.setdefault("OPENAI_API_KEY", "offline")
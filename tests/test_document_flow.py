@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.handlers.document import (
+    GENITIVE_TASK,
+    ai_queries_accept,
+    ai_queries_regenerate,
+    collect_requisite,
+)
+from app.services.flow_tasks import FlowTasks
+from app.services.genitive import GenitiveService
+from app.services.template_registry import TemplateRegistry
+
+FIELDS = [
+    {"key": "target_queries", "label": "Запросы", "auto": "ai_queries"},
+    {"key": "customer_name", "label": "Заказчик"},
+]
+
+
+class _Sent:
+    async def delete(self):
+        pass
+
+    async def edit_reply_markup(self, reply_markup=None):
+        pass
+
+    async def answer(self, text, reply_markup=None):
+        return _Sent()
+
+
+class _Message(_Sent):
+    def __init__(self, text: str):
+        self.text = text
+        self.forward_origin = None
+        self.from_user = SimpleNamespace(id=1)
+
+
+class _Callback:
+    def __init__(self):
+        self.from_user = SimpleNamespace(id=1)
+        self.message = _Sent()
+
+    async def answer(self, text=None):
+        pass
+
+
+class _FakeAI:
+    async def generate_target_queries(self, business_type, refresh=False):
+        return f"1. {business_type}"
+
+    async def convert_business_type_genitive(self, business_type, refresh=False):
+        await asyncio.sleep(0.01)
+        return f"генитив {business_type}"
+
+
+def _flow(tmp_path):
+    registry = TemplateRegistry(str(tmp_path))
+    schema = registry.load_schema(FIELDS)
+    state = FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=1, user_id=1))
+    initial = dict(
+        template_display_name="Договор",
+        fields=FIELDS,
+        schema_id=schema.schema_id,
+        current_field_index=0,
+        collected_data={},
+        skipped_fields=[],
+    )
+    return registry, state, initial
+
+
+def test_regenerate_cancels_the_genitive_task(tmp_path):
+    async def scenario():
+        registry, state, initial = _flow(tmp_path)
+        await state.update_data(**initial)
+        ai = _FakeAI()
+        flow_tasks = FlowTasks()
+        await collect_requisite(
+            _Message("SMM агентство"), state, registry, ai,
+            GenitiveService(str(tmp_path / "bot.db"), ai), flow_tasks,
+        )
+        task = flow_tasks._tasks[(1, GENITIVE_TASK)]
+        await ai_queries_regenerate(_Callback(), state, registry, flow_tasks)
+        await asyncio.sleep(0)
+        return task, flow_tasks
+
+    task, flow_tasks = asyncio.run(scenario())
+
+    assert task.cancelled()
+    assert flow_tasks.pop(1, GENITIVE_TASK) is None
+
+
+def test_accept_uses_genitive_of_the_last_business_type(tmp_path):
+    async def scenario():
+        registry, state, initial = _flow(tmp_path)
+        await state.update_data(**initial)
+        ai = _FakeAI()
+        genitive_service = GenitiveService(str(tmp_path / "bot.db"), ai)
+        flow_tasks = FlowTasks()
+
+        async def enter(business_type):
+            await collect_requisite(
+                _Message(business_type), state, registry, ai, genitive_service, flow_tasks
+            )
+
+        await enter("SMM агентство")  # not known locally: the LLM task starts
+        await ai_queries_regenerate(_Callback(), state, registry, flow_tasks)
+        await enter("стоматология")  # known locally
+        await ai_queries_accept(_Callback(), state, genitive_service, registry, flow_tasks)
+        return (await state.get_data())["collected_data"]
+
+    collected = asyncio.run(scenario())
+
+    assert collected["target_queries"] == "1. стоматология"
+    assert collected["customer_business_type_genitive"] == "стоматологической клиники"
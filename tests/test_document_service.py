@@ -0,0 +1,32 @@
+import zipfile
+from pathlib import Path
+
+from app.services.document_service import DocumentService
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+
+
+def _document_xml(path: str) -> str:
+    with zipfile.ZipFile(path) as docx:
+        return docx.read("word/document.xml").decode("utf-8")
+
+
+def test_rerender_from_saved_context_keeps_number_and_date(tmp_path):
+    service = DocumentService(str(TEMPLATES_DIR), str(tmp_path))
+    context = service.stamp({"executor_name": "Иванов Иван Иванович"})
+
+    first = service._render("service_agreement.docx", context, user_id=1)
+    again = service._render("service_agreement.docx", context, user_id=1)
+
+    assert context["document_number"] in _document_xml(first)
+    assert context["document_number"] in _document_xml(again)
+
+
+def test_stamp_keeps_existing_values(tmp_path):
+    service = DocumentService(str(TEMPLATES_DIR), str(tmp_path))
+    context = {"document_number": "20260101-ABCD", "generation_date": "01.01.2026"}
+
+    stamped = service.stamp(context)
+
+    assert stamped == context
+    assert stamped is not context
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from app.services.generation_scheduler import GenerationScheduler, SchedulerBusyError
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_users_are_served_round_robin():
+    async def scenario():
+        scheduler = GenerationScheduler(max_concurrent=1, max_queue=10)
+        gate = asyncio.Event()
+        order = []
+
+        def job(name):
+            async def run():
+                order.append(name)
+                await gate.wait()
+            return run
+
+        tasks = []
+        for user_id, name in [(1, "A1"), (1, "A2"), (1, "A3"), (1, "A4"), (2, "B1"), (3, "C1")]:
+            tasks.append(asyncio.create_task(scheduler.run(user_id, job(name))))
+            await _settle()
+        gate.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(scenario())
+
+    # B and C don't wait behind all of A's batch
+    assert order == ["A1", "A2", "B1", "C1", "A3", "A4"]
+
+
+def test_per_user_limit():
+    async def scenario():
+        scheduler = GenerationScheduler(max_concurrent=4, max_queue=10, per_user_limit=1)
+        running = {1: 0, 2: 0}
+        peak = {1: 0, 2: 0}
+        overlap = False
+
+        def job(user_id):
+            async def run():
+                nonlocal overlap
+                running[user_id] += 1
+                peak[user_id] = max(peak[user_id], running[user_id])
+                overlap = overlap or all(running.values())
+                await asyncio.sleep(0.01)
+                running[user_id] -= 1
+            return run
+
+        await asyncio.gather(
+            *(scheduler.run(1, job(1)) for _ in range(3)),
+            scheduler.run(2, job(2)),
+        )
+        return peak, overlap
+
+    peak, overlap = asyncio.run(scenario())
+
+    assert peak == {1: 1, 2: 1}
+    assert overlap  # another user is not held back by user 1's batch
+
+
+def test_full_queue_raises_busy_without_waiting():
+    async def scenario():
+        scheduler = GenerationScheduler(max_concurrent=1, max_queue=2)
+        gate = asyncio.Event()
+        tasks = [
+            asyncio.create_task(scheduler.run(user_id, gate.wait)) for user_id in (1, 2, 3)
+        ]
+        await _settle()
+        assert (scheduler.running, scheduler.queued) == (1, 2)
+
+        with pytest.raises(SchedulerBusyError):
+            await asyncio.wait_for(scheduler.run(4, gate.wait), 1)
+
+        gate.set()
+        await asyncio.gather(*tasks)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+
+    assert (scheduler.running, scheduler.queued) == (0, 0)
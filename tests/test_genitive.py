@@ -0,0 +1,28 @@
+import pytest
+
+from app.services import genitive
+from app.services.genitive import inflect_phrase
+
+
+@pytest.mark.parametrize(
+    "phrase, expected",
+    [
+        ("салон красоты", "салона красоты"),
+        ("детская стоматология", "детской стоматологии"),
+        ("рынок", "рынка"),
+        ("конь", "коня"),
+        ("ателье", "ателье"),
+    ],
+)
+def test_inflect_phrase_with_dictionary(phrase, expected):
+    assert genitive._morph is not None
+    assert inflect_phrase(phrase) == expected
+
+
+def test_suffix_rules_without_dictionary(monkeypatch):
+    monkeypatch.setattr(genitive, "_morph", None)
+
+    assert inflect_phrase("строительная компания") == "строительной компании"
+    # Fleeting vowels and -ь nouns are left to the LLM rather than guessed
+    assert inflect_phrase("рынок") is None
+    assert inflect_phrase("конь") is None
@@ -0,0 +1,93 @@
+"""OpenAIService calls through LLMClient against scripts/fake_llm_server.py."""
+
+import asyncio
+import importlib.util
+import json
+import random
+from pathlib import Path
+
+import pytest
+from aiohttp import web
+
+from app.services.llm_client import LLMClient, LLMUnavailableError
+from app.services.llm_usage import LLMUsage
+from app.services.openai_service import OpenAIService
+
+_SERVER_PATH = Path(__file__).resolve().parent.parent / "scripts" / "fake_llm_server.py"
+_spec = importlib.util.spec_from_file_location("fake_llm_server", _SERVER_PATH)
+fake_llm_server = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(fake_llm_server)
+
+
+async def _with_fake_server(argv: list[str], scenario, **llm_options):
+    args = fake_llm_server.build_parser().parse_args(
+        ["--latency", "0", "--token-delay", "0", *argv]
+    )
+    runner = web.AppRunner(fake_llm_server.create_app(args))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    llm_options.setdefault("max_retries", 1)
+    llm = LLMClient(api_key="offline", base_url=f"http://127.0.0.1:{port}/v1", **llm_options)
+    try:
+        return await scenario(OpenAIService(llm, model="fake"))
+    finally:
+        await llm.client.close()
+        await runner.cleanup()
+
+
+def test_openai_service_against_fake_server():
+    async def scenario(service):
+        queries = await service.generate_target_queries("стоматология", count=5)
+        requisites = await service.extract_requisites("ИНН 7707083893", ["inn", "bik"])
+        reply = "".join([d async for d in service.chat(1, "Как составить акт?", stream=True)])
+        return queries, requisites, reply
+
+    queries, requisites, reply = asyncio.run(_with_fake_server([], scenario))
+
+    assert len(queries.splitlines()) == 5
+    assert requisites == {"inn": "7707083893", "bik": "044525225"}
+    assert "Как составить акт?" in reply
+
+
+def test_rate_limited_calls_become_unavailable(tmp_path):
+    script = tmp_path / "rules.json"
+    script.write_text(json.dumps([{"match": ".", "status": 429, "retry_after": 0}]))
+
+    async def scenario(service):
+        with pytest.raises(LLMUnavailableError):
+            await service.convert_business_type_genitive("автосервис")
+        return service.llm.stats()["methods"]["genitive"]
+
+    stats = asyncio.run(_with_fake_server(["--script", str(script)], scenario))
+
+    assert stats["retries"] == 1
+
+
+def test_hedging_is_capped_and_losers_are_cancelled(tmp_path):
+    random.seed(7)  # the in-process server draws latencies from this generator
+    usage = LLMUsage(str(tmp_path / "usage.db"))
+    calls = 150
+
+    async def scenario(service):
+        results = []
+        for _ in range(calls):
+            results.append(await service.extract_requisites("ИНН 7707083893", ["inn"]))
+        return results, service.llm.stats()["methods"]["requisites"]
+
+    results, stats = asyncio.run(_with_fake_server(
+        ["--latency", "0.01", "--jitter", "0", "--slow-rate", "0.05", "--slow-latency", "0.2"],
+        scenario,
+        hedged_methods=["requisites"],
+        hedge_max_rate=0.1,
+        usage=usage,
+    ))
+    outcomes = {key[3]: agg.calls for key, agg in usage._pending.items()}
+
+    assert all(r == {"inn": "7707083893"} for r in results)
+    assert 0 < stats["hedges"] <= 0.1 * calls
+    assert stats["hedge_wins"] > 0  # a hedge beat a slow primary
+    # Every hedge leaves exactly one loser, which is cancelled, not used
+    assert outcomes["cancelled"] == stats["hedges"]
+    assert outcomes["ok"] == calls
@@ -0,0 +1,48 @@
+import asyncio
+from pathlib import Path
+
+from app.services.requisite_parser import (
+    extract_text,
+    missing_requisites,
+    parse_requisites,
+    resolve_requisites,
+)
+
+SAMPLE_CARD = (
+    Path(__file__).resolve().parent.parent
+    / "templates" / "example for develop" / "Карточка предприятия.docx"
+)
+
+
+class _NoLLM:
+    async def extract_requisites(self, document_text, fields=None):
+        raise AssertionError(f"LLM asked for {fields}")
+
+
+def test_sample_card_resolves_without_llm():
+    text = extract_text(SAMPLE_CARD.read_bytes(), False)
+    requisites, complete = asyncio.run(resolve_requisites(text, _NoLLM()))
+
+    assert complete
+    assert missing_requisites(text, requisites) == []
+    assert requisites["inn"] == "4029065128"
+    assert requisites["bank_name"] == "АО « Альфа-Банк»"
+
+
+def test_inn_requires_label():
+    # 7707083893 passes the ИНН checksum but is printed as a phone number
+    assert "inn" not in parse_requisites("Телефон: 7707083893")
+    assert parse_requisites("ИНН\n7707083893")["inn"] == "7707083893"
+
+
+class _FailingLLM:
+    async def extract_requisites(self, document_text, fields=None):
+        raise RuntimeError("LLM is down")
+
+
+def test_failed_llm_step_is_not_complete():
+    text = "ИНН 7707083893\nНаименование банка: ПАО Сбербанк\nДиректор: Иванов Иван Иванович\nОГРН"
+    requisites, complete = asyncio.run(resolve_requisites(text, _FailingLLM()))
+
+    assert requisites["inn"] == "7707083893"
+    assert not complete
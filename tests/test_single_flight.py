@@ -0,0 +1,51 @@
+import asyncio
+
+from app.services.single_flight import SingleFlight
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def scenario():
+        flight = SingleFlight()
+        started = 0
+        release = asyncio.Event()
+
+        async def call():
+            nonlocal started
+            started += 1
+            await release.wait()
+            return "ответ"
+
+        waiters = [asyncio.create_task(flight.do("genitive", "key", call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        waiters[0].cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return started, results, flight.stats()
+
+    started, results, stats = asyncio.run(scenario())
+
+    assert started == 1
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert results[1:] == ["ответ", "ответ"]
+    assert stats == {"genitive": {"calls": 1, "duplicates": 2}}
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("bad JSON")
+
+        return await asyncio.gather(
+            *(flight.do("requisites", "key", call) for _ in range(3)),
+            return_exceptions=True,
+        ), flight
+
+    results, flight = asyncio.run(scenario())
+
+    assert [type(r) for r in results] == [ValueError] * 3
+    # The failed call is not kept: the next caller sends a new request
+    assert flight._inflight == {}